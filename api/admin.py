@@ -0,0 +1,108 @@
+"""
+Admin-only diagnostics API
+
+All endpoints require the ADMIN_TOKEN, sent as 'Authorization: Bearer <token>'
+or 'X-Admin-Token: <token>'. The API is disabled while ADMIN_TOKEN is empty.
+"""
+
+import os
+import hmac
+import logging
+from functools import wraps
+from flask import request, jsonify, Response
+from api import api_bp
+from config import Config
+from utils.profiler import profiler, slow_requests, render_collapsed
+
+logger = logging.getLogger(__name__)
+
+def admin_required(view):
+    """Reject requests that do not carry the admin token"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not Config.ADMIN_TOKEN:
+            return jsonify({"error": "Admin API is disabled"}), 403
+
+        token = request.headers.get("X-Admin-Token", "")
+        authorization = request.headers.get("Authorization", "")
+        if authorization.startswith("Bearer "):
+            token = authorization[len("Bearer "):]
+
+        if not hmac.compare_digest(token.encode(), Config.ADMIN_TOKEN.encode()):
+            return jsonify({"error": "Invalid admin token"}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+def _collapsed_download(text, name):
+    return Response(
+        text,
+        mimetype="text/plain",
+        headers={"Content-Disposition": f"attachment; filename={name}-{os.getpid()}.collapsed"}
+    )
+
+@api_bp.route('/admin/profiler', methods=['GET'])
+@admin_required
+def profiler_status():
+    """Status of the sampling profiler in this worker"""
+    return jsonify(profiler.status())
+
+@api_bp.route('/admin/profiler/start', methods=['POST'])
+@admin_required
+def start_profiler():
+    """
+    Start sampling all threads of this worker
+
+    Optional JSON payload:
+    {
+        "duration": 30,      # seconds, stops by itself afterwards
+        "interval": 0.01     # seconds between samples
+    }
+    """
+    data = request.get_json(silent=True) or {}
+
+    try:
+        duration = float(data.get('duration', 30))
+        interval = float(data['interval']) if data.get('interval') is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "duration and interval must be numbers"}), 400
+
+    if duration <= 0:
+        return jsonify({"error": "duration must be positive"}), 400
+
+    if not profiler.start(duration=duration, interval=interval):
+        return jsonify({"error": "Profiler is already running", "status": profiler.status()}), 409
+
+    return jsonify(profiler.status()), 202
+
+@api_bp.route('/admin/profiler/stop', methods=['POST'])
+@admin_required
+def stop_profiler():
+    """Stop sampling; the profile stays available for download"""
+    profiler.stop()
+    return jsonify(profiler.status())
+
+@api_bp.route('/admin/profiler/flamegraph', methods=['GET'])
+@admin_required
+def download_profile():
+    """Download the current profile as collapsed stacks (flamegraph.pl / speedscope)"""
+    return _collapsed_download(profiler.collapsed(), "profile")
+
+@api_bp.route('/admin/slow-requests', methods=['GET'])
+@admin_required
+def list_slow_requests():
+    """Recent requests slower than SLOW_REQUEST_THRESHOLD in this worker"""
+    return jsonify({
+        "threshold_seconds": slow_requests.threshold,
+        "pid": os.getpid(),
+        "requests": slow_requests.list_records()
+    })
+
+@api_bp.route('/admin/slow-requests/<int:record_id>/flamegraph', methods=['GET'])
+@admin_required
+def download_slow_request_profile(record_id):
+    """Download the stack samples of one slow request as collapsed stacks"""
+    record = slow_requests.get_record(record_id)
+    if record is None:
+        return jsonify({"error": "Slow request not found"}), 404
+
+    return _collapsed_download(render_collapsed(record["stacks"]), f"slow-request-{record_id}")
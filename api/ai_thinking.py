@@ -2,10 +2,11 @@ import logging
 import time
 import json
 import os
-from flask import request, jsonify
+from flask import request, jsonify, Response, stream_with_context
 from api import api_bp
-from brain.cloudflare_ai import get_ai_thinking, get_code_completion, check_code_errors, detect_language
+from brain.cloudflare_ai import get_ai_thinking, stream_ai_thinking, get_code_completion, check_code_errors, detect_language
 from brain.web_access import get_webpage_content, search_programming_solutions
+from utils.deadline import exceeded_stages
 
 logger = logging.getLogger(__name__)
 
@@ -18,8 +19,13 @@ def ai_thinking():
     {
         "prompt": "Напиши код функции, которая находит наибольший общий делитель двух чисел",
         "language": "python",
-        "max_thoughts": 5   // необязательно, по умолчанию 3
+        "max_thoughts": 5,  // необязательно, по умолчанию 3
+        "stream": true      // необязательно: ответ потоком NDJSON
     }
+    
+    В потоковом режиме каждая строка - событие: "thought" для каждой мысли,
+    как только модель ее закончила, "comment", "answer" с фрагментом ответа
+    и в конце "done" с полным результатом.
     """
     data = request.get_json()
     
@@ -37,6 +43,13 @@ def ai_thinking():
     if not os.environ.get("OPENAI_API_KEY"):
         logger.warning("OpenAI API ключ не найден. Для работы в реальном режиме необходим действительный ключ.")
     
+    if data.get('stream'):
+        def events():
+            for event in stream_ai_thinking(prompt, language, max_thoughts):
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        
+        return Response(stream_with_context(events()), mimetype="application/x-ndjson")
+    
     # Используем модуль реального мышления ИИ вместо заготовленных шаблонов
     response = get_ai_thinking(prompt, language, max_thoughts)
     
@@ -64,10 +77,10 @@ def web_search():
     if not query:
         return jsonify({"error": "Поисковый запрос не предоставлен"}), 400
     
-    # Выполняем поиск решений
+    # Выполняем поиск решений (при нехватке времени - только найденные до дедлайна)
     results = search_programming_solutions(query, language)
     
-    return jsonify({"results": results}), 200
+    return jsonify({"results": results, "partial": bool(exceeded_stages())}), 200
 
 @api_bp.route('/web-content', methods=['POST'])
 def web_content():
@@ -4,15 +4,32 @@ This module provides a clean interface for interacting with Cloudflare AI servic
 """
 
 import os
-import requests
 import json
 import logging
 import base64
 import time
-from typing import Dict, List, Any, Optional, Union
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Union, Iterator
+from config import Config
+from utils.metrics import record_upstream_call, upstream_requests, circuit_state, moderation_batch_duration
+from utils.circuit_breaker import breakers
+from utils.model_router import model_router
+from utils.upstream import post_with_retries, check_cancelled, UpstreamBusyError, UpstreamCancelledError
+from utils.deadline import DeadlineExceeded, allows, ensure, mark_exceeded
+from utils.tracing import span
+from utils.json_stream import extract_json
+from utils.image_cache import image_cache
+from utils.image_upload import BufferReader, classification_cache, decode_base64_image, image_digest
+from utils.moderation_cache import verdict_cache, text_digest
+from utils.embedding_store import embedding_stores, text_digest as embedding_digest
 
 logger = logging.getLogger(__name__)
 
+# API root, overridable to point at a local stand-in (e.g. benchmarks/mock_workers_ai.py)
+CLOUDFLARE_API_BASE_URL = os.environ.get("CLOUDFLARE_API_BASE_URL", "https://api.cloudflare.com/client/v4").rstrip("/")
+
 # Available models from Cloudflare
 CLOUDFLARE_MODELS = {
     # Text models
@@ -28,6 +45,21 @@ CLOUDFLARE_MODELS = {
     "embeddings": "@cf/baai/bge-base-en-v1.5",
 }
 
+circuit_state.set_function(breakers.states)
+
+# Shared pool for checking new texts: at most MODERATION_MAX_PARALLEL moderation calls at a time
+_moderation_executor = None
+_moderation_executor_lock = threading.Lock()
+
+def _get_moderation_executor():
+    global _moderation_executor
+    if _moderation_executor is None:
+        with _moderation_executor_lock:
+            if _moderation_executor is None:
+                _moderation_executor = ThreadPoolExecutor(
+                    max_workers=Config.MODERATION_MAX_PARALLEL, thread_name_prefix="moderation")
+    return _moderation_executor
+
 class CloudflareGateway:
     """Gateway for Cloudflare AI services"""
     
@@ -35,7 +67,7 @@ class CloudflareGateway:
         """Initialize with environment variables"""
         self.token = os.environ.get("CLOUDFLARE_AI_TOKEN", "")
         self.account_id = os.environ.get("CLOUDFLARE_ACCOUNT_ID", "")
-        self.base_url = "https://api.cloudflare.com/client/v4/accounts/{account_id}/ai/run/"
+        self.base_url = CLOUDFLARE_API_BASE_URL + "/accounts/{account_id}/ai/run/"
         
         if not self.token or not self.account_id:
             logger.warning("Cloudflare credentials missing. Set CLOUDFLARE_AI_TOKEN and CLOUDFLARE_ACCOUNT_ID.")
@@ -44,20 +76,31 @@ class CloudflareGateway:
         """Check if credentials are available"""
         return bool(self.token and self.account_id)
     
-    def call_model(self, model_key: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    def call_model(self, model_key: str, data: Optional[Dict[str, Any]] = None,
+                   content: Optional[Union[bytes, bytearray, memoryview]] = None) -> Dict[str, Any]:
         """
         Call a Cloudflare AI model
         
         Args:
             model_key: Key from CLOUDFLARE_MODELS or direct model path
             data: Request data specific to the model
+            content: Raw binary input (e.g. an image) sent as the body instead of JSON data
             
         Returns:
-            Response dictionary with success status and result/error
+            Response dictionary with success status and result/error; models that
+            answer with an image return its bytes as "content" instead of "result"
         """
         if not self.has_credentials():
             return {"success": False, "error": "Cloudflare credentials not configured"}
         
+        # While the circuit is open, fail fast instead of waiting for a timeout so the caller can fall back
+        breaker = breakers.get(model_key)
+        if not breaker.allow_request():
+            upstream_requests.inc(model=model_key, status="circuit_open")
+            return {"success": False, "error": f"Circuit open for {model_key}", "circuit_open": True, "retryable": True}
+        
+        healthy = False
+        start_time = time.time()
         try:
             # Get the model path
             model_path = CLOUDFLARE_MODELS.get(model_key, model_key)
@@ -68,47 +111,224 @@ class CloudflareGateway:
             # Prepare headers
             headers = {
                 "Authorization": f"Bearer {self.token}",
-                "Content-Type": "application/json"
+                "Content-Type": "application/json" if content is None else "application/octet-stream"
             }
+            # Binary input is sent as slices of the original buffer, without copying
+            body = {"json": data} if content is None else {"data": BufferReader(content)}
             
             # Make the request
-            start_time = time.time()
-            response = requests.post(url, headers=headers, json=data, timeout=60)
+            with span("cloudflare.call_model", model=model_key) as call_span:
+                if call_span.trace_id:
+                    headers["traceparent"] = f"00-{call_span.trace_id}-{call_span.span_id}-01"
+                response, duration = post_with_retries(
+                    model_key, url, headers=headers, timeout=60, **body
+                )
+                call_span.set_attribute("http.status_code", response.status_code)
             
             # Log request duration for performance monitoring
-            duration = time.time() - start_time
             logger.debug(f"Cloudflare AI request to {model_key} took {duration:.2f}s")
             
             # Handle response
             if response.status_code != 200:
                 logger.error(f"Cloudflare API error: {response.status_code} - {response.text}")
+                # Request errors (4xx other than 429) say nothing about the model's health
+                retryable = response.status_code == 429 or response.status_code >= 500
+                healthy = not retryable
                 return {
                     "success": False, 
                     "error": f"API error: HTTP {response.status_code}",
-                    "details": response.text
+                    "details": response.text,
+                    "retryable": retryable
                 }
             
-            return {"success": True, "result": response.json()}
+            healthy = True
+            content_type = response.headers.get("Content-Type", "")
+            if content_type.startswith("image/"):
+                # Image models respond with the file itself, not JSON
+                record_upstream_call(model_key, response.status_code, duration)
+                return {"success": True, "content": response.content, "content_type": content_type, "duration": duration}
             
+            result = response.json()
+            usage = result.get("result", {}).get("usage") if isinstance(result.get("result"), dict) else None
+            record_upstream_call(model_key, response.status_code, duration, usage)
+            
+            return {"success": True, "result": result, "duration": duration}
+            
+        except UpstreamBusyError as e:
+            # The rate limit is shared by all models: falling back won't help, and the model is not at fault
+            healthy = True
+            logger.error(f"Cloudflare AI request to {model_key} not sent: {str(e)}")
+            return {"success": False, "error": str(e), "retryable": False}
+        except UpstreamCancelledError as e:
+            healthy = True
+            logger.debug(f"Cloudflare AI request to {model_key} cancelled")
+            return {"success": False, "error": str(e), "cancelled": True, "retryable": False}
+        except DeadlineExceeded as e:
+            # The caller ran out of time - the model is not at fault
+            healthy = True
+            logger.info(f"Cloudflare AI request to {model_key} stopped: {str(e)}")
+            return {"success": False, "error": str(e), "deadline_exceeded": True, "retryable": False}
         except Exception as e:
             logger.error(f"Error calling Cloudflare AI: {str(e)}")
-            return {"success": False, "error": str(e)}
+            return {"success": False, "error": str(e), "retryable": not healthy}
+        finally:
+            breaker.record(healthy, time.time() - start_time)
+    
+    def stream_model(self, model_key: str, data: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """
+        Call a text model with stream=True
+        
+        Args:
+            model_key: Key from CLOUDFLARE_MODELS or direct model path
+            data: Request data (messages, max_tokens)
+            
+        Yields:
+            {"delta": text} for each fragment, then {"done": True, "duration", "first_token"}
+            or {"error", "retryable", "started"}
+        """
+        if not self.has_credentials():
+            yield {"error": "Cloudflare credentials not configured", "retryable": False, "started": False}
+            return
+        
+        breaker = breakers.get(model_key)
+        if not breaker.allow_request():
+            upstream_requests.inc(model=model_key, status="circuit_open")
+            yield {"error": f"Circuit open for {model_key}", "circuit_open": True, "retryable": True, "started": False}
+            return
+        
+        healthy = False
+        started = False
+        response = None
+        start_time = time.time()
+        try:
+            url = self.base_url.format(account_id=self.account_id) + CLOUDFLARE_MODELS.get(model_key, model_key)
+            headers = {
+                "Authorization": f"Bearer {self.token}",
+                "Content-Type": "application/json"
+            }
+            
+            # The span covers only the request: a yield inside a span would mix up the caller's context
+            with span("cloudflare.stream_model", model=model_key) as call_span:
+                if call_span.trace_id:
+                    headers["traceparent"] = f"00-{call_span.trace_id}-{call_span.span_id}-01"
+                response, _ = post_with_retries(
+                    model_key, url, headers=headers, json=dict(data, stream=True), timeout=60, stream=True
+                )
+                call_span.set_attribute("http.status_code", response.status_code)
+            
+            if response.status_code != 200:
+                logger.error(f"Cloudflare API error: {response.status_code} - {response.text}")
+                retryable = response.status_code == 429 or response.status_code >= 500
+                healthy = not retryable
+                yield {"error": f"API error: HTTP {response.status_code}", "retryable": retryable, "started": False}
+                return
+            
+            usage = None
+            first_token = None
+            # chunk_size=None yields data as it arrives instead of buffering 512 bytes
+            for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                # Cancellation or an expired deadline closes the connection, which stops the generation
+                check_cancelled()
+                ensure("upstream_stream")
+                if not line or not line.startswith("data:"):
+                    continue
+                payload = line[5:].strip()
+                if payload == "[DONE]":
+                    break
+                try:
+                    event = json.loads(payload)
+                except ValueError:
+                    continue
+                usage = event.get("usage") or usage
+                fragment = event.get("response")
+                if fragment:
+                    if first_token is None:
+                        first_token = time.time() - start_time
+                    started = True
+                    yield {"delta": fragment}
+            
+            healthy = True
+            duration = time.time() - start_time
+            record_upstream_call(model_key, 200, duration, usage)
+            logger.debug(f"Cloudflare AI stream from {model_key} took {duration:.2f}s "
+                         f"(first token after {first_token or 0:.2f}s)")
+            yield {"done": True, "duration": duration, "first_token": first_token}
+        
+        except GeneratorExit:
+            # The client aborted the stream - the model is not at fault
+            healthy = True
+            raise
+        except UpstreamBusyError as e:
+            healthy = True
+            logger.error(f"Cloudflare AI stream from {model_key} not started: {str(e)}")
+            yield {"error": str(e), "retryable": False, "started": False}
+        except UpstreamCancelledError as e:
+            healthy = True
+            logger.debug(f"Cloudflare AI stream from {model_key} cancelled")
+            yield {"error": str(e), "cancelled": True, "retryable": False, "started": started}
+        except DeadlineExceeded as e:
+            healthy = True
+            logger.info(f"Cloudflare AI stream from {model_key} stopped: {str(e)}")
+            yield {"error": str(e), "deadline_exceeded": True, "retryable": False, "started": started}
+        except Exception as e:
+            logger.error(f"Error streaming from Cloudflare AI: {str(e)}")
+            yield {"error": str(e), "retryable": not started, "started": started}
+        finally:
+            if response is not None:
+                response.close()
+            breaker.record(healthy, time.time() - start_time)
+    
+    def failover_chain(self, model_key: str) -> List[str]:
+        """
+        Models to try for a request, starting with the requested one
+        
+        Args:
+            model_key: Requested model key
+            
+        Returns:
+            The requested model followed by the rest of FAILOVER_CHAIN after it
+        """
+        chain = Config.FAILOVER_CHAIN
+        if model_key in chain:
+            return chain[chain.index(model_key):]
+        return [model_key]
+    
+    def _fits_deadline(self, model_key: str, task: str, input_chars: int) -> bool:
+        """Whether the model's predicted latency fits in the time left for the request"""
+        predicted_ms = model_router.predict_ms(model_key, task, input_chars)
+        if predicted_ms is None or allows(predicted_ms / 1000):
+            return True
+        mark_exceeded("model_call")
+        logger.info(f"Skipping {model_key} for {task}: predicted {predicted_ms:.0f}ms exceeds the request deadline")
+        return False
     
     def chat_completion(self, 
                         prompt: str, 
                         system_message: Optional[str] = None,
-                        model: str = "llama3-8b") -> Dict[str, Any]:
+                        model: Optional[str] = None,
+                        task: str = "chat",
+                        max_tokens: Optional[int] = None) -> Dict[str, Any]:
         """
         Get a completion from an AI chat model
         
         Args:
             prompt: User's prompt
             system_message: Optional system instructions
-            model: Model to use (default: llama3-8b)
+            model: Model to use (default: chosen by the routing policy for the task)
+            task: Routing policy task (completion, error_check, detection, thinking, extraction, analysis, chat)
+            max_tokens: Caller's output limit, capped by the task's budget (optional)
             
         Returns:
-            Dictionary with generated text or error
+            Dictionary with generated text and the model used, or error
         """
+        input_chars = len(prompt) + len(system_message or "")
+        if model:
+            models = self.failover_chain(model)
+            budget = model_router.budget(task, input_chars, max_tokens)
+        else:
+            decision = model_router.route(task, input_chars, max_tokens)
+            models, budget = decision.models, decision.max_tokens
+        
         # Build messages array
         messages = []
         if system_message:
@@ -118,95 +338,340 @@ class CloudflareGateway:
         # Prepare request data
         data = {
             "messages": messages,
-            "stream": False
+            "stream": False,
+            "max_tokens": budget
         }
         
-        # Call the model
-        response = self.call_model(model, data)
+        # Call the model, failing over along the chain while upstream is unhealthy
+        response = {"success": False, "error": "No model available", "retryable": False}
+        for candidate in models:
+            if not self._fits_deadline(candidate, task, input_chars):
+                # The next model in the chain may be faster
+                response = {"success": False, "error": f"{candidate} cannot answer within the request deadline",
+                            "deadline_exceeded": True, "retryable": True}
+                continue
+            response = self.call_model(candidate, data)
+            
+            if response.get("success"):
+                try:
+                    # Extract just the text response
+                    result = response["result"]["result"]["response"]
+                    if candidate != models[0]:
+                        logger.info(f"Chat completion served by {candidate} instead of {models[0]}")
+                    
+                    # Update the model's latency estimate used for routing
+                    model_router.observe(candidate, task, input_chars, response["duration"])
+                    
+                    return {"success": True, "text": result, "model": candidate}
+                except (KeyError, TypeError):
+                    return {
+                        "success": False,
+                        "error": "Unexpected response format",
+                        "raw": response.get("result")
+                    }
+            
+            if not response.get("retryable"):
+                break
         
-        if response.get("success"):
+        return response
+    
+    def stream_chat_completion(self,
+                               prompt: str,
+                               system_message: Optional[str] = None,
+                               task: str = "chat",
+                               max_tokens: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Stream a completion from an AI chat model
+        
+        Fails over to the next routed model only while nothing has been
+        streamed yet.
+        
+        Args:
+            prompt: User's prompt
+            system_message: Optional system instructions
+            task: Routing policy task
+            max_tokens: Caller's output limit, capped by the task's budget (optional)
+            
+        Yields:
+            {"delta", "model"} for each fragment, then {"done": True, "model", "duration", "first_token"}
+            or {"error", ...}
+        """
+        input_chars = len(prompt) + len(system_message or "")
+        decision = model_router.route(task, input_chars, max_tokens)
+        
+        messages = []
+        if system_message:
+            messages.append({"role": "system", "content": system_message})
+        messages.append({"role": "user", "content": prompt})
+        data = {"messages": messages, "max_tokens": decision.max_tokens}
+        
+        error = {"error": "No model available", "retryable": False}
+        for candidate in decision.models:
+            if not self._fits_deadline(candidate, task, input_chars):
+                error = {"error": f"{candidate} cannot answer within the request deadline",
+                         "deadline_exceeded": True, "retryable": True}
+                continue
+            events = self.stream_model(candidate, data)
             try:
-                # Extract just the text response
-                result = response["result"]["result"]["response"]
-                return {"success": True, "text": result}
-            except (KeyError, TypeError):
-                return {
-                    "success": False,
-                    "error": "Unexpected response format",
-                    "raw": response.get("result")
-                }
+                for event in events:
+                    if "error" in event:
+                        error = event
+                        break
+                    if event.get("done"):
+                        model_router.observe(candidate, task, input_chars, event["duration"])
+                        yield dict(event, model=candidate)
+                        return
+                    yield dict(event, model=candidate)
+            finally:
+                # The caller may close the stream early - close the upstream connection right away
+                events.close()
+            
+            if error.get("started") or not error.get("retryable"):
+                break
         
-        return response
+        yield error
     
-    def generate_image(self, prompt: str) -> Dict[str, Any]:
+    def generate_image_file(self, prompt: str) -> Dict[str, Any]:
         """
-        Generate an image from text prompt
+        Generate an image from text prompt, reusing the cached file for a repeated prompt
         
         Args:
             prompt: Text description of the image
             
         Returns:
-            Dictionary with base64 image data or error
+            Dictionary with the PNG file path and cache key, or error
         """
-        data = {"prompt": prompt}
+        key = image_cache.key_for("stable-diffusion", prompt)
+        path = image_cache.get(key)
+        if path:
+            return {"success": True, "path": path, "key": key, "cached": True}
         
-        response = self.call_model("stable-diffusion", data)
+        response = self.call_model("stable-diffusion", {"prompt": prompt})
         
-        if response.get("success"):
+        if not response.get("success"):
+            return response
+        
+        if "content" in response:
+            image = response["content"]
+        else:
             try:
                 # Extract base64 image data
-                image_data = response["result"]["result"]["images"][0]
-                return {"success": True, "image_data": image_data}
-            except (KeyError, IndexError):
+                image = base64.b64decode(response["result"]["result"]["images"][0])
+            except (KeyError, IndexError, TypeError, ValueError):
                 return {
                     "success": False,
                     "error": "Could not extract image from response",
                     "raw": response.get("result")
                 }
         
-        return response
+        return {"success": True, "path": image_cache.store(key, image), "key": key, "cached": False}
     
-    def moderate_content(self, text: str) -> Dict[str, Any]:
+    def generate_image(self, prompt: str) -> Dict[str, Any]:
+        """
+        Generate an image from text prompt
+        
+        Args:
+            prompt: Text description of the image
+            
+        Returns:
+            Dictionary with base64 image data or error
+        """
+        for _ in range(2):
+            response = self.generate_image_file(prompt)
+            
+            if not response.get("success"):
+                return response
+            
+            try:
+                with open(response["path"], "rb") as f:
+                    image_data = base64.b64encode(f.read()).decode("ascii")
+            except FileNotFoundError:
+                # Another worker evicted the file in between: generate it again
+                image_cache.forget(response["key"])
+                continue
+            return {"success": True, "image_data": image_data, "key": response["key"], "cached": response["cached"]}
+        
+        return {"success": False, "error": "Generated image was evicted before it could be read"}
+    
+    def moderate_content(self, text: Union[str, List[str]]) -> Dict[str, Any]:
         """
         Check if text contains harmful content
         
+        Texts are deduplicated by hash, and texts moderated before are answered
+        from the persistent verdict cache; only new texts go upstream, at most
+        MODERATION_MAX_PARALLEL at a time.
+        
         Args:
-            text: Text to moderate
+            text: Text to moderate, or a list of texts
             
         Returns:
-            Dictionary with moderation results
+            For one text, dictionary with moderation results; for a list,
+            {"success", "verdicts", "errors", "stats"} with one verdict per text
+            (None where moderation failed) and the batch's cache statistics
         """
-        data = {"text": text}
+        if isinstance(text, str):
+            batch = self.moderate_content([text])
+            verdict = batch["verdicts"][0]
+            if verdict is None:
+                return batch["errors"][0]["response"]
+            return {"success": True, "result": {"result": verdict}, "cached": batch["stats"]["upstream_calls"] == 0}
+        
+        start_time = time.time()
+        digests = [text_digest(item) for item in text]
+        unique = dict(zip(digests, text))
+        verdicts = verdict_cache.get_many(list(unique))
+        pending = [digest for digest in unique if digest not in verdicts]
+        
+        failures = {}
+        if pending:
+            executor = _get_moderation_executor()
+            futures = {
+                digest: executor.submit(contextvars.copy_context().run, self.call_model, "moderation", {"text": unique[digest]})
+                for digest in pending
+            }
+            fresh = {}
+            for digest, future in futures.items():
+                response = future.result()
+                verdict = response.get("result", {}).get("result") if response.get("success") else None
+                if isinstance(verdict, dict):
+                    fresh[digest] = verdict
+                else:
+                    failures[digest] = response if not response.get("success") else {
+                        "success": False, "error": "Unexpected response format", "raw": response.get("result")}
+            verdict_cache.put_many(fresh, "moderation")
+            verdicts.update(fresh)
+        
+        duration = time.time() - start_time
+        moderation_batch_duration.observe(duration)
+        stats = {
+            "texts": len(text),
+            "unique": len(unique),
+            "cache_hits": len(unique) - len(pending),
+            "upstream_calls": len(pending),
+            "failed": len(failures),
+            # Share of texts not sent to the model (duplicates within the batch and cache hits)
+            "hit_rate": round(1 - len(pending) / len(text), 3) if text else None,
+            "duration": round(duration, 3)
+        }
+        logger.debug(f"Moderated {stats['texts']} texts: {stats['cache_hits']} cached, "
+                     f"{stats['upstream_calls']} upstream, {stats['failed']} failed in {duration:.2f}s")
         
-        return self.call_model("moderation", data)
+        return {
+            "success": not failures,
+            "verdicts": [verdicts.get(digest) for digest in digests],
+            "errors": [
+                {"index": index, "error": failures[digest].get("error"), "response": failures[digest]}
+                for index, digest in enumerate(digests) if digest in failures
+            ],
+            "stats": stats
+        }
     
-    def classify_image(self, image_data: str) -> Dict[str, Any]:
+    def classify_image(self, image_data: Union[str, bytes, bytearray, memoryview]) -> Dict[str, Any]:
         """
         Classify an image
         
+        A repeated image is answered from the classification cache by its digest.
+        
         Args:
-            image_data: Base64 encoded image
+            image_data: Image bytes, or the image base64 encoded
             
         Returns:
-            Dictionary with classification results
+            Dictionary with classification results, the image digest and whether it was cached
         """
-        data = {"image": image_data}
+        if isinstance(image_data, str):
+            try:
+                image_data = decode_base64_image(image_data)
+            except ValueError as e:
+                return {"success": False, "error": f"Invalid image data: {str(e)}", "retryable": False}
         
-        return self.call_model("classify-image", data)
+        digest = image_digest(image_data)
+        cached = classification_cache.get(digest)
+        if cached is not None:
+            return {"success": True, "result": cached, "digest": digest, "cached": True}
+        
+        response = self.call_model("classify-image", content=image_data)
+        
+        if response.get("success"):
+            classification_cache.set(digest, response["result"])
+            return dict(response, digest=digest, cached=False)
+        return response
     
-    def get_embeddings(self, text: str) -> Dict[str, Any]:
+    def get_embeddings(self, text: Union[str, List[str]]) -> Dict[str, Any]:
         """
         Get vector embeddings for text
         
+        Texts are deduplicated by hash and looked up in the embedding store;
+        only texts never embedded before go upstream, EMBEDDING_BATCH_SIZE
+        per request, and their vectors are appended to the store.
+        
         Args:
-            text: Text to get embeddings for
+            text: Text to get embeddings for, or a list of texts
             
         Returns:
-            Dictionary with embedding vectors
+            For one text, dictionary with embedding vectors; for a list,
+            {"success", "vectors", "errors", "stats"} with one vector per text
+            (None where embedding failed) and the batch's cache statistics
         """
-        data = {"text": text}
+        if isinstance(text, str):
+            batch = self.get_embeddings([text])
+            vector = batch["vectors"][0]
+            if vector is None:
+                return batch["errors"][0]["response"]
+            return {
+                "success": True,
+                "result": {"result": {"shape": [1, len(vector)], "data": [vector]}},
+                "cached": batch["stats"]["upstream_requests"] == 0
+            }
+        
+        start_time = time.time()
+        store = embedding_stores.get(CLOUDFLARE_MODELS["embeddings"])
+        digests = [embedding_digest(item) for item in text]
+        unique = dict(zip(digests, text))
+        vectors = store.get_many(list(unique))
+        pending = [digest for digest in unique if digest not in vectors]
         
-        return self.call_model("embeddings", data)
+        failures = {}
+        upstream_requests = 0
+        for offset in range(0, len(pending), Config.EMBEDDING_BATCH_SIZE):
+            chunk = pending[offset:offset + Config.EMBEDDING_BATCH_SIZE]
+            response = self.call_model("embeddings", {"text": [unique[digest] for digest in chunk]})
+            upstream_requests += 1
+            data = response.get("result", {}).get("result", {}).get("data") if response.get("success") else None
+            if not isinstance(data, list) or len(data) != len(chunk):
+                failure = response if not response.get("success") else {
+                    "success": False, "error": "Unexpected response format", "raw": response.get("result")}
+                failures.update((digest, failure) for digest in chunk)
+                continue
+            fresh = dict(zip(chunk, data))
+            try:
+                store.add_many(fresh)
+            except (OSError, ValueError) as e:
+                # The vectors are still returned, just not stored
+                logger.warning(f"Embeddings not stored: {str(e)}")
+            vectors.update(fresh)
+        
+        duration = time.time() - start_time
+        stats = {
+            "texts": len(text),
+            "unique": len(unique),
+            "cache_hits": len(unique) - len(pending),
+            "embedded": len(pending) - len(failures),
+            "upstream_requests": upstream_requests,
+            "failed": len(failures),
+            "duration": round(duration, 3)
+        }
+        logger.debug(f"Embedded {stats['texts']} texts: {stats['cache_hits']} stored, "
+                     f"{stats['embedded']} in {upstream_requests} requests, {stats['failed']} failed in {duration:.2f}s")
+        
+        return {
+            "success": not failures,
+            "vectors": [vectors.get(digest) for digest in digests],
+            "errors": [
+                {"index": index, "error": failures[digest].get("error"), "response": failures[digest]}
+                for index, digest in enumerate(digests) if digest in failures
+            ],
+            "stats": stats
+        }
     
     def analyze_code(self, 
                      code: str, 
@@ -242,7 +707,7 @@ class CloudflareGateway:
         
         system_prompt = prompts.get(task, prompts["review"])
         
-        return self.chat_completion(code, system_message=system_prompt)
+        return self.chat_completion(code, system_message=system_prompt, task="analysis")
     
     def learn_from_text(self, text: str, topic: Optional[str] = None) -> Dict[str, Any]:
         """
@@ -266,23 +731,14 @@ class CloudflareGateway:
             "'common_problems': [list of problems or pitfalls mentioned]"
         )
         
-        response = self.chat_completion(text, system_message=system_message)
+        response = self.chat_completion(text, system_message=system_message, task="extraction")
         
         if response.get("success"):
             # Try to parse JSON from the response
             try:
-                text = response.get("text", "")
-                
-                # Look for JSON in the response
-                if "```json" in text:
-                    json_text = text.split("```json")[1].split("```")[0].strip()
-                elif "```" in text:
-                    json_text = text.split("```")[1].split("```")[0].strip()
-                else:
-                    json_text = text
-                
-                # Parse the JSON
-                knowledge = json.loads(json_text)
+                # The JSON may be wrapped in markdown fences or prose
+                knowledge = extract_json(response.get("text", ""), expected_keys=(
+                    "key_concepts", "code_examples", "best_practices", "common_problems"))
                 return {"success": True, "knowledge": knowledge}
             except Exception as e:
                 logger.error(f"Error parsing knowledge extraction: {str(e)}")
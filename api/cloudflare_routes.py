@@ -2,8 +2,15 @@
 API routes for Cloudflare AI features
 """
 
-from flask import Blueprint, request, jsonify
+import re
+from flask import Blueprint, request, jsonify, send_file, url_for
 from api.cloudflare_gateway import cloudflare
+from config import Config
+from utils.image_cache import image_cache
+from utils.embedding_store import embedding_stores
+from utils.image_upload import read_upload, decode_base64_image, UploadTooLargeError
+from utils.circuit_breaker import breakers
+from utils.model_router import model_router
 import logging
 import json
 
@@ -12,6 +19,23 @@ logger = logging.getLogger(__name__)
 # Create Blueprint
 cloudflare_bp = Blueprint('cloudflare_api', __name__, url_prefix='/api/cloudflare')
 
+IMAGE_FORMATS = ("json", "png", "url")
+_IMAGE_KEY = re.compile(r"^[0-9a-f]{64}$")
+
+@cloudflare_bp.errorhandler(413)
+def request_too_large(error):
+    """JSON instead of Werkzeug's HTML page when a body exceeds max_content_length"""
+    return jsonify({
+        'success': False,
+        'error': f'Upload exceeds the {Config.IMAGE_UPLOAD_MAX_BYTES} byte limit'
+    }), 413
+
+def _send_image(path, cached):
+    """PNG response served from the cache file (sendfile where the server supports it, ETag for revalidation)"""
+    response = send_file(path, mimetype='image/png', conditional=True, etag=True, max_age=Config.IMAGE_CACHE_MAX_AGE)
+    response.headers['X-Image-Cache'] = 'hit' if cached else 'miss'
+    return response
+
 @cloudflare_bp.route('/text-generation', methods=['POST'])
 def text_generation():
     """API endpoint for text generation with Cloudflare AI"""
@@ -24,7 +48,8 @@ def text_generation():
         }), 400
     
     prompt = data.get('prompt')
-    model = data.get('model', 'llama3-8b')
+    # Without an explicit model the routing policy picks one
+    model = data.get('model')
     
     # Call Cloudflare AI
     result = cloudflare.chat_completion(prompt, model=model)
@@ -33,7 +58,7 @@ def text_generation():
         return jsonify({
             'success': True,
             'text': result.get('text', ''),
-            'model': model
+            'model': result.get('model', model)
         })
     else:
         return jsonify({
@@ -72,7 +97,18 @@ def code_analysis():
 
 @cloudflare_bp.route('/image-generation', methods=['POST'])
 def image_generation():
-    """API endpoint for image generation with Cloudflare AI"""
+    """
+    API endpoint for image generation with Cloudflare AI
+    
+    Expected JSON payload:
+    {
+        "prompt": "A cat reading a book",
+        "format": "url"     // json (base64 image_data, default), png (raw bytes) or url
+    }
+    
+    Images are cached on disk by prompt, so a repeated prompt is not
+    generated again.
+    """
     data = request.json
     
     if not data or 'prompt' not in data:
@@ -82,26 +118,175 @@ def image_generation():
         }), 400
     
     prompt = data.get('prompt')
+    image_format = data.get('format', 'json')
+    
+    if image_format not in IMAGE_FORMATS:
+        return jsonify({
+            'success': False,
+            'error': f"Unsupported format. Supported formats are: {', '.join(IMAGE_FORMATS)}"
+        }), 400
+    
+    if image_format == 'json':
+        # Call Cloudflare AI
+        result = cloudflare.generate_image(prompt)
+    else:
+        result = cloudflare.generate_image_file(prompt)
+    
+    if not result.get('success'):
+        return jsonify({
+            'success': False,
+            'error': result.get('error', 'Failed to generate image')
+        }), 500
+    
+    if image_format == 'png':
+        try:
+            return _send_image(result['path'], result['cached'])
+        except FileNotFoundError:
+            # Another worker evicted the cached file after the lookup: treat it as a miss
+            image_cache.forget(result['key'])
+            result = cloudflare.generate_image_file(prompt)
+            if not result.get('success'):
+                return jsonify({
+                    'success': False,
+                    'error': result.get('error', 'Failed to generate image')
+                }), 500
+            return _send_image(result['path'], result['cached'])
+    
+    if image_format == 'url':
+        return jsonify({
+            'success': True,
+            'url': url_for('cloudflare_api.cached_image', key=result['key']),
+            'cached': result['cached']
+        })
+    
+    return jsonify({
+        'success': True,
+        'image_data': result.get('image_data', '')
+    })
+
+@cloudflare_bp.route('/images/<key>.png', methods=['GET'])
+def cached_image(key):
+    """Serve a generated image from the cache"""
+    path = image_cache.get(key) if _IMAGE_KEY.match(key) else None
+    
+    if path:
+        try:
+            return _send_image(path, True)
+        except FileNotFoundError:
+            # Evicted by another worker between the lookup and the send
+            image_cache.forget(key)
+    
+    return jsonify({
+        'success': False,
+        'error': 'Image not found or evicted; generate it again'
+    }), 404
+
+@cloudflare_bp.route('/image-classification', methods=['POST'])
+def image_classification():
+    """
+    API endpoint for image classification with Cloudflare AI
+    
+    Accepts the image as a multipart/form-data field named "image", as the
+    raw request body (e.g. Content-Type: image/jpeg), or as JSON
+    {"image": "<base64>"}. Uploads larger than IMAGE_UPLOAD_MAX_BYTES are
+    rejected with 413.
+    """
+    # The limit is checked before parsing the body so oversized uploads are rejected early
+    request.max_content_length = Config.IMAGE_UPLOAD_MAX_BYTES + 64 * 1024
+    
+    try:
+        if request.mimetype == 'application/json':
+            data = request.get_json(silent=True)
+            if not isinstance(data, dict) or not data.get('image'):
+                return jsonify({
+                    'success': False,
+                    'error': 'Image is required'
+                }), 400
+            if not isinstance(data['image'], str):
+                return jsonify({
+                    'success': False,
+                    'error': 'Image must be a base64 string'
+                }), 400
+            image = decode_base64_image(data['image'])
+        elif request.mimetype == 'multipart/form-data':
+            upload = request.files.get('image')
+            if upload is None:
+                return jsonify({
+                    'success': False,
+                    'error': 'Image is required (multipart field "image")'
+                }), 400
+            image = read_upload(upload.stream, Config.IMAGE_UPLOAD_MAX_BYTES)
+        else:
+            image = read_upload(request.stream, Config.IMAGE_UPLOAD_MAX_BYTES, request.content_length)
+    except UploadTooLargeError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 413
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': f'Invalid image data: {str(e)}'
+        }), 400
+    
+    if not image:
+        return jsonify({
+            'success': False,
+            'error': 'Image is required'
+        }), 400
     
     # Call Cloudflare AI
-    result = cloudflare.generate_image(prompt)
+    result = cloudflare.classify_image(image)
     
     if result.get('success'):
         return jsonify({
             'success': True,
-            'image_data': result.get('image_data', '')
+            'labels': result.get('result', {}).get('result', []),
+            'digest': result.get('digest'),
+            'cached': result.get('cached', False)
         })
     else:
         return jsonify({
             'success': False,
-            'error': result.get('error', 'Failed to generate image')
+            'error': result.get('error', 'Failed to classify image')
         }), 500
 
 @cloudflare_bp.route('/moderate-content', methods=['POST'])
 def moderate_content():
-    """API endpoint for content moderation with Cloudflare AI"""
+    """
+    API endpoint for content moderation with Cloudflare AI
+    
+    Expected JSON payload: {"text": "..."} for one text, or
+    {"texts": ["...", "..."]} for a batch of up to MODERATION_MAX_BATCH texts.
+    Repeated texts are answered from the verdict cache.
+    """
     data = request.json
     
+    if data and isinstance(data.get('texts'), list):
+        texts = data['texts']
+        
+        if not texts or not all(isinstance(text, str) for text in texts):
+            return jsonify({
+                'success': False,
+                'error': 'Texts must be a non-empty list of strings'
+            }), 400
+        
+        if len(texts) > Config.MODERATION_MAX_BATCH:
+            return jsonify({
+                'success': False,
+                'error': f'At most {Config.MODERATION_MAX_BATCH} texts per request'
+            }), 400
+        
+        result = cloudflare.moderate_content(texts)
+        
+        # A partial failure does not discard the verdicts already obtained
+        return jsonify({
+            'success': result['success'],
+            'verdicts': result['verdicts'],
+            'errors': [{'index': error['index'], 'error': error['error']} for error in result['errors']],
+            'stats': result['stats']
+        }), 200 if any(verdict is not None for verdict in result['verdicts']) else 500
+    
     if not data or 'text' not in data:
         return jsonify({
             'success': False,
@@ -120,7 +305,8 @@ def moderate_content():
             
             return jsonify({
                 'success': True,
-                'categories': categories
+                'categories': categories,
+                'cached': result.get('cached', False)
             })
         except Exception as e:
             logger.error(f"Error processing moderation result: {str(e)}")
@@ -134,6 +320,40 @@ def moderate_content():
             'error': result.get('error', 'Failed to moderate content')
         }), 500
 
+@cloudflare_bp.route('/embeddings', methods=['POST'])
+def embeddings():
+    """
+    API endpoint for text embeddings with Cloudflare AI
+    
+    Expected JSON payload: {"texts": ["...", "..."]} with up to
+    EMBEDDING_MAX_BATCH texts. Texts embedded before are answered from the
+    embedding store; the rest are sent upstream EMBEDDING_BATCH_SIZE at a time.
+    """
+    data = request.json
+    texts = data.get('texts') if data else None
+    
+    if not isinstance(texts, list) or not texts or not all(isinstance(text, str) for text in texts):
+        return jsonify({
+            'success': False,
+            'error': 'Texts must be a non-empty list of strings'
+        }), 400
+    
+    if len(texts) > Config.EMBEDDING_MAX_BATCH:
+        return jsonify({
+            'success': False,
+            'error': f'At most {Config.EMBEDDING_MAX_BATCH} texts per request'
+        }), 400
+    
+    result = cloudflare.get_embeddings(texts)
+    
+    # A partial failure does not discard the vectors already obtained
+    return jsonify({
+        'success': result['success'],
+        'vectors': result['vectors'],
+        'errors': [{'index': error['index'], 'error': error['error']} for error in result['errors']],
+        'stats': result['stats']
+    }), 200 if any(vector is not None for vector in result['vectors']) else 500
+
 @cloudflare_bp.route('/extract-knowledge', methods=['POST'])
 def extract_knowledge():
     """API endpoint for knowledge extraction with Cloudflare AI"""
@@ -170,5 +390,9 @@ def status():
     return jsonify({
         'success': True,
         'status': 'connected' if has_credentials else 'disconnected',
-        'has_credentials': has_credentials
+        'has_credentials': has_credentials,
+        'circuits': breakers.snapshot(),
+        'routing': model_router.snapshot(),
+        'image_cache': image_cache.snapshot(),
+        'embedding_stores': embedding_stores.snapshot()
     })
\ No newline at end of file
@@ -1,12 +1,136 @@
+import json
 import logging
 import time
-from flask import request, jsonify
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from flask import request, jsonify, current_app, Response, stream_with_context
 from api import api_bp
 from config import Config
-from brain.cloudflare_ai import get_code_completion
+from brain.cloudflare_ai import get_code_completion, stream_code_completion, CLOUDFLARE_AI_TOKEN
+from utils.completion_index import completion_index, normalize_code
+from utils.model_router import model_router
+from utils.ngram_model import ngram_models
+from utils.deadline import remaining
 
 logger = logging.getLogger(__name__)
 
+# Upstream calls that may not fit into COMPLETION_UPSTREAM_BUDGET
+_completion_executor = None
+_completion_executor_lock = threading.Lock()
+
+def _get_completion_executor():
+    global _completion_executor
+    if _completion_executor is None:
+        with _completion_executor_lock:
+            if _completion_executor is None:
+                _completion_executor = ThreadPoolExecutor(
+                    max_workers=Config.UPSTREAM_CONCURRENCY_MAX, thread_name_prefix="completion")
+    return _completion_executor
+
+def _complete_with_fallback(code, language, max_tokens):
+    """
+    Complete code with the model, or with the local n-gram model when the
+    model is unavailable or slower than COMPLETION_UPSTREAM_BUDGET (or the
+    time left before the request deadline)
+    
+    Returns:
+        tuple: (completion, source)
+    """
+    ngram_models.build_in_background(current_app._get_current_object())
+    
+    if not CLOUDFLARE_AI_TOKEN or not model_router.available("completion"):
+        local = ngram_models.complete(code, language)
+        if local:
+            return local, "ngram"
+        return get_code_completion(code, language, max_tokens), "model"
+    
+    # The copied context carries the request deadline into the thread: the upstream call won't outlive it
+    future = _get_completion_executor().submit(
+        contextvars.copy_context().run, get_code_completion, code, language, max_tokens)
+    budget = Config.COMPLETION_UPSTREAM_BUDGET
+    left = remaining()
+    if left is not None:
+        budget = max(0.0, min(budget, left))
+    try:
+        return future.result(timeout=budget), "model"
+    except FuturesTimeout:
+        local = ngram_models.complete(code, language)
+        if local:
+            logger.info(f"Model completion exceeded {budget:.2f}s, serving n-gram suggestion")
+            return local, "ngram"
+        return future.result(), "model"
+
+def _speculative_events(code, language, max_tokens):
+    """
+    Serve a local completion at once, then stream the model's completion and
+    say whether it kept or revised the speculation
+    
+    Yields:
+        str: NDJSON lines - one 'speculation' event, 'upstream' deltas, one 'final' event
+    """
+    start_time = time.time()
+    
+    def elapsed_ms():
+        return round((time.time() - start_time) * 1000, 1)
+    
+    def line(event):
+        return json.dumps(event) + "\n"
+    
+    completion_index.refresh()
+    known = completion_index.lookup(code, language)
+    if known:
+        speculation, source = known["completion"], known["source"]
+    else:
+        ngram_models.build_in_background(current_app._get_current_object())
+        speculation = ngram_models.complete(code, language)
+        source = "ngram" if speculation else None
+    speculation_ms = elapsed_ms()
+    yield line({"phase": "speculation", "completion": speculation, "source": source, "elapsed_ms": speculation_ms})
+    
+    timing = {"speculation_ms": speculation_ms, "first_token_ms": None, "upstream_ms": None}
+    final = {"phase": "final", "completion": speculation, "speculation": "kept" if speculation else "none",
+             "source": source}
+    
+    if known:
+        # The model won't improve a verified snippet
+        pass
+    elif not CLOUDFLARE_AI_TOKEN or not model_router.available("completion"):
+        if not speculation:
+            final.update(completion=get_code_completion(code, language, max_tokens), source="model")
+    else:
+        upstream_start = time.time()
+        for event in stream_code_completion(code, language, max_tokens):
+            if "delta" in event:
+                if timing["first_token_ms"] is None:
+                    timing["first_token_ms"] = elapsed_ms()
+                yield line({"phase": "upstream", "delta": event["delta"]})
+            elif "error" in event:
+                final["error"] = event["error"]
+                if not speculation:
+                    final.update(completion=get_code_completion(code, language, max_tokens), source="model")
+            else:
+                timing["upstream_ms"] = round((time.time() - upstream_start) * 1000, 1)
+                completion = event["completion"]
+                if speculation and normalize_code(completion).startswith(normalize_code(speculation)):
+                    verdict = "kept"
+                else:
+                    verdict = "revised" if speculation else "none"
+                final.update(completion=completion, speculation=verdict, source="model", model=event.get("model"))
+    
+    total_ms = elapsed_ms()
+    # The user sees a suggestion as soon as the local guess is ready
+    # (unless the model rewrote it) or the first fragment of the model's answer
+    if final["speculation"] == "kept":
+        perceived_ms = speculation_ms
+    else:
+        perceived_ms = timing["first_token_ms"] or total_ms
+    timing.update(total_ms=total_ms, perceived_ms=perceived_ms)
+    final.update(timing=timing, processing_time=total_ms / 1000)
+    logger.info(f"Speculative completion for {language}: {final['speculation']} "
+                f"(speculation {speculation_ms}ms, total {total_ms}ms)")
+    yield line(final)
+
 @api_bp.route('/complete', methods=['POST'])
 def complete_code():
     """
@@ -16,8 +140,13 @@ def complete_code():
     {
         "code": "def fibonacci(n):",
         "language": "python",
-        "max_tokens": 100
+        "max_tokens": 100,
+        "speculative": false
     }
+    
+    With "speculative": true the response is an NDJSON stream: a local
+    completion first, then the model's completion as it is generated, then
+    a final event with the completion and whether the speculation was kept.
     """
     data = request.get_json()
     
@@ -38,13 +167,24 @@ def complete_code():
             "error": f"Unsupported language. Supported languages are: {', '.join(Config.SUPPORTED_LANGUAGES)}"
         }), 400
     
+    if data.get('speculative'):
+        return Response(stream_with_context(_speculative_events(code, language, max_tokens)),
+                        mimetype="application/x-ndjson")
+    
     try:
         logger.debug(f"Processing code completion request for language {language}")
         
         start_time = time.time()
         
-        # Используем Cloudflare AI для завершения кода
-        completion = get_code_completion(code, language, max_tokens)
+        # Known snippets are served from the index; the model is called only on a miss
+        completion_index.refresh()
+        known = completion_index.lookup(code, language)
+        if known:
+            completion = known["completion"]
+            source = known["source"]
+        else:
+            # Используем Cloudflare AI для завершения кода (с локальной n-gram подстраховкой)
+            completion, source = _complete_with_fallback(code, language, max_tokens)
         
         # Расчитываем время обработки
         processing_time = time.time() - start_time
@@ -55,6 +195,7 @@ def complete_code():
             "language": language,
             "input_code": code,
             "processing_time": processing_time,
+            "source": source,
             "demo_mode": False
         }
         
@@ -63,3 +204,13 @@ def complete_code():
     except Exception as e:
         logger.error(f"Error in code completion: {str(e)}")
         return jsonify({"error": f"Code completion failed: {str(e)}"}), 500
+
+@api_bp.route('/complete/index', methods=['GET'])
+def completion_index_stats():
+    """Snippet counts, memory footprint and hit rate of the instant completion index"""
+    return jsonify(completion_index.snapshot()), 200
+
+@api_bp.route('/complete/model', methods=['GET'])
+def completion_model_stats():
+    """Versions, sizes and memory footprint of the local n-gram completion models"""
+    return jsonify({"built": ngram_models.built, "languages": ngram_models.snapshot()}), 200
@@ -0,0 +1,95 @@
+import logging
+from flask import request, jsonify, current_app
+from api import api_bp
+from config import Config
+from brain.editor_session import editor_sessions, REQUEST_KINDS
+from utils.ngram_model import ngram_models
+from utils.syntax_check import CHECK_MODES
+
+logger = logging.getLogger(__name__)
+
+@api_bp.route('/editor/sessions', methods=['POST'])
+def create_editor_session():
+    """Open a session for an editor buffer"""
+    session = editor_sessions.create()
+    logger.debug(f"Editor session {session.id} opened")
+    return jsonify({"session_id": session.id, "debounce": session.debounce, "kinds": list(REQUEST_KINDS)}), 201
+
+@api_bp.route('/editor/sessions/<session_id>/requests', methods=['POST'])
+def editor_session_request(session_id):
+    """
+    Run a completion, error-check or language-detection request for the session's buffer
+
+    Expected JSON payload:
+    {
+        "kind": "complete",       // complete, check or detect
+        "code": "def fibonacci(n):",
+        "language": "python",     // not needed for detect
+        "max_tokens": 100,        // complete only
+        "mode": "semantic"        // check only
+    }
+
+    A request superseded by a newer one of the same kind returns
+    "status": "coalesced" (it never started) or "cancelled" (its upstream
+    calls were stopped); only "completed" responses carry a result.
+
+    Any worker can serve any session: a request is superseded by newer
+    ones wherever they arrive. A closed or evicted session is reopened
+    under the same id rather than rejected.
+    """
+    session = editor_sessions.get_or_create(session_id)
+    if session is None:
+        return jsonify({"error": "Invalid session id"}), 404
+
+    data = request.get_json()
+
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+
+    kind = data.get('kind')
+    code = data.get('code')
+    language = (data.get('language') or 'python').lower()
+
+    if kind not in REQUEST_KINDS:
+        return jsonify({"error": f"Unsupported kind. Supported kinds are: {', '.join(REQUEST_KINDS)}"}), 400
+
+    if not code:
+        return jsonify({"error": "No code provided"}), 400
+
+    if kind != 'detect' and language not in Config.SUPPORTED_LANGUAGES:
+        return jsonify({
+            "error": f"Unsupported language. Supported languages are: {', '.join(Config.SUPPORTED_LANGUAGES)}"
+        }), 400
+
+    if kind == 'check' and data.get('mode') and data['mode'] not in CHECK_MODES:
+        return jsonify({"error": f"Unsupported mode. Supported modes are: {', '.join(CHECK_MODES)}"}), 400
+
+    if kind == 'complete':
+        ngram_models.build_in_background(current_app._get_current_object())
+
+    response = session.submit(kind, {
+        "code": code,
+        "language": language,
+        "max_tokens": data.get('max_tokens', 100),
+        "mode": data.get('mode')
+    })
+
+    if response["status"] == "failed":
+        return jsonify(response), 500
+    return jsonify(response), 200
+
+@api_bp.route('/editor/sessions/<session_id>', methods=['GET'])
+def editor_session_stats(session_id):
+    """Request counts by kind and outcome, and the requests running now"""
+    snapshot = editor_sessions.snapshot(session_id)
+    if snapshot is None:
+        return jsonify({"error": "Unknown or expired session"}), 404
+    return jsonify(snapshot), 200
+
+@api_bp.route('/editor/sessions/<session_id>', methods=['DELETE'])
+def close_editor_session(session_id):
+    """Close a session, cancelling its running requests"""
+    snapshot = editor_sessions.close(session_id)
+    if snapshot is None:
+        return jsonify({"error": "Unknown or expired session"}), 404
+    return jsonify(snapshot), 200
@@ -4,6 +4,8 @@ from flask import request, jsonify
 from api import api_bp
 from config import Config
 from brain.cloudflare_ai import check_code_errors, detect_language
+from brain.incremental_analysis import incremental_analyzer
+from utils.syntax_check import CHECK_MODES
 
 logger = logging.getLogger(__name__)
 
@@ -15,8 +17,13 @@ def check_errors():
     Expected JSON payload:
     {
         "code": "def fibonacci(n):\n    if n <= 0:\n        return 0\n    elif n == 1\n        return 1\n    else:\n        return fibonacci(n-1) + fibonacci(n-2)",
-        "language": "python"
+        "language": "python",
+        "mode": "semantic"
     }
+    
+    mode is optional: 'semantic' (default) returns syntax errors found locally
+    without calling the model and asks the model only for logic and style
+    issues; 'local' never calls the model; 'llm' skips the local check.
     """
     data = request.get_json()
     
@@ -26,11 +33,15 @@ def check_errors():
     # Extract parameters
     code = data.get('code')
     language = data.get('language', 'python').lower()
+    mode = data.get('mode') or Config.ERROR_CHECK_MODE
     
     # Validate input
     if not code:
         return jsonify({"error": "No code provided"}), 400
     
+    if mode not in CHECK_MODES:
+        return jsonify({"error": f"Unsupported mode. Supported modes are: {', '.join(CHECK_MODES)}"}), 400
+    
     # Если язык не указан, определяем его
     if language not in Config.SUPPORTED_LANGUAGES:
         detected_language = detect_language(code)
@@ -48,7 +59,7 @@ def check_errors():
         start_time = time.time()
         
         # Используем Cloudflare AI для проверки кода на ошибки
-        result = check_code_errors(code, language)
+        result = check_code_errors(code, language, mode)
         
         # Расчитываем время обработки
         processing_time = time.time() - start_time
@@ -61,6 +72,7 @@ def check_errors():
             "language": language,
             "input_code": code,
             "processing_time": processing_time,
+            "local_check": result.get("local_check", False),
             "demo_mode": False
         }
         
@@ -69,3 +81,64 @@ def check_errors():
     except Exception as e:
         logger.error(f"Error in error checking: {str(e)}")
         return jsonify({"error": f"Error checking failed: {str(e)}"}), 500
+
+@api_bp.route('/check_errors/incremental', methods=['POST'])
+def check_errors_incremental():
+    """
+    Check the whole editor buffer, re-analyzing only units changed since the last check
+    
+    Expected JSON payload:
+    {
+        "code": "def add(a, b):\n    return a + b\n",
+        "language": "python",
+        "session_id": "id returned by the previous check (optional)",
+        "mode": "semantic"
+    }
+    """
+    data = request.get_json()
+    
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+    
+    code = data.get('code')
+    language = data.get('language', 'python').lower()
+    session_id = data.get('session_id')
+    mode = data.get('mode') or Config.ERROR_CHECK_MODE
+    
+    if not code:
+        return jsonify({"error": "No code provided"}), 400
+    
+    if mode not in CHECK_MODES:
+        return jsonify({"error": f"Unsupported mode. Supported modes are: {', '.join(CHECK_MODES)}"}), 400
+    
+    if language not in Config.SUPPORTED_LANGUAGES:
+        detected_language = detect_language(code)
+        if detected_language in Config.SUPPORTED_LANGUAGES:
+            language = detected_language
+            logger.info(f"Using detected language: {language}")
+        else:
+            return jsonify({
+                "error": f"Unsupported language. Supported languages are: {', '.join(Config.SUPPORTED_LANGUAGES)}"
+            }), 400
+    
+    try:
+        start_time = time.time()
+        
+        result = incremental_analyzer.analyze(code, language, session_id, mode)
+        
+        response = {
+            "errors": result.get("errors", []),
+            "suggestions": result.get("suggestions", []),
+            "session_id": result.get("session_id"),
+            "units": result.get("units"),
+            "diff": result.get("diff"),
+            "local_check": result.get("local_check", False),
+            "language": language,
+            "processing_time": time.time() - start_time
+        }
+        
+        return jsonify(response), 200
+    
+    except Exception as e:
+        logger.error(f"Error in incremental error checking: {str(e)}")
+        return jsonify({"error": f"Error checking failed: {str(e)}"}), 500
@@ -1,15 +1,19 @@
 import logging
-from flask import jsonify
+from flask import request, jsonify
 from api import api_bp
+from config import Config
+from utils.learning_utils import record_feedback, get_feedback_stats
 
 logger = logging.getLogger(__name__)
 
+FEEDBACK_TYPES = ['completion', 'error', 'suggestion', 'generation']
+
 @api_bp.route('/feedback', methods=['POST'])
 def submit_feedback():
     """
-    Submit feedback for model improvement (simplified for demo purposes)
-    
-    Normally would take:
+    Submit feedback for model improvement
+
+    Expected JSON payload:
     {
         "code_input": "def fibonacci(n):",
         "model_output": "def fibonacci(n):\n    if n <= 0:\n        return 0\n    elif n == 1:\n        return 1\n    else:\n        return fibonacci(n-1) + fibonacci(n-2)",
@@ -19,10 +23,67 @@ def submit_feedback():
         "rating": 4
     }
     """
-    # Simplified implementation for demo purposes
-    logger.debug("Received feedback (simplified storage for demo)")
-    
-    return jsonify({
-        "message": "Feedback received (simplified for demo)",
-        "feedback_id": "demo-123"
-    }), 201
+    data = request.get_json()
+
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+
+    code_input = data.get('code_input')
+    model_output = data.get('model_output')
+    language = data.get('language', 'python').lower()
+    feedback_type = data.get('feedback_type', 'completion')
+    rating = data.get('rating')
+
+    # Validate input
+    if not code_input or not model_output:
+        return jsonify({"error": "code_input and model_output are required"}), 400
+
+    if language not in Config.SUPPORTED_LANGUAGES:
+        return jsonify({
+            "error": f"Unsupported language. Supported languages are: {', '.join(Config.SUPPORTED_LANGUAGES)}"
+        }), 400
+
+    if feedback_type not in FEEDBACK_TYPES:
+        return jsonify({
+            "error": f"Unsupported feedback type. Supported types are: {', '.join(FEEDBACK_TYPES)}"
+        }), 400
+
+    if rating is not None and (not isinstance(rating, int) or not 1 <= rating <= 5):
+        return jsonify({"error": "Rating must be an integer from 1 to 5"}), 400
+
+    try:
+        feedback = record_feedback(
+            code_input,
+            model_output,
+            data.get('corrected_output'),
+            language,
+            feedback_type,
+            rating
+        )
+
+        return jsonify({
+            "message": "Feedback received",
+            "feedback_id": feedback.id
+        }), 201
+
+    except Exception as e:
+        logger.error(f"Error storing feedback: {str(e)}")
+        return jsonify({"error": "Failed to store feedback"}), 500
+
+@api_bp.route('/feedback/stats', methods=['GET'])
+def get_feedback():
+    """
+    Get feedback statistics from the rollup tables
+
+    Query parameters:
+        language: restrict to one language (optional)
+        hours: number of recent hourly buckets to return (default 24)
+    """
+    language = request.args.get('language')
+    hours = request.args.get('hours', 24, type=int)
+
+    try:
+        return jsonify(get_feedback_stats(language, hours)), 200
+    except Exception as e:
+        logger.error(f"Error reading feedback stats: {str(e)}")
+        return jsonify({"error": "Failed to get feedback statistics"}), 500
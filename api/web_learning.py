@@ -7,7 +7,7 @@ import json
 from flask import request, jsonify, current_app
 from api import api_bp
 from web_scraper import enqueue_url_for_learning, process_url_now, get_website_text_content
-from brain.continuous_learning import count_knowledge_items, knowledge_base
+from brain.continuous_learning import count_knowledge_items, get_knowledge_base
 
 logger = logging.getLogger(__name__)
 
@@ -96,6 +96,7 @@ def api_learning_status():
     """
     try:
         # Get knowledge base information
+        knowledge_base = get_knowledge_base()
         item_count = count_knowledge_items()
         last_updated = knowledge_base.get("last_updated", "Never")
         
@@ -4,6 +4,7 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
+from utils.startup import StartupTimer
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -15,41 +16,127 @@ class Base(DeclarativeBase):
 # Initialize SQLAlchemy with the Base class
 db = SQLAlchemy(model_class=Base)
 
-# Create the Flask application
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
-
-# Configure the database - используем локальную SQLite
-app.config["SQLALCHEMY_DATABASE_URI"] = 'sqlite:///codevai.db'
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-
-# Отключаем некоторые предупреждения SQLAlchemy
-app.config["SQLALCHEMY_WARN_20"] = False
-
-# Initialize the database with the app
-db.init_app(app)
-
-# Import models to ensure tables are created
-with app.app_context():
-    import models
-    db.create_all()
-
-    # Import and register API blueprints
-    from api import api_bp
-    from api.cloudflare_routes import cloudflare_bp
-    app.register_blueprint(api_bp, url_prefix='/api')
-    app.register_blueprint(cloudflare_bp)
-    
-    # Import routes
-    from routes import *
-    
-    # Initialize continuous learning on application startup
-    from brain.continuous_learning import start_continuous_learning
-    start_continuous_learning()
-
-    logger.info("Application initialized successfully")
+def create_app(config=None, start_background_services=False):
+    """
+    Create and configure the Flask application
+
+    Importing this module has no side effects; tables, blueprints and
+    background services are only set up here.
+
+    Args:
+        config (dict): Config values overriding the defaults (optional)
+        start_background_services (bool): Start continuous learning threads
+
+    Returns:
+        Flask: Configured application
+    """
+    timer = StartupTimer()
+
+    with timer.measure("flask"):
+        app = Flask(__name__)
+        app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key")
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+
+        # Configure the database - используем локальную SQLite
+        app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", 'sqlite:///codevai.db')
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+            "pool_recycle": 300,
+            "pool_pre_ping": True,
+        }
+        app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+
+        # Отключаем некоторые предупреждения SQLAlchemy
+        app.config["SQLALCHEMY_WARN_20"] = False
+
+        # Create missing tables on startup
+        app.config["CREATE_TABLES"] = True
+
+        if config:
+            app.config.update(config)
+
+    with timer.measure("database"):
+        # Initialize the database with the app
+        db.init_app(app)
+
+        # Import models to ensure tables are created
+        with app.app_context():
+            import models
+            if app.config["CREATE_TABLES"]:
+                db.create_all()
+
+    with timer.measure("metrics"):
+        from utils import metrics
+        metrics.init_app(app)
+
+    with timer.measure("profiler"):
+        from utils import profiler
+        profiler.init_app(app)
+
+    with timer.measure("deadlines"):
+        from utils import deadline
+        deadline.init_app(app)
+
+    with timer.measure("api_blueprint"):
+        from api import api_bp
+        app.register_blueprint(api_bp, url_prefix='/api')
+
+    with timer.measure("cloudflare_blueprint"):
+        from api.cloudflare_routes import cloudflare_bp
+        app.register_blueprint(cloudflare_bp)
+
+    with timer.measure("page_routes"):
+        from routes import main_bp
+        app.register_blueprint(main_bp)
+
+    with timer.measure("cli_commands"):
+        from commands import commands_bp
+        app.register_blueprint(commands_bp)
+
+    with timer.measure("tracing"):
+        # After all blueprints are registered, so their handlers get wrapped in spans
+        from utils import tracing
+        tracing.init_app(app)
+
+    if start_background_services:
+        with timer.measure("background_services"):
+            start_app_background_services(app)
+
+    app.extensions["startup_report"] = timer.log()
+
+    return app
+
+def preload_shared_data(app):
+    """
+    Load read-mostly data before worker processes are forked
+
+    Everything loaded here is inherited by forked workers and shared
+    copy-on-write instead of being loaded again in each worker.
+
+    Args:
+        app (Flask): Application the data belongs to
+    """
+    with app.app_context():
+        from brain.continuous_learning import get_knowledge_base
+        get_knowledge_base()
+
+        from utils.completion_index import completion_index
+        completion_index.build()
+
+        from utils.ngram_model import ngram_models
+        ngram_models.build()
+
+    logger.info("Shared data preloaded")
+
+def start_app_background_services(app):
+    """
+    Start the background learning services for an application
+
+    Args:
+        app (Flask): Application the services run against
+    """
+    with app.app_context():
+        # Initialize continuous learning
+        from brain.continuous_learning import start_continuous_learning
+        start_continuous_learning()
+
+    logger.info("Background services started")
@@ -0,0 +1,329 @@
+"""
+End-to-end load test for the CodevAI HTTP API
+
+Drives every /api/*, /api/cloudflare/* and /metrics endpoint at a configurable
+concurrency and reports throughput and p50/p95/p99 latency per endpoint.
+Unless --target is given, the app is started in-process against a
+temporary database and a local Workers AI stand-in
+(benchmarks/mock_workers_ai.py), so runs are reproducible offline.
+
+Examples:
+    python benchmarks/loadtest.py --concurrency 16 --requests 200 --output results.json
+    python benchmarks/loadtest.py --latency lognormal:0.4,0.5 --rate-limit-rate 0.05
+    python benchmarks/loadtest.py --compare baseline.json --max-regression 20
+    python benchmarks/loadtest.py --max-error-rate 1
+    python benchmarks/loadtest.py --target http://127.0.0.1:5000 --endpoint api.complete
+
+Endpoints that fetch real web pages are skipped unless --include-external is set.
+A run fails when an endpoint's error rate (5xx responses and client errors)
+exceeds --max-error-rate, so an endpoint that breaks cannot pass as fast.
+"""
+
+import os
+import sys
+import json
+import math
+import base64
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_workers_ai import start_mock_server, add_mock_arguments, mock_options, PNG_BYTES
+
+PYTHON_SNIPPET = "def fibonacci(n):\n    if n <= 1\n        return n\n    return fibonacci(n-1) + fibonacci(n-2)"
+PYTHON_MODULE = "\n\n".join(f"def f{i}(x):\n    return x * {i}" for i in range(8)) + "\n"
+# Servers reopen an unknown session id, so every request can use the same fixed session
+EDITOR_SESSION = "0123456789abcdef0123456789abcdef"
+BATCH_TEXTS = [f"knowledge item {i % 20}" for i in range(100)]
+
+# name, method, path, JSON payload, fetches external web pages
+ENDPOINTS = [
+    ("api.complete", "POST", "/api/complete", {"code": "def fibonacci(n):", "language": "python", "max_tokens": 100}, False),
+    ("api.check_errors", "POST", "/api/check_errors", {"code": PYTHON_SNIPPET, "language": "python"}, False),
+    ("api.complete_speculative", "POST", "/api/complete", {"code": "def fibonacci(n):", "language": "python", "max_tokens": 100, "speculative": True}, False),
+    ("api.complete_index", "GET", "/api/complete/index", None, False),
+    ("api.complete_model", "GET", "/api/complete/model", None, False),
+    ("api.check_errors_incremental", "POST", "/api/check_errors/incremental", {"code": PYTHON_MODULE, "language": "python", "session_id": "loadtest"}, False),
+    ("api.editor_session_create", "POST", "/api/editor/sessions", None, False),
+    ("api.editor_session_check", "POST", f"/api/editor/sessions/{EDITOR_SESSION}/requests", {"kind": "check", "code": PYTHON_MODULE, "language": "python"}, False),
+    ("api.editor_session_complete", "POST", f"/api/editor/sessions/{EDITOR_SESSION}/requests", {"kind": "complete", "code": "def fibonacci(n):", "language": "python"}, False),
+    ("api.editor_session_stats", "GET", f"/api/editor/sessions/{EDITOR_SESSION}", None, False),
+    ("api.detect_language", "POST", "/api/detect_language", {"code": PYTHON_SNIPPET}, False),
+    ("api.ai_thinking", "POST", "/api/ai-thinking", {"prompt": "Find the greatest common divisor", "language": "python", "max_thoughts": 3}, False),
+    ("api.feedback", "POST", "/api/feedback", {
+        "code_input": "def fibonacci(n):", "model_output": PYTHON_SNIPPET, "corrected_output": PYTHON_SNIPPET,
+        "language": "python", "feedback_type": "completion", "rating": 4
+    }, False),
+    ("api.feedback_stats", "GET", "/api/feedback/stats", None, False),
+    ("api.learning_status", "GET", "/api/learning/status", None, False),
+    ("api.learning_status_page", "GET", "/api/learning-status", None, False),
+    ("api.learning_enqueue", "POST", "/api/learning/enqueue", {"url": "https://example.com/python-tutorial"}, False),
+    ("api.web_search", "POST", "/api/web-search", {"query": "python recursion", "language": "python"}, True),
+    ("api.web_content", "POST", "/api/web-content", {"url": "https://example.com/"}, True),
+    ("api.learning_process", "POST", "/api/learning/process", {"url": "https://example.com/"}, True),
+    ("api.learning_content", "POST", "/api/learning/content", {"url": "https://example.com/"}, True),
+    ("cloudflare.text_generation", "POST", "/api/cloudflare/text-generation", {"prompt": "Explain recursion"}, False),
+    ("cloudflare.code_analysis", "POST", "/api/cloudflare/code-analysis", {"code": PYTHON_SNIPPET, "language": "python", "task": "review"}, False),
+    ("cloudflare.image_generation", "POST", "/api/cloudflare/image-generation", {"prompt": "a cat writing code"}, False),
+    ("cloudflare.moderate_content", "POST", "/api/cloudflare/moderate-content", {"text": "Hello world"}, False),
+    ("cloudflare.moderate_content_batch", "POST", "/api/cloudflare/moderate-content", {"texts": BATCH_TEXTS}, False),
+    ("cloudflare.image_classification", "POST", "/api/cloudflare/image-classification", {"image": base64.b64encode(PNG_BYTES).decode("ascii")}, False),
+    ("cloudflare.embeddings", "POST", "/api/cloudflare/embeddings", {"texts": BATCH_TEXTS}, False),
+    ("cloudflare.extract_knowledge", "POST", "/api/cloudflare/extract-knowledge", {"text": "Recursion is a function calling itself.", "topic": "python"}, False),
+    ("cloudflare.status", "GET", "/api/cloudflare/status", None, False),
+    ("main.metrics", "GET", "/metrics", None, False),
+    ("try.ai_thinking", "GET", "/api/try/ai-thinking", None, False),
+]
+
+_local = threading.local()
+
+def _session():
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def start_local_app(mock_base_url):
+    """
+    Start the app in-process against the mock upstream and a temporary database
+
+    Returns:
+        str: Base URL of the running app
+    """
+    from werkzeug.serving import make_server
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="codevai-bench-"), "bench.db")
+    os.environ.update({
+        "CLOUDFLARE_API_BASE_URL": mock_base_url,
+        "CLOUDFLARE_AI_TOKEN": "mock-token",
+        "CLOUDFLARE_ACCOUNT_ID": "mock-account",
+        "DATABASE_URL": f"sqlite:///{db_path}",
+    })
+
+    from app import create_app
+    app = create_app()
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, name="codevai-app")
+    thread.daemon = True
+    thread.start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+def run_endpoint(base_url, endpoint, concurrency, total_requests, timeout):
+    """
+    Send total_requests requests to one endpoint with a fixed number of workers
+
+    Returns:
+        dict: Throughput, latency percentiles and status counts
+    """
+    name, method, path, payload, _ = endpoint
+    url = base_url + path
+    latencies = []
+    statuses = {}
+    failures = 0
+    lock = threading.Lock()
+
+    def one_request(_):
+        nonlocal failures
+        start = time.perf_counter()
+        try:
+            response = _session().request(method, url, json=payload, timeout=timeout)
+            status = str(response.status_code)
+        except requests.RequestException as e:
+            status = type(e).__name__
+        elapsed = time.perf_counter() - start
+
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+            if not status.isdigit() or int(status) >= 500:
+                failures += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one_request, range(total_requests)))
+    wall_time = time.perf_counter() - started
+
+    latencies.sort()
+    to_ms = lambda value: round(value * 1000, 3) if value is not None else None
+
+    return {
+        "endpoint": name,
+        "method": method,
+        "path": path,
+        "requests": total_requests,
+        "concurrency": concurrency,
+        "failures": failures,
+        "error_rate": round(failures / total_requests, 4) if total_requests else 0,
+        "status_counts": statuses,
+        "wall_time_s": round(wall_time, 3),
+        "throughput_rps": round(total_requests / wall_time, 2) if wall_time else None,
+        "latency_ms": {
+            "mean": to_ms(sum(latencies) / len(latencies)) if latencies else None,
+            "p50": to_ms(percentile(latencies, 50)),
+            "p95": to_ms(percentile(latencies, 95)),
+            "p99": to_ms(percentile(latencies, 99)),
+            "max": to_ms(latencies[-1] if latencies else None)
+        }
+    }
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+def error_rate_violations(results, max_error_rate):
+    """
+    Endpoints whose error rate exceeds max_error_rate percent
+
+    Returns:
+        list: Human readable descriptions
+    """
+    return [
+        f"{item['endpoint']}: {item['failures']} of {item['requests']} requests failed {item['status_counts']}"
+        for item in results["endpoints"]
+        if item["error_rate"] * 100 > max_error_rate
+    ]
+
+def compare_results(current, baseline, max_regression, max_error_rate):
+    """
+    Compare error rate, p95 latency and throughput with a previous run
+
+    Returns:
+        list: Human readable regression descriptions
+    """
+    regressions = []
+    previous = {item["endpoint"]: item for item in baseline.get("endpoints", [])}
+
+    for item in current["endpoints"]:
+        before = previous.get(item["endpoint"])
+        if not before:
+            continue
+
+        # Failing fast is not a speedup: a higher error rate is a regression on its own
+        old_errors, new_errors = before.get("error_rate", 0), item["error_rate"]
+        if (new_errors - old_errors) * 100 > max_error_rate:
+            regressions.append(f"{item['endpoint']}: error rate {old_errors:.1%} -> {new_errors:.1%}")
+
+        old_p95, new_p95 = before["latency_ms"]["p95"], item["latency_ms"]["p95"]
+        if old_p95 and new_p95 and new_p95 > old_p95 * (1 + max_regression / 100.0):
+            regressions.append(f"{item['endpoint']}: p95 {old_p95:.1f}ms -> {new_p95:.1f}ms")
+
+        old_rps, new_rps = before.get("throughput_rps"), item.get("throughput_rps")
+        if old_rps and new_rps and new_rps < old_rps * (1 - max_regression / 100.0):
+            regressions.append(f"{item['endpoint']}: throughput {old_rps:.1f} -> {new_rps:.1f} req/s")
+
+    return regressions
+
+def print_table(results):
+    print(f"{'endpoint':<30} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for item in results["endpoints"]:
+        latency = item["latency_ms"]
+        print(f"{item['endpoint']:<30} {item['throughput_rps'] or 0:>8.1f} {latency['p50'] or 0:>9.1f} "
+              f"{latency['p95'] or 0:>9.1f} {latency['p99'] or 0:>9.1f} {item['failures']:>7}")
+
+def main():
+    parser = argparse.ArgumentParser(description="CodevAI end-to-end load test")
+    parser.add_argument("--target", help="Base URL of a running app (default: start one in-process)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients per endpoint")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per endpoint")
+    parser.add_argument("--timeout", type=float, default=60, help="Client timeout per request in seconds")
+    parser.add_argument("--endpoint", action="append", help="Only run endpoints with this name (repeatable)")
+    parser.add_argument("--include-external", action="store_true", help="Also run endpoints that fetch real web pages")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Previous results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=20.0,
+                        help="Allowed p95/throughput regression in percent before exiting non-zero")
+    parser.add_argument("--max-error-rate", type=float, default=0.0,
+                        help="Allowed error rate per endpoint in percent before exiting non-zero")
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    mock = None
+    if args.target:
+        base_url = args.target.rstrip("/")
+    else:
+        _, mock, mock_base_url = start_mock_server(**mock_options(args))
+        base_url = start_local_app(mock_base_url)
+
+    endpoints = [
+        endpoint for endpoint in ENDPOINTS
+        if (not args.endpoint or endpoint[0] in args.endpoint)
+        and (args.include_external or not endpoint[4])
+    ]
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "target": args.target or "in-process",
+            "concurrency": args.concurrency,
+            "requests_per_endpoint": args.requests,
+            "mock": None if args.target else mock_options(args)
+        },
+        "endpoints": []
+    }
+
+    for endpoint in endpoints:
+        results["endpoints"].append(
+            run_endpoint(base_url, endpoint, args.concurrency, args.requests, args.timeout)
+        )
+
+    if mock:
+        results["meta"]["upstream_calls"] = mock.stats
+
+    print_table(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    failed = False
+    violations = error_rate_violations(results, args.max_error_rate)
+    if violations:
+        print("Endpoints over the error rate limit:")
+        for line in violations:
+            print(f"  {line}")
+        failed = True
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_results(results, json.load(f), args.max_regression, args.max_error_rate)
+        if regressions:
+            print("Regressions found:")
+            for line in regressions:
+                print(f"  {line}")
+            failed = True
+        else:
+            print("No regressions found")
+
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""
+Local stand-in for the Cloudflare Workers AI REST API
+
+Serves POST /client/v4/accounts/<account_id>/ai/run/<model> with canned
+responses shaped like the real API, after a latency drawn from a
+configurable distribution. A fraction of calls can fail with HTTP 500 or be
+throttled with HTTP 429 and a Retry-After header, so benchmark results do
+not depend on the real service. Text models honor "stream": true with
+server-sent events, as the real API does, and Stable Diffusion answers with
+raw PNG bytes.
+
+Run standalone:
+    python benchmarks/mock_workers_ai.py --port 8788 --latency lognormal:0.4,0.5 --rate-limit-rate 0.02
+
+and point the app at it:
+    CLOUDFLARE_API_BASE_URL=http://127.0.0.1:8788/client/v4 CLOUDFLARE_AI_TOKEN=mock CLOUDFLARE_ACCOUNT_ID=mock
+"""
+
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Share of the latency spent generating tokens when a text model streams (the rest is time to first token)
+STREAM_TOKEN_SHARE = 0.8
+
+RUN_PATH = re.compile(r"^/client/v4/accounts/(?P<account>[^/]+)/ai/run/(?P<model>.+)$")
+
+# 1x1 transparent PNG
+PNG_BYTES = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082"
+)
+
+class LatencyDistribution:
+    """
+    Latency sampler built from a spec string
+
+    Specs (seconds):
+        fixed:0.2
+        uniform:0.1,0.5
+        normal:0.3,0.05        mean, standard deviation
+        lognormal:0.3,0.5      median, sigma
+    """
+
+    def __init__(self, spec, rng):
+        self.spec = spec
+        self.rng = rng
+        kind, _, params = spec.partition(":")
+        self.kind = kind
+        self.params = [float(p) for p in params.split(",") if p]
+
+        expected = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+        if kind not in expected or len(self.params) != expected[kind]:
+            raise ValueError(f"Invalid latency spec: {spec}")
+
+    def sample(self):
+        if self.kind == "fixed":
+            value = self.params[0]
+        elif self.kind == "uniform":
+            value = self.rng.uniform(*self.params)
+        elif self.kind == "normal":
+            value = self.rng.gauss(*self.params)
+        else:
+            median, sigma = self.params
+            value = median * self.rng.lognormvariate(0, sigma)
+        return max(0.0, value)
+
+class MockWorkersAI:
+    """Configuration and counters shared by the request handlers"""
+
+    def __init__(self, latency="fixed:0.05", model_latency=None, error_rate=0.0,
+                 rate_limit_rate=0.0, retry_after=1, seed=None, model_error_rate=None):
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.latency = LatencyDistribution(latency, self.rng)
+        self.model_latency = {
+            model: LatencyDistribution(spec, self.rng)
+            for model, spec in (model_latency or {}).items()
+        }
+        self.error_rate = error_rate
+        self.model_error_rate = model_error_rate or {}
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.stats = {"requests": 0, "errors": 0, "rate_limited": 0, "cancelled_streams": 0, "by_model": {}}
+
+    def decide(self, model):
+        """Pick latency and outcome for one call"""
+        with self.lock:
+            distribution = next(
+                (dist for key, dist in self.model_latency.items() if key in model),
+                self.latency
+            )
+            delay = distribution.sample()
+            roll = self.rng.random()
+            error_rate = next(
+                (rate for key, rate in self.model_error_rate.items() if key in model),
+                self.error_rate
+            )
+
+            self.stats["requests"] += 1
+            self.stats["by_model"][model] = self.stats["by_model"].get(model, 0) + 1
+
+            if roll < self.rate_limit_rate:
+                self.stats["rate_limited"] += 1
+                return delay, 429
+            if roll < self.rate_limit_rate + error_rate:
+                self.stats["errors"] += 1
+                return delay, 500
+            return delay, 200
+
+def _usage(prompt_text, completion_text):
+    prompt_tokens = max(1, len(prompt_text) // 4)
+    completion_tokens = max(1, len(completion_text) // 4)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens
+    }
+
+def text_result(payload):
+    """Build a chat model result that matches what the app asks for"""
+    messages = payload.get("messages") or [{"role": "user", "content": payload.get("prompt", "")}]
+    system = " ".join(m.get("content", "") for m in messages if m.get("role") == "system")
+    user = " ".join(m.get("content", "") for m in messages if m.get("role") == "user")
+
+    if '"thoughts"' in system:
+        body = {
+            "thoughts": [
+                {"thought": "Разбираю условие задачи", "timestamp": time.time()},
+                {"thought": "Выбираю подходящий алгоритм", "timestamp": time.time()},
+                {"thought": "Проверяю краевые случаи", "timestamp": time.time()}
+            ],
+            "comments": ["Сложность O(log n)", "Рекурсию можно заменить циклом"],
+            "answer": "def gcd(a, b):\n    while b:\n        a, b = b, a % b\n    return a"
+        }
+        response = "```json\n" + json.dumps(body, ensure_ascii=False) + "\n```"
+    elif '"has_errors"' in system:
+        body = {
+            "has_errors": True,
+            "errors": [{"line": 1, "description": "Missing colon", "severity": "error"}],
+            "suggestions": ["Add a colon at the end of the line"],
+            "corrected_code": user
+        }
+        response = "```json\n" + json.dumps(body) + "\n```"
+    elif "key_concepts" in system:
+        body = {
+            "key_concepts": ["recursion"],
+            "code_examples": [],
+            "best_practices": ["write tests"],
+            "common_problems": ["stack overflow"]
+        }
+        response = "```json\n" + json.dumps(body) + "\n```"
+    elif "язык программирования" in system:
+        response = "python"
+    else:
+        response = "```python\n" + user + "\n    return None\n```"
+
+    return {"response": response, "usage": _usage(system + user, response)}
+
+def model_result(model, payload):
+    """Build the result object for a model path"""
+    if "stable-diffusion" in model:
+        return PNG_BYTES
+    if "moderation" in model:
+        return {"flagged": False, "categories": {"hate": 0.001, "violence": 0.002, "sexual": 0.001}}
+    if "resnet" in model:
+        return [{"label": "TABBY CAT", "score": 0.91}, {"label": "TIGER CAT", "score": 0.05}]
+    if "bge" in model or "embedding" in model:
+        texts = payload.get("text", "")
+        texts = texts if isinstance(texts, list) else [texts]
+        return {"shape": [len(texts), 768], "data": [[0.01 * (i % 7)] * 768 for i, _ in enumerate(texts)]}
+    return text_result(payload)
+
+def make_handler(mock):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, body, headers=None):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_stream(self, result, delay):
+            """Send a text result as chunked server-sent events, spreading the rest of the latency over the tokens"""
+            # Without chunked encoding the client would read the body until the connection closes
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+
+            def send_event(data):
+                body = f"data: {data}\n\n".encode()
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(body), body))
+                self.wfile.flush()
+
+            tokens = re.findall(r"\s*\S+", result["response"]) or [""]
+            try:
+                for token in tokens:
+                    time.sleep(delay * STREAM_TOKEN_SHARE / len(tokens))
+                    send_event(json.dumps({"response": token}))
+                send_event(json.dumps({"response": "", "usage": result.get("usage")}))
+                send_event("[DONE]")
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # The client aborted the generation
+                with mock.lock:
+                    mock.stats["cancelled_streams"] += 1
+
+        def do_GET(self):
+            if self.path == "/__stats":
+                with mock.lock:
+                    return self._send_json(200, json.loads(json.dumps(mock.stats)))
+            self._send_json(404, {"success": False, "errors": [{"message": "Not found"}]})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+
+            match = RUN_PATH.match(self.path)
+            if not match:
+                return self._send_json(404, {"success": False, "errors": [{"message": "Not found"}]})
+
+            model = match.group("model")
+            delay, status = mock.decide(model)
+
+            try:
+                payload = json.loads(raw or b"{}")
+            except ValueError:
+                payload = {}
+
+            result = model_result(model, payload) if status == 200 else None
+            streaming = bool(payload.get("stream")) and isinstance(result, dict) and "response" in result
+            # When streaming, only part of the latency passes before the first token
+            time.sleep(delay * (1 - STREAM_TOKEN_SHARE) if streaming else delay)
+
+            if status == 429:
+                return self._send_json(429, {
+                    "success": False,
+                    "errors": [{"code": 3040, "message": "Capacity temporarily exceeded"}]
+                }, {"Retry-After": str(mock.retry_after)})
+            if status != 200:
+                return self._send_json(status, {"success": False, "errors": [{"message": "Internal error"}]})
+
+            if streaming:
+                return self._send_stream(result, delay)
+
+            if isinstance(result, bytes):
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(result)))
+                self.end_headers()
+                self.wfile.write(result)
+                return
+
+            self._send_json(200, {
+                "result": result,
+                "success": True,
+                "errors": [],
+                "messages": []
+            })
+
+    return Handler
+
+def start_mock_server(host="127.0.0.1", port=0, **options):
+    """
+    Start the mock API in a background thread
+
+    Returns:
+        tuple: (server, mock, base_url) - base_url is suitable for CLOUDFLARE_API_BASE_URL
+    """
+    mock = MockWorkersAI(**options)
+    server = ThreadingHTTPServer((host, port), make_handler(mock))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="mock-workers-ai")
+    thread.daemon = True
+    thread.start()
+    base_url = f"http://{host}:{server.server_address[1]}/client/v4"
+    return server, mock, base_url
+
+def parse_model_latency(values):
+    """Parse repeated MODEL=SPEC (or MODEL=RATE) options"""
+    overrides = {}
+    for value in values or []:
+        model, _, spec = value.partition("=")
+        overrides[model] = spec
+    return overrides
+
+def add_mock_arguments(parser):
+    """Add the mock server options to an argument parser"""
+    parser.add_argument("--latency", default="fixed:0.05", help="Default upstream latency distribution")
+    parser.add_argument("--model-latency", action="append", metavar="MODEL=SPEC",
+                        help="Latency distribution for models whose path contains MODEL")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with HTTP 500")
+    parser.add_argument("--model-error-rate", action="append", metavar="MODEL=RATE",
+                        help="Error rate for models whose path contains MODEL")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of calls answered with HTTP 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--seed", type=int, default=1234, help="Random seed for reproducible runs")
+
+def mock_options(args):
+    return {
+        "latency": args.latency,
+        "model_latency": parse_model_latency(args.model_latency),
+        "error_rate": args.error_rate,
+        "rate_limit_rate": args.rate_limit_rate,
+        "retry_after": args.retry_after,
+        "seed": args.seed,
+        "model_error_rate": {
+            model: float(rate) for model, rate in parse_model_latency(args.model_error_rate).items()
+        }
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Workers AI stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8788)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    server, _, base_url = start_mock_server(args.host, args.port, **mock_options(args))
+    print(f"Mock Workers AI listening at {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Training and inference benchmark for the local n-gram completion model
+
+Trains a model on a corpus of source files (by default this repository's own
+Python code) in batches, as the background trainer would, and reports
+training throughput, memory footprint, and completion latency and throughput
+for prompts cut from the corpus. Completions are also scored by how often
+their first line matches the real continuation.
+
+Examples:
+    python benchmarks/ngram_benchmark.py
+    python benchmarks/ngram_benchmark.py --language javascript --files "static/**/*.js" --order 3
+    python benchmarks/ngram_benchmark.py --max-ngrams 50000 --output ngram.json
+"""
+
+import os
+import sys
+import glob
+import json
+import math
+import time
+import random
+import argparse
+import platform
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils.ngram_model import NGramModel
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def load_corpus(patterns):
+    texts = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(os.path.join(ROOT, pattern), recursive=True)):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    texts.append(f.read())
+            except (OSError, UnicodeDecodeError):
+                continue
+    return texts
+
+def make_prompts(texts, count, rng):
+    """Cut prompts at line ends: everything up to a line, expected = the next line"""
+    prompts = []
+    for _ in range(count * 20):
+        if len(prompts) >= count:
+            break
+        lines = rng.choice(texts).splitlines(keepends=True)
+        if len(lines) < 3:
+            continue
+        cut = rng.randrange(1, len(lines) - 1)
+        expected = lines[cut].strip()
+        if expected:
+            # The model is given the next line's indentation, as in the editor
+            indent = lines[cut][:len(lines[cut]) - len(lines[cut].lstrip())]
+            prompts.append(("".join(lines[max(0, cut - 20):cut]) + indent, expected))
+    return prompts
+
+def main():
+    parser = argparse.ArgumentParser(description="Local n-gram completion model benchmark")
+    parser.add_argument("--language", default="python", help="Language name for the model")
+    parser.add_argument("--files", action="append", help="Glob of corpus files relative to the repo (repeatable)")
+    parser.add_argument("--order", type=int, default=4, help="Tokens per n-gram")
+    parser.add_argument("--max-ngrams", type=int, default=500000, help="N-grams kept before pruning")
+    parser.add_argument("--batch", type=int, default=10, help="Documents per training batch")
+    parser.add_argument("--prompts", type=int, default=500, help="Completion requests to time")
+    parser.add_argument("--max-tokens", type=int, default=48, help="Tokens generated per completion")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Share of files kept out of training")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the split and the prompts")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    texts = load_corpus(args.files or ["**/*.py"])
+    if len(texts) < 2:
+        parser.error("Corpus needs at least two files")
+    rng.shuffle(texts)
+    split = max(1, int(len(texts) * (1 - args.holdout)))
+    train_texts, holdout_texts = texts[:split], texts[split:] or texts[:1]
+
+    model = NGramModel(args.language, order=args.order, max_ngrams=args.max_ngrams)
+    batch_seconds = []
+    start = time.perf_counter()
+    for i in range(0, len(train_texts), args.batch):
+        batch_start = time.perf_counter()
+        model.train(train_texts[i:i + args.batch])
+        batch_seconds.append(time.perf_counter() - batch_start)
+    train_seconds = time.perf_counter() - start
+
+    latencies = []
+    answered = 0
+    first_line_hits = 0
+    prompts = make_prompts(holdout_texts, args.prompts, rng)
+    start = time.perf_counter()
+    for prompt, expected in prompts:
+        call_start = time.perf_counter()
+        continuation = model.complete(prompt, args.max_tokens)
+        latencies.append(time.perf_counter() - call_start)
+        if continuation:
+            answered += 1
+            if continuation.strip().split("\n")[0].strip() == expected:
+                first_line_hits += 1
+    inference_seconds = time.perf_counter() - start
+    latencies.sort()
+
+    snapshot = model.snapshot()
+    results = {
+        "python": platform.python_version(),
+        "corpus": {"files": len(texts), "train_files": len(train_texts), "chars": sum(map(len, train_texts))},
+        "training": {
+            "tokens": snapshot["trained_tokens"],
+            "seconds": round(train_seconds, 3),
+            "tokens_per_second": round(snapshot["trained_tokens"] / train_seconds) if train_seconds else None,
+            "slowest_batch_ms": round(max(batch_seconds) * 1000, 1) if batch_seconds else None
+        },
+        "model": snapshot,
+        "inference": {
+            "prompts": len(prompts),
+            "completions_per_second": round(len(prompts) / inference_seconds, 1) if inference_seconds else None,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+            "p99_ms": round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+            "answered": round(answered / len(prompts), 3) if prompts else None,
+            "first_line_exact": round(first_line_hits / len(prompts), 3) if prompts else None
+        }
+    }
+
+    training, inference = results["training"], results["inference"]
+    print(f"Training: {training['tokens']} tokens in {training['seconds']}s "
+          f"({training['tokens_per_second']} tokens/s), {snapshot['ngrams']} n-grams, "
+          f"{snapshot['memory_bytes'] / 1024 / 1024:.1f} MiB, {snapshot['prunes']} prunes")
+    print(f"Inference: {inference['completions_per_second']} completions/s, p50 {inference['p50_ms']}ms, "
+          f"p99 {inference['p99_ms']}ms, answered {inference['answered']}, "
+          f"first line exact {inference['first_line_exact']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,7 @@ import logging
 import traceback
 import json
 import time
-from openai import OpenAI
+import threading
 from brain.thinking_patterns import get_thinking_pattern, get_thinking_comments
 
 logger = logging.getLogger(__name__)
@@ -17,12 +17,33 @@ OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
     logger.warning("OpenAI API ключ не найден. Будут использоваться шаблонные ответы.")
 
-# Инициализация клиента OpenAI
-try:
-    openai_client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
-except Exception as e:
-    logger.error(f"Ошибка при инициализации OpenAI API: {str(e)}")
-    openai_client = None
+# Клиент OpenAI создается лениво при первом обращении
+_openai_client = None
+_openai_client_initialized = False
+_openai_client_lock = threading.Lock()
+
+def get_openai_client():
+    """
+    Возвращает клиент OpenAI, импортируя библиотеку при первом вызове
+    
+    Returns:
+        OpenAI: Клиент или None, если ключ не задан или инициализация не удалась
+    """
+    global _openai_client, _openai_client_initialized
+    
+    if not _openai_client_initialized:
+        with _openai_client_lock:
+            if not _openai_client_initialized:
+                try:
+                    if OPENAI_API_KEY:
+                        from openai import OpenAI
+                        _openai_client = OpenAI(api_key=OPENAI_API_KEY)
+                except Exception as e:
+                    logger.error(f"Ошибка при инициализации OpenAI API: {str(e)}")
+                    _openai_client = None
+                _openai_client_initialized = True
+    
+    return _openai_client
 
 def get_ai_thinking(prompt, language="general", max_thoughts=3):
     """
@@ -36,6 +57,8 @@ def get_ai_thinking(prompt, language="general", max_thoughts=3):
     Returns:
         dict: Результат обработки с мыслями, комментариями и ответом
     """
+    openai_client = get_openai_client()
+    
     # Если API не доступен, используем шаблонные ответы
     if not openai_client:
         return get_fallback_thinking(prompt, language, max_thoughts)
@@ -108,6 +131,8 @@ def get_code_completion(code_snippet, language, max_tokens=500):
     Returns:
         str: Завершенный код
     """
+    openai_client = get_openai_client()
+    
     if not openai_client:
         # Шаблонное завершение кода при отсутствии API
         return f"{code_snippet}\n    # Шаблонное завершение кода\n    pass"
@@ -146,6 +171,8 @@ def check_code_errors(code, language):
     Returns:
         dict: Результаты проверки с ошибками и предложениями
     """
+    openai_client = get_openai_client()
+    
     if not openai_client:
         # Шаблонный ответ при отсутствии API
         return {
@@ -205,6 +232,8 @@ def detect_language(code):
     Returns:
         str: Определенный язык программирования
     """
+    openai_client = get_openai_client()
+    
     if not openai_client:
         # Шаблонное определение языка при отсутствии API
         if "def " in code and ":" in code:
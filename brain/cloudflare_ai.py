@@ -10,13 +10,19 @@ This module provides access to Cloudflare AI models and other Cloudflare service
 """
 
 import os
-import requests
-import json
 import logging
 import time
 import traceback
+import threading
+import contextvars
 import base64
 from typing import Dict, List, Any, Optional, Union
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from utils.code_chunking import chunk_code
+from utils.json_stream import extract_json, JSONStreamParser
+from utils.syntax_check import check_syntax
+from utils.tracing import span, traced
 
 logger = logging.getLogger(__name__)
 
@@ -30,8 +36,9 @@ if not CLOUDFLARE_AI_TOKEN:
 if not CLOUDFLARE_ACCOUNT_ID:
     logger.warning("Cloudflare Account ID not found. This is required for accessing Cloudflare services.")
 
-# Base URLs for Cloudflare services
-CLOUDFLARE_AI_URL = "https://api.cloudflare.com/client/v4/accounts/{account_id}/ai/run/"
+# Пул потоков для параллельной проверки больших файлов
+_analysis_executor = None
+_analysis_executor_lock = threading.Lock()
 
 # Available models
 MODELS = {
@@ -44,29 +51,40 @@ MODELS = {
     "image-classification": "@cf/microsoft/resnet-50"
 }
 
-def get_ai_thinking(prompt, language="general", max_thoughts=3):
+def _chat_completion(system_message, prompt, task, max_tokens=None):
     """
-    Обрабатывает запрос, используя Cloudflare AI Workers
+    Отправляет запрос к чат-модели через общий шлюз Cloudflare
     
     Args:
-        prompt (str): Запрос пользователя
-        language (str): Язык программирования
-        max_thoughts (int): Максимальное количество мыслей
+        system_message (str): Системные инструкции
+        prompt (str): Сообщение пользователя
+        task (str): Задача из политики маршрутизации (completion, error_check, detection, thinking)
+        max_tokens (int): Ограничение длины ответа (необязательно)
         
     Returns:
-        dict: Результат обработки с мыслями, комментариями и ответом
+        dict: Ответ шлюза с полями success, text и model или error
     """
-    if not CLOUDFLARE_AI_TOKEN:
-        # Если токен не предоставлен, используем локальный режим шаблонов
-        return get_fallback_thinking(prompt, language, max_thoughts)
+    # Импорт внутри функции, чтобы избежать циклического импорта с пакетом api
+    from api.cloudflare_gateway import cloudflare
+    return cloudflare.chat_completion(prompt, system_message=system_message, task=task, max_tokens=max_tokens)
+
+def _thinking_system_message(language, max_thoughts=None):
+    """
+    Системный промпт для размышлений над запросом
     
-    try:
-        # Формируем системный промпт для размышлений
-        system_message = f"""Вы опытный разработчик на {language}. 
+    Args:
+        language (str): Язык программирования
+        max_thoughts (int): Требуемое количество мыслей (необязательно)
+        
+    Returns:
+        str: Системные инструкции
+    """
+    count = f" (ровно {max_thoughts})" if max_thoughts else ""
+    return f"""Вы опытный разработчик на {language}. 
         Проанализируйте следующий запрос, размышляя вслух о решении.
         Ваш ответ должен включать:
 
-        1. Несколько этапов размышлений (в формате список)
+        1. Несколько этапов размышлений{count} (в формате список)
         2. Несколько технических комментариев к вашему подходу (в формате список)
         3. Окончательный ответ в виде кода или объяснения
 
@@ -83,46 +101,44 @@ def get_ai_thinking(prompt, language="general", max_thoughts=3):
           "answer": "Ваш финальный ответ в виде текста или кода"
         }}
         """
+
+@traced("ai.get_ai_thinking")
+def get_ai_thinking(prompt, language="general", max_thoughts=3):
+    """
+    Обрабатывает запрос, используя Cloudflare AI Workers
+    
+    Args:
+        prompt (str): Запрос пользователя
+        language (str): Язык программирования
+        max_thoughts (int): Максимальное количество мыслей
         
-        # Подготавливаем параметры запроса для @cf/meta/llama-3-8b-instruct
-        url = f"{CLOUDFLARE_AI_URL}@cf/meta/llama-3-8b-instruct"
-        url = url.replace("{account_id}", CLOUDFLARE_ACCOUNT_ID)
-        
-        headers = {
-            "Authorization": f"Bearer {CLOUDFLARE_AI_TOKEN}",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "messages": [
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": prompt}
-            ],
-            "stream": False
-        }
+    Returns:
+        dict: Результат обработки с мыслями, комментариями и ответом
+    """
+    if not CLOUDFLARE_AI_TOKEN:
+        # Если токен не предоставлен, используем локальный режим шаблонов
+        return get_fallback_thinking(prompt, language, max_thoughts)
+    
+    try:
+        # Формируем системный промпт для размышлений
+        system_message = _thinking_system_message(language)
         
         start_time = time.time()
-        response = requests.post(url, headers=headers, json=data)
+        # Запрос через общий шлюз Cloudflare; модель и бюджет выбирает маршрутизатор
+        response = _chat_completion(system_message, prompt, "thinking")
         
-        if response.status_code != 200:
-            logger.error(f"Ошибка при запросе к Cloudflare AI Workers: {response.status_code} - {response.text}")
+        if not response.get("success"):
+            logger.error(f"Ошибка при запросе к Cloudflare AI Workers: {response.get('error')}")
             return get_fallback_thinking(prompt, language, max_thoughts)
         
         # Парсим ответ
-        response_data = response.json()
-        result_text = response_data.get("result", {}).get("response", "")
+        result_text = response.get("text", "")
         
         # Пытаемся извлечь JSON из текстового ответа
         try:
-            # Извлекаем JSON из текста (может быть обернут в markdown блоки)
-            if "```json" in result_text:
-                json_text = result_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in result_text:
-                json_text = result_text.split("```")[1].split("```")[0].strip()
-            else:
-                json_text = result_text
-            
-            result = json.loads(json_text)
+            # Извлекаем JSON из текста (может быть обернут в markdown блоки, с типичными дефектами модели)
+            with span("ai.extract_json", chars=len(result_text)):
+                result = extract_json(result_text, expected_keys=("thoughts", "answer"))
         except Exception as e:
             logger.error(f"Ошибка при парсинге JSON ответа: {str(e)}")
             
@@ -158,6 +174,136 @@ def get_ai_thinking(prompt, language="general", max_thoughts=3):
         # Возвращаемся к шаблонным ответам в случае ошибки
         return get_fallback_thinking(prompt, language, max_thoughts)
 
+def stream_ai_thinking(prompt, language="general", max_thoughts=3):
+    """
+    Размышляет над запросом потоком: каждая мысль отдается, как только модель
+    ее закончила, затем комментарии и ответ по мере генерации
+    
+    Args:
+        prompt (str): Запрос пользователя
+        language (str): Язык программирования
+        max_thoughts (int): Максимальное количество мыслей
+        
+    Yields:
+        dict: {"type": "thought", "thought"}, {"type": "comment", "comment"},
+              {"type": "answer", "delta"}, затем {"type": "done", ...} с полным результатом
+    """
+    from api.cloudflare_gateway import cloudflare
+    
+    start_time = time.time()
+    result = {"thoughts": [], "comments": [], "answer": ""}
+    
+    def done(**extra):
+        result.update(language=language, prompt=prompt, processing_time=time.time() - start_time)
+        return dict(result, type="done", **extra)
+    
+    def replay(thinking):
+        # Шаблонный результат отдаем теми же событиями
+        for thought in thinking.get("thoughts", [])[:max_thoughts]:
+            result["thoughts"].append(thought)
+            yield {"type": "thought", "thought": thought}
+        for comment in thinking.get("comments", []):
+            result["comments"].append(comment)
+            yield {"type": "comment", "comment": comment}
+        result["answer"] = thinking.get("answer", "")
+        yield {"type": "answer", "delta": result["answer"]}
+    
+    if not CLOUDFLARE_AI_TOKEN:
+        yield from replay(get_fallback_thinking(prompt, language, max_thoughts))
+        yield done(fallback=True)
+        return
+    
+    parser = JSONStreamParser(stream_fields=("answer",))
+    stream = cloudflare.stream_chat_completion(prompt, system_message=_thinking_system_message(language, max_thoughts),
+                                               task="thinking")
+    model = None
+    error = None
+    text_parts = []
+    try:
+        for event in stream:
+            if "error" in event:
+                error = event["error"]
+                break
+            model = event.get("model")
+            if event.get("done"):
+                break
+            
+            if not parser.started:
+                text_parts.append(event["delta"])
+            for kind, key, value in parser.feed(event["delta"]):
+                if kind == "item" and key == "thoughts" and len(result["thoughts"]) < max_thoughts:
+                    thought = value if isinstance(value, dict) else {"thought": str(value)}
+                    thought.setdefault("timestamp", time.time())
+                    result["thoughts"].append(thought)
+                    yield {"type": "thought", "thought": thought}
+                elif kind == "item" and key == "comments":
+                    result["comments"].append(value)
+                    yield {"type": "comment", "comment": value}
+                elif kind == "partial" and key == "answer":
+                    yield {"type": "answer", "delta": value}
+                elif kind == "field" and key == "answer":
+                    result["answer"] = value if isinstance(value, str) else str(value)
+            
+            if parser.done:
+                # Объект закрыт - остальной текст (пояснения, конец markdown блока) не нужен.
+                # Лишние мысли сверх max_thoughts к этому моменту уже сгенерированы: их
+                # только отбрасываем, токены на них не экономятся
+                break
+    finally:
+        # Закрытие генератора прерывает генерацию на стороне модели
+        stream.close()
+    
+    if error and not parser.started:
+        logger.error(f"Ошибка потокового размышления: {error}")
+        yield from replay(get_fallback_thinking(prompt, language, max_thoughts))
+        yield done(fallback=True, error=error)
+        return
+    
+    if not parser.started:
+        # Модель ответила без JSON - отдаем текст как ответ, как и get_ai_thinking
+        logger.error("Модель не вернула JSON при потоковом размышлении")
+        yield from replay({"comments": ["Не удалось получить структурированный ответ"], "answer": "".join(text_parts)})
+    else:
+        parser.close()
+        answer = (parser.result or {}).get("answer")
+        if isinstance(answer, str) and answer != result["answer"]:
+            # Ответ, обрезанный на полуслове, завершен при закрытии парсера
+            result["answer"] = answer
+    
+    yield done(model=model, repairs=parser.repairs,
+               **({"error": error} if error else {}))
+
+def _completion_system_message(language):
+    """Системные инструкции для завершения кода"""
+    return f"""Вы опытный программист на {language}. 
+        Завершите следующий фрагмент кода логично и в соответствии с лучшими практиками.
+        Возвращайте только код, без объяснений."""
+
+def _extract_code(result_text, language):
+    """
+    Извлекает код из ответа модели (может быть обернут в markdown блоки)
+    
+    Args:
+        result_text (str): Ответ модели
+        language (str): Язык программирования
+        
+    Returns:
+        str: Код из первого блока или весь текст, если блоков нет
+    """
+    if "```" in result_text:
+        # Извлекаем блок кода
+        code_blocks = result_text.split("```")
+        if len(code_blocks) > 1:
+            # Берем первый блок кода, игнорируя язык, если он указан
+            code_block = code_blocks[1]
+            if code_block.split("\n")[0] in [language, "python", "javascript", "java", "cpp"]:
+                code_block = "\n".join(code_block.split("\n")[1:])
+            return code_block.strip()
+    
+    # Если нет маркеров кода, возвращаем весь текст
+    return result_text
+
+@traced("ai.get_code_completion")
 def get_code_completion(code_snippet, language, max_tokens=500):
     """
     Генерирует завершение кода с использованием Cloudflare AI
@@ -175,50 +321,14 @@ def get_code_completion(code_snippet, language, max_tokens=500):
         return f"{code_snippet}\n    # Шаблонное завершение кода\n    pass"
     
     try:
-        system_message = f"""Вы опытный программист на {language}. 
-        Завершите следующий фрагмент кода логично и в соответствии с лучшими практиками.
-        Возвращайте только код, без объяснений."""
-        
-        # Подготавливаем параметры запроса
-        url = f"{CLOUDFLARE_AI_URL}@cf/meta/llama-3-8b-instruct"
-        url = url.replace("{account_id}", CLOUDFLARE_ACCOUNT_ID)
-        
-        headers = {
-            "Authorization": f"Bearer {CLOUDFLARE_AI_TOKEN}",
-            "Content-Type": "application/json"
-        }
+        # Запрос через общий шлюз Cloudflare (модель llama3-8b)
+        response = _chat_completion(_completion_system_message(language), code_snippet, "completion", max_tokens)
         
-        data = {
-            "messages": [
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": code_snippet}
-            ],
-            "stream": False
-        }
-        
-        response = requests.post(url, headers=headers, json=data)
-        
-        if response.status_code != 200:
-            logger.error(f"Ошибка при запросе к Cloudflare AI Workers: {response.status_code} - {response.text}")
+        if not response.get("success"):
+            logger.error(f"Ошибка при запросе к Cloudflare AI Workers: {response.get('error')}")
             return f"{code_snippet}\n    # Ошибка при получении ответа от Cloudflare AI\n    pass"
         
-        # Парсим ответ
-        response_data = response.json()
-        result_text = response_data.get("result", {}).get("response", "")
-        
-        # Извлекаем код из ответа (может быть обернут в markdown блоки)
-        if "```" in result_text:
-            # Извлекаем блок кода
-            code_blocks = result_text.split("```")
-            if len(code_blocks) > 1:
-                # Берем первый блок кода, игнорируя язык, если он указан
-                code_block = code_blocks[1]
-                if code_block.split("\n")[0] in [language, "python", "javascript", "java", "cpp"]:
-                    code_block = "\n".join(code_block.split("\n")[1:])
-                return code_block.strip()
-        
-        # Если нет маркеров кода, возвращаем весь текст
-        return result_text
+        return _extract_code(response.get("text", ""), language)
         
     except Exception as e:
         logger.error(f"Ошибка при завершении кода: {str(e)}")
@@ -226,17 +336,73 @@ def get_code_completion(code_snippet, language, max_tokens=500):
         # Шаблонное завершение кода при ошибке
         return f"{code_snippet}\n    # Ошибка API при завершении кода\n    pass"
 
-def check_code_errors(code, language):
+def stream_code_completion(code_snippet, language, max_tokens=500):
+    """
+    Генерирует завершение кода потоком фрагментов
+    
+    Args:
+        code_snippet (str): Фрагмент кода для завершения
+        language (str): Язык программирования
+        max_tokens (int): Максимальное количество токенов
+        
+    Yields:
+        dict: {"delta": текст} по мере генерации, затем {"completion", "model", "first_token"}
+              с извлеченным кодом или {"error"}
+    """
+    from api.cloudflare_gateway import cloudflare
+    
+    parts = []
+    try:
+        for event in cloudflare.stream_chat_completion(code_snippet, system_message=_completion_system_message(language),
+                                                       task="completion", max_tokens=max_tokens):
+            if "delta" in event:
+                parts.append(event["delta"])
+                yield event
+            elif event.get("done"):
+                yield {
+                    "completion": _extract_code("".join(parts), language),
+                    "model": event.get("model"),
+                    "first_token": event.get("first_token")
+                }
+                return
+            else:
+                if not event.get("cancelled"):
+                    logger.error(f"Ошибка потокового завершения кода: {event.get('error')}")
+                yield {"error": event.get("error"), "cancelled": event.get("cancelled", False)}
+                return
+    except Exception as e:
+        logger.error(f"Ошибка при потоковом завершении кода: {str(e)}")
+        logger.debug(traceback.format_exc())
+        yield {"error": str(e)}
+
+@traced("ai.check_code_errors")
+def check_code_errors(code, language, mode=None):
     """
     Проверяет код на наличие ошибок и предлагает исправления
     
     Args:
         code (str): Код для проверки
         language (str): Язык программирования
+        mode (str): 'semantic', 'local' или 'llm' (по умолчанию Config.ERROR_CHECK_MODE)
         
     Returns:
         dict: Результаты проверки с ошибками и предложениями
     """
+    mode = mode or Config.ERROR_CHECK_MODE
+    
+    # Синтаксические ошибки находим локально за миллисекунды, без запроса к модели
+    syntax_errors = None
+    if mode != "llm":
+        with span("syntax.check_local", language=language):
+            syntax_errors = check_syntax(code, language)
+        if syntax_errors:
+            return local_check_result(syntax_errors)
+        if mode == "local":
+            result = local_check_result(syntax_errors or [])
+            if syntax_errors is None:
+                result["suggestions"].append("Локальная проверка не может оценить этот код")
+            return result
+    
     if not CLOUDFLARE_AI_TOKEN:
         # Шаблонный ответ при отсутствии токена
         return {
@@ -245,9 +411,62 @@ def check_code_errors(code, language):
             "suggestions": ["Нет доступных предложений без Cloudflare AI токена"]
         }
     
+    # Код компилируется - модель ищет только логические и стилевые проблемы
+    semantic_only = syntax_errors == []
+    
+    # Большие файлы проверяем по частям параллельно, каждая часть укладывается в контекст модели
+    chunks = chunk_code(code, language, Config.ERROR_CHECK_CHUNK_TOKENS)
+    if len(chunks) > 1:
+        logger.info(f"Checking {len(chunks)} chunks of {chunks[-1].end_line} lines in parallel")
+        return merge_chunk_results(chunks, check_code_chunks(chunks, language, semantic_only))
+    
+    return _check_code_chunk(code, language, semantic_only=semantic_only)
+
+def local_check_result(syntax_errors):
+    """
+    Результат проверки из локального синтаксического анализа
+    
+    Args:
+        syntax_errors (list): Ошибки от utils.syntax_check.check_syntax
+        
+    Returns:
+        dict: Результаты проверки в том же формате, что и от модели
+    """
+    return {
+        "has_errors": bool(syntax_errors),
+        "errors": syntax_errors,
+        "suggestions": [f"Исправьте синтаксическую ошибку в строке {error['line']}" for error in syntax_errors],
+        "local_check": True
+    }
+
+def _check_code_chunk(code, language, chunk=None, semantic_only=False):
+    """
+    Проверяет один фрагмент кода через Cloudflare AI
+    
+    Args:
+        code (str): Код фрагмента
+        language (str): Язык программирования
+        chunk (CodeUnit): Положение фрагмента в файле (None - весь файл)
+        semantic_only (bool): Локальная проверка синтаксиса не нашла ошибок
+        
+    Returns:
+        dict: Результаты проверки; при сбое содержит failed=True
+    """
+    chunk_note = ""
+    if chunk is not None:
+        chunk_note = (f"\n        Это фрагмент большого файла (строки {chunk.start_line}-{chunk.end_line}). "
+                      f"Номера строк указывайте от начала фрагмента, начиная с 1.")
+    if semantic_only and language == "python":
+        chunk_note += ("\n        Синтаксис кода уже проверен компилятором и корректен: "
+                       "ищите логические ошибки и стилевые проблемы.")
+    elif semantic_only:
+        # Для остальных языков локально проверен только баланс скобок, строк и комментариев
+        chunk_note += ("\n        Скобки, строки и комментарии в коде сбалансированы; "
+                       "остальные синтаксические ошибки ищите сами.")
+    
     try:
         system_message = f"""Вы опытный программист на {language}. 
-        Проверьте следующий код на наличие синтаксических ошибок, логических ошибок и стилевых проблем.
+        Проверьте следующий код на наличие синтаксических ошибок, логических ошибок и стилевых проблем.{chunk_note}
         Верните результаты проверки в формате JSON:
         {{
           "has_errors": true,
@@ -263,48 +482,26 @@ def check_code_errors(code, language):
         }}
         """
         
-        # Подготавливаем параметры запроса
-        url = f"{CLOUDFLARE_AI_URL}@cf/meta/llama-3-8b-instruct"
-        url = url.replace("{account_id}", CLOUDFLARE_ACCOUNT_ID)
+        # Запрос через общий шлюз Cloudflare (модель llama3-8b)
+        response = _chat_completion(system_message, code, "error_check")
         
-        headers = {
-            "Authorization": f"Bearer {CLOUDFLARE_AI_TOKEN}",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "messages": [
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": code}
-            ],
-            "stream": False
-        }
-        
-        response = requests.post(url, headers=headers, json=data)
-        
-        if response.status_code != 200:
-            logger.error(f"Ошибка при запросе к Cloudflare AI Workers: {response.status_code} - {response.text}")
+        if not response.get("success"):
+            logger.error(f"Ошибка при запросе к Cloudflare AI Workers: {response.get('error')}")
             return {
                 "has_errors": False,
                 "errors": [],
-                "suggestions": ["Ошибка при получении ответа от Cloudflare AI"]
+                "suggestions": ["Ошибка при получении ответа от Cloudflare AI"],
+                "failed": True
             }
         
         # Парсим ответ
-        response_data = response.json()
-        result_text = response_data.get("result", {}).get("response", "")
+        result_text = response.get("text", "")
         
         # Пытаемся извлечь JSON из текстового ответа
         try:
-            # Извлекаем JSON из текста (может быть обернут в markdown блоки)
-            if "```json" in result_text:
-                json_text = result_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in result_text:
-                json_text = result_text.split("```")[1].split("```")[0].strip()
-            else:
-                json_text = result_text
-            
-            result = json.loads(json_text)
+            # Извлекаем JSON из текста (может быть обернут в markdown блоки, с типичными дефектами модели)
+            with span("ai.extract_json", chars=len(result_text)):
+                result = extract_json(result_text, expected_keys=("errors", "has_errors"))
             return result
         except Exception as json_e:
             logger.error(f"Ошибка при парсинге JSON ответа: {str(json_e)}")
@@ -312,7 +509,8 @@ def check_code_errors(code, language):
                 "has_errors": False,
                 "errors": [],
                 "suggestions": ["Не удалось получить структурированный ответ"],
-                "raw_response": result_text
+                "raw_response": result_text,
+                "failed": True
             }
         
     except Exception as e:
@@ -322,9 +520,128 @@ def check_code_errors(code, language):
         return {
             "has_errors": False,
             "errors": [],
-            "suggestions": ["Ошибка API при проверке кода"]
+            "suggestions": ["Ошибка API при проверке кода"],
+            "failed": True
         }
 
+def _get_analysis_executor():
+    """Общий пул потоков для параллельной проверки фрагментов (создаётся при первом использовании)"""
+    global _analysis_executor
+    if _analysis_executor is None:
+        with _analysis_executor_lock:
+            if _analysis_executor is None:
+                _analysis_executor = ThreadPoolExecutor(
+                    max_workers=Config.ERROR_CHECK_MAX_PARALLEL, thread_name_prefix="codevai-analysis"
+                )
+    return _analysis_executor
+
+def check_code_chunks(chunks, language, semantic_only=False):
+    """
+    Проверяет фрагменты кода параллельно
+    
+    Args:
+        chunks (list): Фрагменты CodeUnit
+        language (str): Язык программирования
+        semantic_only (bool): Синтаксис уже проверен локально
+        
+    Returns:
+        list: Результаты проверки в порядке фрагментов (строки от начала фрагмента);
+              при сбое результат содержит failed=True
+    """
+    executor = _get_analysis_executor()
+    
+    # Каждой задаче своя копия контекста, чтобы span'ы трассировки вкладывались в запрос
+    futures = [
+        executor.submit(contextvars.copy_context().run, _check_code_chunk,
+                        chunk.text, language, chunk, semantic_only)
+        for chunk in chunks
+    ]
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            logger.error(f"Ошибка при проверке фрагмента: {str(e)}")
+            results.append({"failed": True})
+    
+    return results
+
+def _remap_line(line, chunk):
+    try:
+        return int(line) + chunk.start_line - 1
+    except (TypeError, ValueError):
+        return line
+
+def merge_chunk_results(chunks, results):
+    """
+    Объединяет результаты проверки фрагментов в результат для всего файла
+    
+    Номера строк ошибок переводятся в номера строк файла, повторяющиеся
+    ошибки и предложения удаляются, исправленный код собирается из
+    исправленных фрагментов (или исходных, если исправления нет).
+    
+    Args:
+        chunks (list): Фрагменты CodeUnit
+        results (list): Результаты _check_code_chunk в том же порядке
+        
+    Returns:
+        dict: has_errors, errors, suggestions, corrected_code и сведения о фрагментах
+    """
+    errors = []
+    seen_errors = set()
+    suggestions = []
+    seen_suggestions = set()
+    corrected_parts = []
+    has_corrections = False
+    failed_chunks = []
+    
+    for chunk, result in zip(chunks, results):
+        if result.get("failed"):
+            failed_chunks.append(f"{chunk.start_line}-{chunk.end_line}")
+        
+        for error in result.get("errors") or []:
+            if not isinstance(error, dict):
+                continue
+            error = dict(error)
+            if "line" in error:
+                error["line"] = _remap_line(error["line"], chunk)
+            key = (error.get("line"), " ".join(str(error.get("description", "")).split()).lower())
+            if key not in seen_errors:
+                seen_errors.add(key)
+                errors.append(error)
+        
+        for suggestion in result.get("suggestions") or []:
+            key = " ".join(str(suggestion).split()).lower()
+            if key and key not in seen_suggestions:
+                seen_suggestions.add(key)
+                suggestions.append(suggestion)
+        
+        corrected = result.get("corrected_code")
+        if isinstance(corrected, str) and corrected.strip():
+            has_corrections = True
+            if chunk.text.endswith("\n") and not corrected.endswith("\n"):
+                corrected += "\n"
+            corrected_parts.append(corrected)
+        else:
+            corrected_parts.append(chunk.text)
+    
+    errors.sort(key=lambda error: error.get("line") if isinstance(error.get("line"), int) else 0)
+    
+    if failed_chunks:
+        suggestions.append(f"Не удалось проверить строки {', '.join(failed_chunks)}")
+    
+    merged = {
+        "has_errors": bool(errors),
+        "errors": errors,
+        "suggestions": suggestions,
+        "chunks": len(chunks),
+        "failed_chunks": failed_chunks
+    }
+    if has_corrections:
+        merged["corrected_code"] = "".join(corrected_parts)
+    return merged
+
+@traced("ai.detect_language")
 def detect_language(code):
     """
     Определяет язык программирования по коду
@@ -349,27 +666,11 @@ def detect_language(code):
         Верните только название языка в нижнем регистре (например, "python", "javascript", "java", "cpp", "rust").
         """
         
-        # Подготавливаем параметры запроса
-        url = f"{CLOUDFLARE_AI_URL}@cf/meta/llama-3-8b-instruct"
-        url = url.replace("{account_id}", CLOUDFLARE_ACCOUNT_ID)
-        
-        headers = {
-            "Authorization": f"Bearer {CLOUDFLARE_AI_TOKEN}",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "messages": [
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": code}
-            ],
-            "stream": False
-        }
-        
-        response = requests.post(url, headers=headers, json=data)
+        # Запрос через общий шлюз Cloudflare (модель llama3-8b)
+        response = _chat_completion(system_message, code, "detection")
         
-        if response.status_code != 200:
-            logger.error(f"Ошибка при запросе к Cloudflare AI Workers: {response.status_code} - {response.text}")
+        if not response.get("success"):
+            logger.error(f"Ошибка при запросе к Cloudflare AI Workers: {response.get('error')}")
             # В случае ошибки используем простое определение
             if "def " in code and ":" in code:
                 return "python"
@@ -379,8 +680,7 @@ def detect_language(code):
                 return "unknown"
         
         # Парсим ответ
-        response_data = response.json()
-        result_text = response_data.get("result", {}).get("response", "").strip().lower()
+        result_text = response.get("text", "").strip().lower()
         
         # Проверяем, что ответ является одним из известных языков
         known_languages = ["python", "javascript", "java", "cpp", "rust", "go", "php", "ruby", "c#", "typescript"]
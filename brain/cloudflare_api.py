@@ -5,13 +5,18 @@ This module provides a clean interface for working with Cloudflare AI models and
 """
 
 import os
-import requests
 import json
 import logging
 import time
 import base64
 import traceback
 from typing import Dict, List, Any, Optional, Union
+from utils.metrics import record_upstream_call
+from utils.upstream import post_with_retries
+from utils.deadline import DeadlineExceeded
+from utils.image_cache import image_cache
+from utils.image_upload import BufferReader, classification_cache, decode_base64_image, image_digest
+from utils.embedding_store import embedding_stores, text_digest
 
 logger = logging.getLogger(__name__)
 
@@ -20,7 +25,8 @@ CLOUDFLARE_AI_TOKEN = os.environ.get("CLOUDFLARE_AI_TOKEN")
 CLOUDFLARE_ACCOUNT_ID = os.environ.get("CLOUDFLARE_ACCOUNT_ID")
 
 # Base URLs for Cloudflare services
-CF_AI_BASE_URL = "https://api.cloudflare.com/client/v4/accounts/{account_id}/ai/run/"
+CF_API_BASE_URL = os.environ.get("CLOUDFLARE_API_BASE_URL", "https://api.cloudflare.com/client/v4").rstrip("/")
+CF_AI_BASE_URL = CF_API_BASE_URL + "/accounts/{account_id}/ai/run/"
 
 # Available AI models
 CF_MODELS = {
@@ -51,13 +57,15 @@ class CloudflareAI:
         if not self.token or not self.account_id:
             logger.warning("Cloudflare credentials missing. Some features will not work.")
     
-    def _make_request(self, model_key: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    def _make_request(self, model_key: str, data: Optional[Dict[str, Any]] = None,
+                      content: Optional[Union[bytes, bytearray, memoryview]] = None) -> Dict[str, Any]:
         """
         Make a request to Cloudflare AI API
         
         Args:
             model_key: The model identifier (from CF_MODELS or direct path)
             data: Request payload specific to the model
+            content: Raw binary input sent as the body instead of the JSON payload
             
         Returns:
             Dict with response or error information
@@ -77,11 +85,12 @@ class CloudflareAI:
             
             headers = {
                 "Authorization": f"Bearer {self.token}",
-                "Content-Type": "application/json"
+                "Content-Type": "application/json" if content is None else "application/octet-stream"
             }
+            body = {"json": data} if content is None else {"data": BufferReader(content)}
             
-            # Make the request with a reasonable timeout
-            response = requests.post(url, headers=headers, json=data, timeout=30)
+            # Make the request with a reasonable timeout, retrying 429/5xx within the shared limit
+            response, duration = post_with_retries(model_key, url, headers=headers, timeout=30, **body)
             
             if response.status_code != 200:
                 logger.error(f"Cloudflare API error: {response.status_code} - {response.text}")
@@ -91,11 +100,29 @@ class CloudflareAI:
                     "details": response.text
                 }
             
+            if response.headers.get("Content-Type", "").startswith("image/"):
+                record_upstream_call(model_key, response.status_code, duration)
+                return {
+                    "success": True,
+                    "content": response.content
+                }
+            
+            result = response.json()
+            usage = result.get("result", {}).get("usage") if isinstance(result.get("result"), dict) else None
+            record_upstream_call(model_key, response.status_code, duration, usage)
+            
             return {
                 "success": True,
-                "result": response.json()
+                "result": result
             }
             
+        except DeadlineExceeded as e:
+            logger.info(f"Cloudflare AI request to {model_key} stopped: {str(e)}")
+            return {
+                "success": False,
+                "error": str(e),
+                "deadline_exceeded": True
+            }
         except Exception as e:
             logger.error(f"Error making Cloudflare AI request: {str(e)}")
             logger.debug(traceback.format_exc())
@@ -180,35 +207,49 @@ class CloudflareAI:
         """
         Generate an image from a text prompt using Stable Diffusion
         
+        A repeated prompt is answered from the on-disk image cache.
+        
         Args:
             prompt: Text description of the desired image
             
         Returns:
-            Dict with image data (base64) or error
+            Dict with image data (base64) and the cached PNG path, or error
         """
-        data = {
-            "prompt": prompt
-        }
-        
-        response = self._make_request("stable-diffusion", data)
+        key = image_cache.key_for("stable-diffusion", prompt)
+        image = image_cache.read(key)
+        path = image_cache.path_for(key)
         
-        if response.get("success"):
+        if image is None:
+            data = {
+                "prompt": prompt
+            }
+            
+            response = self._make_request("stable-diffusion", data)
+            
+            if not response.get("success"):
+                return response
+            
             try:
                 # Extract image data from response
-                image_b64 = response["result"]["result"]["images"][0]
-                return {
-                    "success": True,
-                    "image_b64": image_b64
-                }
-            except (KeyError, IndexError) as e:
+                if "content" in response:
+                    image = response["content"]
+                else:
+                    image = base64.b64decode(response["result"]["result"]["images"][0])
+            except (KeyError, IndexError, TypeError, ValueError) as e:
                 logger.error(f"Error extracting image from response: {str(e)}")
                 return {
                     "success": False,
                     "error": "Invalid image response format",
                     "raw_response": response.get("result")
                 }
+            path = image_cache.store(key, image)
         
-        return response
+        image_b64 = base64.b64encode(image).decode("ascii")
+        return {
+            "success": True,
+            "image_b64": image_b64,
+            "path": path
+        }
     
     def moderate_content(self, text: str) -> Dict[str, Any]:
         """
@@ -226,37 +267,72 @@ class CloudflareAI:
         
         return self._make_request("moderation", data)
     
-    def classify_image(self, image_b64: str) -> Dict[str, Any]:
+    def classify_image(self, image: Union[str, bytes, bytearray, memoryview]) -> Dict[str, Any]:
         """
         Classify an image using ResNet-50
         
         Args:
-            image_b64: Base64-encoded image data
+            image: Image bytes, or base64-encoded image data
             
         Returns:
             Dict with classification results
         """
-        data = {
-            "image": image_b64
-        }
+        if isinstance(image, str):
+            try:
+                image = decode_base64_image(image)
+            except ValueError as e:
+                return {
+                    "success": False,
+                    "error": f"Invalid image data: {str(e)}"
+                }
         
-        return self._make_request("image-classification", data)
+        digest = image_digest(image)
+        cached = classification_cache.get(digest)
+        if cached is not None:
+            return {
+                "success": True,
+                "result": cached,
+                "cached": True
+            }
+        
+        response = self._make_request("image-classification", content=image)
+        
+        if response.get("success"):
+            classification_cache.set(digest, response["result"])
+        return response
     
     def get_text_embedding(self, text: str) -> Dict[str, Any]:
         """
         Get vector embedding for text
         
+        A text embedded before is answered from the embedding store.
+        
         Args:
             text: Text to embed
             
         Returns:
             Dict with embedding vector
         """
-        data = {
-            "text": text
-        }
+        store = embedding_stores.get(CF_MODELS["text-embeddings"])
+        digest = text_digest(text)
+        vector = store.get_many([digest]).get(digest)
+        if vector is not None:
+            return {
+                "success": True,
+                "result": {"result": {"shape": [1, len(vector)], "data": [vector]}},
+                "cached": True
+            }
+        
+        # A one-text list: the response always holds a matrix of vectors
+        response = self._make_request("text-embeddings", {"text": [text]})
         
-        return self._make_request("text-embeddings", data)
+        data = response.get("result", {}).get("result", {}).get("data") if response.get("success") else None
+        if isinstance(data, list) and len(data) == 1:
+            try:
+                store.add_many({digest: data[0]})
+            except (OSError, ValueError) as e:
+                logger.warning(f"Embedding not stored: {str(e)}")
+        return response
     
     def translate_text(self, text: str, target_language: str) -> Dict[str, Any]:
         """
@@ -24,6 +24,8 @@ import re
 from brain.web_access import get_webpage_content, search_programming_solutions, is_valid_url
 from brain.cloudflare_ai import get_ai_thinking
 from utils.learning_utils import record_model_update
+from utils.metrics import registry, crawler_pages, crawler_latency, crawler_queue_depth, knowledge_items
+from utils.tracing import start_trace, traced
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -38,7 +40,7 @@ LEARNING_ACTIVE = True
 url_queue = deque(maxlen=1000)
 # Set for tracking processed URLs to avoid duplicates
 processed_urls = set()
-# Knowledge base
+# Knowledge base, loaded lazily on first use by get_knowledge_base()
 knowledge_base = {
     "programming_languages": {},
     "libraries": {},
@@ -48,27 +50,52 @@ knowledge_base = {
     "last_updated": None
 }
 
+knowledge_base_loaded = False
+knowledge_base_lock = threading.Lock()
+
+# Expose queue and knowledge base size as metrics, computed at scrape time
+crawler_queue_depth.set_function(lambda: len(url_queue))
+knowledge_items.set_function(lambda: count_knowledge_items() if knowledge_base_loaded else None)
+
 # Thread for continuous learning
 learning_thread = None
 is_learning = False
 
+def get_knowledge_base():
+    """
+    Return the knowledge base, loading it from file on first use
+
+    The dict is updated in place, so references imported from this module
+    stay valid after loading.
+    """
+    if not knowledge_base_loaded:
+        with knowledge_base_lock:
+            if not knowledge_base_loaded:
+                load_knowledge_base()
+    return knowledge_base
+
 def load_knowledge_base():
     """Load the knowledge base from file"""
-    global knowledge_base
+    global knowledge_base_loaded
     try:
         if os.path.exists(KNOWLEDGE_FILE):
             with open(KNOWLEDGE_FILE, 'r') as f:
-                knowledge_base = json.load(f)
-                logger.info(f"Knowledge base loaded with {count_knowledge_items()} items")
+                loaded = json.load(f)
+            knowledge_base.clear()
+            knowledge_base.update(loaded)
+            knowledge_base_loaded = True
+            logger.info(f"Knowledge base loaded with {count_knowledge_items()} items")
         else:
             logger.info("No knowledge base found, creating a new one")
             # Create directories if they don't exist
             os.makedirs(os.path.dirname(KNOWLEDGE_FILE), exist_ok=True)
+            knowledge_base_loaded = True
             save_knowledge_base()
     except Exception as e:
         logger.error(f"Error loading knowledge base: {str(e)}")
         logger.debug(traceback.format_exc())
 
+@traced("knowledge_base.save")
 def save_knowledge_base():
     """Save the knowledge base to file"""
     try:
@@ -82,9 +109,9 @@ def save_knowledge_base():
 def count_knowledge_items():
     """Count total items in the knowledge base"""
     count = 0
-    for category in knowledge_base:
+    for category, items in get_knowledge_base().items():
         if category != "last_updated":
-            count += len(knowledge_base[category])
+            count += len(items)
     return count
 
 def add_url_to_queue(url):
@@ -159,6 +186,7 @@ def extract_knowledge_from_content(content, url, topic=None):
         logger.debug(traceback.format_exc())
         return None
 
+@traced("knowledge_base.update")
 def update_knowledge_base(knowledge_data, category=None):
     """
     Update the knowledge base with new information
@@ -170,6 +198,8 @@ def update_knowledge_base(knowledge_data, category=None):
     if not knowledge_data:
         return
     
+    get_knowledge_base()
+    
     try:
         # If category provided, add to that category
         if category and category in knowledge_base:
@@ -221,6 +251,19 @@ def process_url(url):
         logger.debug(f"URL already processed: {url}")
         return False
     
+    start_time = time.time()
+    # The background crawler starts its own trace; within a request this is a child span
+    with start_trace("crawler.process_url", url=url) as trace_span:
+        success = _process_url(url)
+        trace_span.set_attribute("success", success)
+    crawler_latency.observe(time.time() - start_time)
+    crawler_pages.inc(result="success" if success else "failure")
+    # The worker running the crawler may serve no requests, which flush otherwise
+    registry.flush()
+    return success
+
+def _process_url(url):
+    """Fetch a URL, extract its knowledge and store it in the knowledge base"""
     try:
         logger.info(f"Processing URL: {url}")
         
@@ -318,8 +361,8 @@ def continuous_learning_task():
     try:
         logger.info("Starting continuous learning task")
         
-        # Load the knowledge base
-        load_knowledge_base()
+        # Make sure the knowledge base is loaded
+        get_knowledge_base()
         
         # Discover new URLs if queue is empty
         if len(url_queue) == 0:
@@ -340,6 +383,7 @@ def continuous_learning_task():
             # Just log the info instead
             logger.info(f"Continuous learning completed. Processed {urls_processed} URLs.")
         
+        registry.flush(force=True)
         is_learning = False
     except Exception as e:
         logger.error(f"Error in continuous learning task: {str(e)}")
@@ -365,8 +409,8 @@ def start_continuous_learning():
     Initialize the continuous learning system
     """
     try:
-        # Load the knowledge base
-        load_knowledge_base()
+        # Make sure the knowledge base is loaded
+        get_knowledge_base()
         
         # Start learning thread
         start_continuous_learning_thread()
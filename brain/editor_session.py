@@ -0,0 +1,409 @@
+"""
+Editor sessions: one server-side state per open editor buffer
+
+Completion, error-check and language-detection requests for a buffer go
+through its session. A request first waits for the debounce interval; if a
+newer request of the same kind arrives meanwhile, the older one is
+coalesced into it and returns without calling upstream. A newer request
+that arrives while the older one is already running cancels it: its
+upstream calls run in a cancel scope, so queued calls and retries are not
+started and a streamed completion is closed between tokens.
+
+Gunicorn workers do not route a buffer's requests to one process, so the
+request numbers and stats of a session are kept in one small JSON file per
+session in EDITOR_SESSION_DIR, updated under an exclusive file lock. Any
+worker can tell that a request was superseded: a waiting request compares
+its number with the file after the debounce interval, and a watcher thread
+in each worker polls the files of its running requests and cancels the
+stale ones. Requests that land on the same worker are also woken and
+cancelled directly, without waiting for the watcher. Workers of one host
+share the files.
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import fcntl
+import logging
+import threading
+from config import Config
+from utils.cache import LRUCache
+from utils.metrics import editor_requests
+from utils.upstream import cancel_scope, check_cancelled, UpstreamCancelledError
+
+logger = logging.getLogger(__name__)
+
+REQUEST_KINDS = ("complete", "check", "detect")
+OUTCOMES = ("completed", "coalesced", "cancelled", "failed")
+
+# Ids are issued by create(): uuid4().hex
+_SESSION_ID = re.compile(r"^[0-9a-f]{32}$")
+
+# How often a worker checks whether its running requests were superseded elsewhere
+WATCH_INTERVAL = 0.1
+
+def _run_complete(session, data):
+    from brain.cloudflare_ai import CLOUDFLARE_AI_TOKEN, get_code_completion, stream_code_completion
+    from utils.completion_index import completion_index
+    from utils.model_router import model_router
+    from utils.ngram_model import ngram_models
+
+    code, language = data["code"], data["language"]
+    max_tokens = data.get("max_tokens", 100)
+
+    completion_index.refresh()
+    known = completion_index.lookup(code, language)
+    if known:
+        return {"completion": known["completion"], "source": known["source"]}
+
+    if CLOUDFLARE_AI_TOKEN and model_router.available("completion"):
+        # A streaming request can be aborted between tokens when the user keeps typing
+        for event in stream_code_completion(code, language, max_tokens):
+            if "completion" in event:
+                return {"completion": event["completion"], "source": "model", "model": event.get("model")}
+            if "error" in event:
+                break
+        check_cancelled()
+
+    local = ngram_models.complete(code, language)
+    if local:
+        return {"completion": local, "source": "ngram"}
+    return {"completion": get_code_completion(code, language, max_tokens), "source": "model"}
+
+def _run_check(session, data):
+    from brain.incremental_analysis import incremental_analyzer
+    return incremental_analyzer.analyze(data["code"], data["language"], session_id=session.id, mode=data.get("mode"))
+
+def _run_detect(session, data):
+    from brain.cloudflare_ai import detect_language
+    detected = detect_language(data["code"])
+    return {"detected_language": detected, "supported": detected in Config.SUPPORTED_LANGUAGES}
+
+_HANDLERS = {"complete": _run_complete, "check": _run_check, "detect": _run_detect}
+
+class SessionFiles:
+    """Request numbers and stats of every session, one locked JSON file each"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, session_id):
+        return os.path.join(self.directory, f"{session_id}.json")
+
+    @staticmethod
+    def _new_state():
+        now = time.time()
+        return {
+            "created": now,
+            "last_active": now,
+            "latest": {},           # kind -> number of the latest request
+            "running": {},          # kind -> number of the running request
+            "stats": {
+                kind: dict({outcome: 0 for outcome in OUTCOMES}, requests=0, busy_seconds=0.0)
+                for kind in REQUEST_KINDS
+            }
+        }
+
+    def update(self, session_id, change, create=False):
+        """
+        Change a session's state under the file lock
+
+        Args:
+            session_id (str): Session id
+            change (callable): Called with the state dict, may modify it
+            create (bool): Start a new state when the session has no file
+
+        Returns:
+            The result of change, or None when the session has no file and
+            create is False
+        """
+        path = self._path(session_id)
+        if create:
+            os.makedirs(self.directory, exist_ok=True)
+            f = open(path, "a+")
+        else:
+            try:
+                f = open(path, "r+")
+            except FileNotFoundError:
+                return None
+        with f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                raw = f.read()
+                state = json.loads(raw) if raw else self._new_state()
+                result = change(state)
+                f.seek(0)
+                f.truncate()
+                json.dump(state, f)
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return result
+
+    def read(self, session_id):
+        """State of a session, or None when it has no file"""
+        try:
+            with open(self._path(session_id)) as f:
+                fcntl.flock(f, fcntl.LOCK_SH)
+                raw = f.read()
+        except FileNotFoundError:
+            return None
+        return json.loads(raw) if raw else None
+
+    def latest(self, session_id, kind):
+        """Number of the latest request of a kind, or None for a closed session"""
+        state = self.read(session_id)
+        return state["latest"].get(kind) if state else None
+
+    def remove(self, session_id):
+        """Delete a session's file and return its last state"""
+        state = self.read(session_id)
+        try:
+            os.remove(self._path(session_id))
+        except FileNotFoundError:
+            return None
+        return state
+
+    def prune(self, max_sessions):
+        """Delete the files of the least recently used sessions beyond max_sessions"""
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith(".json")]
+        except FileNotFoundError:
+            return
+        if len(entries) <= max_sessions:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - max_sessions]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+class SupersededWatcher:
+    """Cancels this worker's running requests once a newer one was submitted anywhere"""
+
+    def __init__(self, files, interval=WATCH_INTERVAL):
+        self.files = files
+        self.interval = interval
+        self._watched = {}      # cancel event -> (session id, kind, request number)
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def watch(self, cancel, session_id, kind, number):
+        with self._condition:
+            self._watched[cancel] = (session_id, kind, number)
+            # Threads don't survive fork, so the watcher is started again in each worker
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="codevai-editor-watcher")
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notify()
+
+    def unwatch(self, cancel):
+        with self._condition:
+            self._watched.pop(cancel, None)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._watched:
+                    self._condition.wait()
+                watched = list(self._watched.items())
+
+            for cancel, (session_id, kind, number) in watched:
+                try:
+                    if self.files.latest(session_id, kind) != number:
+                        cancel.set()
+                except (OSError, ValueError) as e:
+                    logger.debug(f"Editor session {session_id} state not readable: {str(e)}")
+            time.sleep(self.interval)
+
+class EditorSession:
+    """This worker's handle on a session: debounces, coalesces and cancels its requests"""
+
+    def __init__(self, session_id, files, watcher, debounce=0.3):
+        self.id = session_id
+        self.files = files
+        self.watcher = watcher
+        self.debounce = debounce
+        self._condition = threading.Condition()
+        self._latest = {}       # kind -> number of the latest request seen by this worker
+        self._running = {}      # kind -> cancel event of the request running in this worker
+        self.closed = False
+
+    def _update(self, change, create=False):
+        return self.files.update(self.id, change, create=create)
+
+    def _finish(self, kind, outcome, number, elapsed=None, **response):
+        def record(state):
+            state["stats"][kind][outcome] += 1
+            if elapsed is not None:
+                state["stats"][kind]["busy_seconds"] += elapsed
+            if state["running"].get(kind) == number:
+                del state["running"][kind]
+        self._update(record)
+        editor_requests.inc(kind=kind, outcome=outcome)
+        if elapsed is not None:
+            response["elapsed"] = elapsed
+        return dict(response, status=outcome, kind=kind, request=number)
+
+    def submit(self, kind, data):
+        """
+        Run a request unless a newer one of the same kind supersedes it
+
+        Args:
+            kind (str): 'complete', 'check' or 'detect'
+            data (dict): Request fields (code, language, ...)
+
+        Returns:
+            dict: status 'completed' with the result, or 'coalesced' /
+                  'cancelled' when a newer request took over
+        """
+        def begin(state):
+            number = state["latest"][kind] = state["latest"].get(kind, 0) + 1
+            state["last_active"] = time.time()
+            state["stats"][kind]["requests"] += 1
+            return number
+
+        # A closed or pruned session is reopened under the same id
+        number = self._update(begin, create=True)
+
+        with self._condition:
+            self._latest[kind] = number
+            running = self._running.get(kind)
+            if running is not None:
+                # The running request is stale - abort its upstream calls
+                running.set()
+            self._condition.notify_all()
+
+            superseded = self._condition.wait_for(
+                lambda: self.closed or self._latest[kind] != number, timeout=self.debounce)
+        if superseded or self.files.latest(self.id, kind) != number:
+            return self._finish(kind, "coalesced", number)
+
+        cancel = threading.Event()
+        with self._condition:
+            self._running[kind] = cancel
+
+        def mark_running(state):
+            state["running"][kind] = number
+        self._update(mark_running)
+        self.watcher.watch(cancel, self.id, kind, number)
+
+        start_time = time.time()
+        try:
+            with cancel_scope(cancel):
+                result = _HANDLERS[kind](self, data)
+        except UpstreamCancelledError:
+            result = None
+        except Exception as e:
+            logger.error(f"Editor session {self.id} {kind} request failed: {str(e)}")
+            return self._finish(kind, "failed", number, elapsed=time.time() - start_time, error=str(e))
+        finally:
+            self.watcher.unwatch(cancel)
+            with self._condition:
+                if self._running.get(kind) is cancel:
+                    del self._running[kind]
+
+        elapsed = time.time() - start_time
+        if cancel.is_set():
+            # A cancelled request's result may be built from placeholders - don't return it
+            return self._finish(kind, "cancelled", number, elapsed=elapsed)
+        return self._finish(kind, "completed", number, elapsed=elapsed, result=result)
+
+    def close(self):
+        """Cancel the requests running in this worker and release waiting ones"""
+        with self._condition:
+            self.closed = True
+            for cancel in self._running.values():
+                cancel.set()
+            self._condition.notify_all()
+
+def snapshot(session_id, state):
+    """Public view of a session's shared state"""
+    return {
+        "session_id": session_id,
+        "created": state["created"],
+        "idle_seconds": round(time.time() - state["last_active"], 3),
+        "running": sorted(state["running"]),
+        "requests": {kind: dict(values, busy_seconds=round(values["busy_seconds"], 3))
+                     for kind, values in state["stats"].items()}
+    }
+
+class EditorSessionManager:
+    """Editor sessions shared by all workers, with this worker's handles kept in an LRU"""
+
+    def __init__(self, directory, max_sessions=2000, debounce=0.3):
+        self.debounce = debounce
+        self.max_sessions = max_sessions
+        self.files = SessionFiles(directory)
+        self.watcher = SupersededWatcher(self.files)
+        self.sessions = LRUCache(max_sessions, name="editor_sessions")
+        self._lock = threading.Lock()
+
+    def _handle(self, session_id):
+        with self._lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = EditorSession(session_id, self.files, self.watcher, self.debounce)
+                self.sessions.set(session_id, session)
+            return session
+
+    def create(self):
+        session_id = uuid.uuid4().hex
+        self.files.update(session_id, lambda state: None, create=True)
+        self.files.prune(self.max_sessions)
+        return self._handle(session_id)
+
+    def get_or_create(self, session_id):
+        """
+        Handle on the session with the given id
+
+        A session created by another worker is served here as well; a
+        closed or pruned one is reopened under the same id instead of
+        failing the request.
+
+        Args:
+            session_id (str): Id returned by create()
+
+        Returns:
+            EditorSession: The session, or None for a malformed id
+        """
+        if not _SESSION_ID.match(session_id):
+            return None
+        return self._handle(session_id)
+
+    def snapshot(self, session_id):
+        """Request counts of a session opened by any worker, or None"""
+        if not _SESSION_ID.match(session_id):
+            return None
+        state = self.files.read(session_id)
+        return snapshot(session_id, state) if state else None
+
+    def close(self, session_id):
+        """
+        Close a session in every worker
+
+        Requests running here are cancelled at once, those running in other
+        workers once their watcher sees the session file gone.
+
+        Returns:
+            dict: The session's final snapshot, or None if it was not open
+        """
+        if not _SESSION_ID.match(session_id):
+            return None
+        session = self.sessions.pop(session_id)
+        if session is not None:
+            session.close()
+        state = self.files.remove(session_id)
+        return snapshot(session_id, state) if state else None
+
+# Sessions shared by all workers; each worker keeps its own handles
+editor_sessions = EditorSessionManager(
+    Config.EDITOR_SESSION_DIR,
+    max_sessions=Config.EDITOR_SESSION_CACHE_SIZE,
+    debounce=Config.EDITOR_DEBOUNCE
+)
@@ -0,0 +1,237 @@
+"""
+Incremental error checking for editor sessions
+
+The buffer is split into top-level units (functions, classes and the code
+between them). Each unit is identified by a hash of its normalized content,
+and its analysis is cached with line numbers relative to the unit. Only the
+units that are not in the cache are sent upstream, packed into
+token-budgeted chunks, so an edit inside one function costs one small
+upstream call. Units that merely moved are served from the cache.
+
+Each session remembers the errors of its previous check, so the response
+can say which errors appeared and which were resolved.
+
+Syntax errors are found by the local checker first; while the buffer does
+not compile, no unit is sent upstream.
+"""
+
+import uuid
+import hashlib
+import logging
+from config import Config
+from utils.cache import LRUCache
+from utils.code_chunking import split_units, CodeUnit, CHARS_PER_TOKEN
+from utils.syntax_check import check_syntax
+from utils.tracing import traced
+
+logger = logging.getLogger(__name__)
+
+def normalize_unit(text):
+    """
+    Normalize a unit for hashing
+
+    Returns:
+        tuple: (normalized text, number of leading blank lines dropped)
+    """
+    lines = [line.rstrip() for line in text.replace("\r\n", "\n").split("\n")]
+    leading = 0
+    while leading < len(lines) and not lines[leading]:
+        leading += 1
+    while lines and not lines[-1]:
+        lines.pop()
+    return "\n".join(lines[leading:]), leading
+
+def _error_identity(unit_hash, error):
+    description = " ".join(str(error.get("description", "")).split()).lower()
+    return (unit_hash, error.get("line"), description)
+
+def _line_of(item):
+    try:
+        return int(item.get("line"))
+    except (TypeError, ValueError):
+        return None
+
+def _owner(members, line):
+    """Unit whose lines contain a chunk line; the chunk's first unit when the line is unknown"""
+    if line is not None:
+        for member in members:
+            if member[1] <= line < member[1] + member[2]:
+                return member
+    return members[0]
+
+class IncrementalAnalyzer:
+    """Per-unit cached error checking with per-session diffs"""
+
+    def __init__(self, max_units=20000, max_sessions=2000):
+        self.unit_results = LRUCache(max_units, name="analysis_units")
+        self.sessions = LRUCache(max_sessions, name="analysis_sessions")
+
+    def _pack(self, units, max_chars):
+        """Pack changed units into chunks; returns (chunk, [(unit_hash, first line in chunk, line count)])"""
+        packed = []
+        lines, members, size = [], [], 0
+
+        def flush():
+            if lines:
+                text = "\n".join(lines) + "\n"
+                packed.append((CodeUnit(1, len(lines), text), list(members)))
+                lines.clear()
+                members.clear()
+
+        for unit_hash, text in units:
+            if lines and size + len(text) > max_chars:
+                flush()
+                size = 0
+            unit_lines = text.split("\n")
+            members.append((unit_hash, len(lines) + 1, len(unit_lines)))
+            lines.extend(unit_lines)
+            size += len(text)
+        flush()
+        return packed
+
+    def _analyze_units(self, language, pending, semantic_only):
+        """Check units that are not cached and store their results"""
+        from brain.cloudflare_ai import check_code_chunks
+
+        packed = self._pack(pending, Config.ERROR_CHECK_CHUNK_TOKENS * CHARS_PER_TOKEN)
+        results = check_code_chunks([chunk for chunk, _ in packed], language, semantic_only)
+        failed = set()
+
+        for (chunk, members), result in zip(packed, results):
+            if result.get("failed"):
+                failed.update(unit_hash for unit_hash, _, _ in members)
+                continue
+
+            # Each error and suggestion goes to a single unit: otherwise a chunk's suggestion
+            # would repeat in the response once per unit in the chunk
+            per_unit = {unit_hash: {"errors": [], "suggestions": []} for unit_hash, _, _ in members}
+            for error in result.get("errors") or []:
+                if not isinstance(error, dict):
+                    continue
+                line = _line_of(error)
+                owner = _owner(members, line)
+                error = dict(error)
+                error["line"] = line - owner[1] + 1 if line is not None and owner[1] <= line else None
+                per_unit[owner[0]]["errors"].append(error)
+            for suggestion in result.get("suggestions") or []:
+                line = _line_of(suggestion) if isinstance(suggestion, dict) else None
+                per_unit[_owner(members, line)[0]]["suggestions"].append(suggestion)
+
+            for unit_hash, unit_result in per_unit.items():
+                self.unit_results.set((language, semantic_only, unit_hash), unit_result)
+
+        return failed
+
+    def _finish(self, session_id, current, errors, suggestions, units, **extra):
+        """Store the session's errors and build the response with the diff"""
+        previous = self.sessions.get(session_id) or {}
+        self.sessions.set(session_id, current)
+
+        errors.sort(key=lambda error: error["line"] if isinstance(error.get("line"), int) else 0)
+        return dict({
+            "has_errors": bool(errors),
+            "errors": errors,
+            "suggestions": suggestions,
+            "session_id": session_id,
+            "units": units,
+            "diff": {
+                "added": [error for identity, error in current.items() if identity not in previous],
+                "resolved": [error for identity, error in previous.items() if identity not in current],
+                "unchanged": sum(1 for identity in current if identity in previous)
+            }
+        }, **extra)
+
+    @traced("ai.check_code_incremental")
+    def analyze(self, code, language, session_id=None, mode=None):
+        """
+        Check a buffer, re-analyzing only units that changed since they were last seen
+
+        Args:
+            code (str): Whole editor buffer
+            language (str): Programming language
+            session_id (str): Editor session to diff against (optional, created when missing)
+            mode (str): 'semantic', 'local' or 'llm' (default: Config.ERROR_CHECK_MODE)
+
+        Returns:
+            dict: Merged errors and suggestions, unit counts and the diff
+                  against the session's previous check
+        """
+        from brain.cloudflare_ai import CLOUDFLARE_AI_TOKEN, check_code_errors, local_check_result
+
+        session_id = session_id or uuid.uuid4().hex
+        mode = mode or Config.ERROR_CHECK_MODE
+
+        syntax_errors = check_syntax(code, language) if mode != "llm" else None
+        if syntax_errors or mode == "local":
+            result = local_check_result(syntax_errors or [])
+            current = {_error_identity(None, error): error for error in result["errors"]}
+            return self._finish(session_id, current, list(result["errors"]), result["suggestions"],
+                                {"total": 0, "analyzed": 0, "cached": 0, "failed": 0}, local_check=True)
+
+        if not CLOUDFLARE_AI_TOKEN:
+            # Without a token there is nothing to cache - return the placeholder response
+            return dict(check_code_errors(code, language, "llm"), session_id=session_id)
+
+        semantic_only = syntax_errors == []
+        units = []
+        pending = {}
+
+        for unit in split_units(code, language):
+            normalized, leading = normalize_unit(unit.text)
+            if not normalized:
+                continue
+            unit_hash = hashlib.sha256(normalized.encode()).hexdigest()
+            units.append((unit, unit_hash, leading))
+            if (language, semantic_only, unit_hash) not in self.unit_results:
+                pending[unit_hash] = normalized
+
+        failed = self._analyze_units(language, list(pending.items()), semantic_only) if pending else set()
+
+        errors = []
+        suggestions = []
+        seen_suggestions = set()
+        current = {}
+        failed_lines = []
+
+        for unit, unit_hash, leading in units:
+            result = self.unit_results.get((language, semantic_only, unit_hash))
+            if result is None:
+                if unit_hash in failed:
+                    failed_lines.append(f"{unit.start_line}-{unit.end_line}")
+                continue
+
+            offset = unit.start_line + leading - 1
+            for error in result["errors"]:
+                identity = _error_identity(unit_hash, error)
+                if identity in current:
+                    continue
+                error = dict(error)
+                if error.get("line") is not None:
+                    error["line"] += offset
+                current[identity] = error
+                errors.append(error)
+
+            for suggestion in result["suggestions"]:
+                key = " ".join(str(suggestion).split()).lower()
+                if key and key not in seen_suggestions:
+                    seen_suggestions.add(key)
+                    suggestions.append(suggestion)
+
+        if failed_lines:
+            suggestions.append(f"Не удалось проверить строки {', '.join(failed_lines)}")
+
+        reused = len(units) - len(pending)
+        logger.info(f"Incremental check: {len(units)} units, {len(pending)} analyzed, {reused} cached")
+
+        return self._finish(session_id, current, errors, suggestions, {
+            "total": len(units),
+            "analyzed": len(pending),
+            "cached": reused,
+            "failed": len(failed)
+        })
+
+# Process-wide analyzer shared by all editor sessions
+incremental_analyzer = IncrementalAnalyzer(
+    max_units=Config.ANALYSIS_UNIT_CACHE_SIZE,
+    max_sessions=Config.ANALYSIS_SESSION_CACHE_SIZE
+)
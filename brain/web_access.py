@@ -2,14 +2,60 @@
 Module for internet access and retrieving data for AI training
 """
 
+import time
 import requests
 import logging
 import traceback
-import trafilatura
 from urllib.parse import urlparse
+from urllib3.exceptions import ReadTimeoutError
+from config import Config
+from utils.tracing import span
+from utils.deadline import DeadlineExceeded, allows, ensure, mark_exceeded, timeout_for, trimmed
 
 logger = logging.getLogger(__name__)
 
+# Оценка скорости извлечения текста (секунд на байт HTML), уточняется по замерам
+_extract_seconds_per_byte = 5e-7
+
+def _download(url):
+    """
+    Download a page within WEB_FETCH_TIMEOUT and the request deadline
+
+    Returns:
+        bytes: Page body, or None when it failed, was too large or too slow
+
+    Raises:
+        DeadlineExceeded: When the request deadline ran out during the download
+    """
+    timeout = timeout_for("web_fetch", Config.WEB_FETCH_TIMEOUT)
+    give_up_at = time.monotonic() + timeout
+    body = bytearray()
+    try:
+        # Таймаут requests ограничивает каждое чтение, а не всю загрузку, поэтому сверяемся со временем по частям
+        with requests.get(url, timeout=timeout, stream=True,
+                          headers={"User-Agent": "Mozilla/5.0 (compatible; CodevAI)"}) as response:
+            if response.status_code != 200:
+                logger.error(f"Failed to load page {url}: HTTP {response.status_code}")
+                return None
+            while True:
+                # read1 отдаёт то, что уже пришло: iter_content ждал бы полного фрагмента
+                # и медленно приходящая страница проверялась бы по времени слишком редко
+                chunk = response.raw.read1(64 * 1024, decode_content=True)
+                if not chunk:
+                    break
+                body += chunk
+                if len(body) > Config.WEB_FETCH_MAX_BYTES:
+                    logger.error(f"Page {url} exceeds {Config.WEB_FETCH_MAX_BYTES} bytes")
+                    return None
+                if time.monotonic() > give_up_at:
+                    raise requests.Timeout(f"Download took longer than {timeout:.1f}s")
+    except (requests.Timeout, ReadTimeoutError):
+        if trimmed(Config.WEB_FETCH_TIMEOUT, timeout):
+            mark_exceeded("web_fetch")
+            raise DeadlineExceeded(f"Request deadline exceeded downloading {url}")
+        raise
+    return bytes(body)
+
 def is_valid_url(url):
     """
     Проверяет, является ли строка допустимым URL
@@ -40,15 +86,30 @@ def get_webpage_content(url):
         logger.error(f"Invalid URL: {url}")
         return None
     
+    global _extract_seconds_per_byte
+    
     try:
-        # Use trafilatura to extract clean text content
-        downloaded = trafilatura.fetch_url(url)
+        # trafilatura is heavy to import, so load it on first use
+        import trafilatura
+        
+        # Download within the request deadline, then extract clean text content with trafilatura
+        with span("web.fetch", url=url):
+            downloaded = _download(url)
         if downloaded:
-            text = trafilatura.extract(downloaded)
+            # Извлечение нельзя прервать, поэтому не начинаем его, если оно не успеет
+            ensure("extract", len(downloaded) * _extract_seconds_per_byte)
+            start_time = time.monotonic()
+            with span("trafilatura.extract", bytes=len(downloaded)):
+                text = trafilatura.extract(downloaded)
+            observed = (time.monotonic() - start_time) / len(downloaded)
+            _extract_seconds_per_byte = 0.8 * _extract_seconds_per_byte + 0.2 * observed
             return text
         else:
             logger.error(f"Failed to load page: {url}")
             return None
+    except DeadlineExceeded as e:
+        logger.info(f"Stopped retrieving {url}: {str(e)}")
+        return None
     except Exception as e:
         logger.error(f"Error retrieving content from page {url}: {str(e)}")
         logger.debug(traceback.format_exc())
@@ -58,6 +119,9 @@ def search_programming_solutions(query, language=None):
     """
     Performs search for programming solutions using various sources
     
+    Stops early when the request deadline leaves no time for another page,
+    returning the results found so far.
+    
     Args:
         query (str): Search query
         language (str, optional): Programming language
@@ -84,6 +148,11 @@ def search_programming_solutions(query, language=None):
         results = []
         
         for domain in domains:
+            if not allows(Config.WEB_FETCH_MIN_TIME):
+                mark_exceeded("web_search")
+                logger.info(f"Search for '{query}' stopped by the request deadline after {len(results)} results")
+                break
+            
             # Form search URL for each domain
             if domain == "stackoverflow.com":
                 url = f"https://stackoverflow.com/search?q={search_query}"
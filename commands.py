@@ -0,0 +1,33 @@
+"""
+Command line maintenance tasks, available through `flask --app main <command>`
+"""
+
+import logging
+import click
+from flask import Blueprint, current_app
+
+logger = logging.getLogger(__name__)
+
+# cli_group=None registers the commands at the top level of the flask CLI
+commands_bp = Blueprint('commands', __name__, cli_group=None)
+
+@commands_bp.cli.command('rebuild-feedback-aggregates')
+@click.option('--batch-size', default=1000, show_default=True, help='Feedback rows loaded per batch')
+def rebuild_feedback_aggregates_command(batch_size):
+    """Rebuild the feedback rollup tables from the feedback history"""
+    from utils.learning_utils import rebuild_feedback_aggregates
+
+    result = rebuild_feedback_aggregates(batch_size=batch_size)
+    click.echo(
+        f"Scanned {result['feedback_scanned']} feedback items, "
+        f"wrote {result['buckets']} hourly buckets for {result['languages']} languages"
+    )
+
+@commands_bp.cli.command('startup-report')
+def startup_report_command():
+    """Print how long each startup component took"""
+    report = current_app.extensions.get("startup_report", {})
+
+    for item in report.get("components", []):
+        click.echo(f"{item['component']:<24} {item['seconds'] * 1000:8.1f} ms  {item['modules_imported']:4d} modules")
+    click.echo(f"{'total':<24} {report.get('total_seconds', 0) * 1000:8.1f} ms")
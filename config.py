@@ -9,6 +9,9 @@ class Config:
     SQLALCHEMY_DATABASE_URI = 'sqlite:///instance/codevai.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Startup settings
+    BACKGROUND_SERVICES = os.environ.get('BACKGROUND_SERVICES', '').lower() in ('1', 'true', 'yes')
+    
     # API settings
     API_RATE_LIMIT = 100  # requests per hour
     
@@ -20,7 +23,88 @@ class Config:
     # Learning settings
     FEEDBACK_THRESHOLD = 10  # Number of feedback items before updating model weights
     LEARNING_RATE = 0.0001
+    MODEL_UPDATE_DEBOUNCE = float(os.environ.get('MODEL_UPDATE_DEBOUNCE', 5))  # Seconds of quiet before an update runs
+    MODEL_UPDATE_MAX_DELAY = float(os.environ.get('MODEL_UPDATE_MAX_DELAY', 60))  # Upper bound on how long an update waits
+    
+    # Upstream resilience
+    CIRCUIT_WINDOW = float(os.environ.get('CIRCUIT_WINDOW', 30))  # Seconds of calls a breaker looks at
+    CIRCUIT_MIN_CALLS = int(os.environ.get('CIRCUIT_MIN_CALLS', 5))  # Calls in the window before a breaker may open
+    CIRCUIT_ERROR_RATE = float(os.environ.get('CIRCUIT_ERROR_RATE', 0.5))  # Failure ratio that opens a breaker
+    CIRCUIT_SLOW_CALL_DURATION = float(os.environ.get('CIRCUIT_SLOW_CALL_DURATION', 10))  # Seconds after which a call counts as slow
+    CIRCUIT_SLOW_CALL_RATE = float(os.environ.get('CIRCUIT_SLOW_CALL_RATE', 0.8))  # Slow call ratio that opens a breaker
+    CIRCUIT_COOLDOWN = float(os.environ.get('CIRCUIT_COOLDOWN', 15))  # Seconds a breaker stays open before probing
+    # Models tried in order for chat calls, e.g. "llama3-8b,llama3-70b"; callers fall back locally after the last one
+    FAILOVER_CHAIN = [m.strip() for m in os.environ.get('FAILOVER_CHAIN', 'llama3-8b,llama3-70b').split(',') if m.strip()]
+    ROUTING_POLICY_FILE = os.environ.get('ROUTING_POLICY_FILE')  # JSON overrides for the per-task routing policy
+    UPSTREAM_MAX_RETRIES = int(os.environ.get('UPSTREAM_MAX_RETRIES', 2))  # Retries after 429, 5xx or connection errors
+    UPSTREAM_BACKOFF_BASE = float(os.environ.get('UPSTREAM_BACKOFF_BASE', 0.5))  # Seconds, doubled per attempt, with full jitter
+    UPSTREAM_BACKOFF_MAX = float(os.environ.get('UPSTREAM_BACKOFF_MAX', 8))  # Upper bound of the backoff before jitter
+    UPSTREAM_MAX_RETRY_AFTER = float(os.environ.get('UPSTREAM_MAX_RETRY_AFTER', 10))  # Longer Retry-After fails over instead
+    UPSTREAM_CONCURRENCY_INITIAL = int(os.environ.get('UPSTREAM_CONCURRENCY_INITIAL', 8))  # Starting AIMD limit per process
+    UPSTREAM_CONCURRENCY_MAX = int(os.environ.get('UPSTREAM_CONCURRENCY_MAX', 64))
+    UPSTREAM_QUEUE_TIMEOUT = float(os.environ.get('UPSTREAM_QUEUE_TIMEOUT', 30))  # Seconds to wait for a free upstream slot
+    
+    # Completion index
+    COMPLETION_INDEX_MIN_PREFIX = int(os.environ.get('COMPLETION_INDEX_MIN_PREFIX', 8))  # Shorter requests always go to the model
+    COMPLETION_INDEX_MIN_RATING = int(os.environ.get('COMPLETION_INDEX_MIN_RATING', 4))  # Feedback rating needed to serve a correction
+    COMPLETION_INDEX_REFRESH = float(os.environ.get('COMPLETION_INDEX_REFRESH', 60))  # Seconds between checks for new rows
+    # Local n-gram model, used when Workers AI is unavailable or slower than COMPLETION_UPSTREAM_BUDGET
+    NGRAM_ORDER = int(os.environ.get('NGRAM_ORDER', 4))  # Tokens per n-gram (context of NGRAM_ORDER - 1)
+    NGRAM_MAX_NGRAMS = int(os.environ.get('NGRAM_MAX_NGRAMS', 500000))  # Per language; rare n-grams are pruned beyond this
+    NGRAM_MIN_RATING = int(os.environ.get('NGRAM_MIN_RATING', COMPLETION_INDEX_MIN_RATING))  # Feedback rating needed to train on it
+    NGRAM_MAX_TOKENS = int(os.environ.get('NGRAM_MAX_TOKENS', 48))  # Tokens generated per suggestion
+    NGRAM_MIN_CONFIDENCE = float(os.environ.get('NGRAM_MIN_CONFIDENCE', 0.3))  # Share of the first token in its context
+    NGRAM_REFRESH_INTERVAL = float(os.environ.get('NGRAM_REFRESH_INTERVAL', 60))  # Seconds before a worker re-reads new training rows
+    COMPLETION_UPSTREAM_BUDGET = float(os.environ.get('COMPLETION_UPSTREAM_BUDGET', 2.0))  # Seconds before the local suggestion is served
+    
+    # Analysis settings
+    ERROR_CHECK_MODE = os.environ.get('ERROR_CHECK_MODE', 'semantic')  # semantic, local (no model) or llm (no local syntax check)
+    ERROR_CHECK_CHUNK_TOKENS = int(os.environ.get('ERROR_CHECK_CHUNK_TOKENS', 1500))  # Input budget per error-check chunk
+    ERROR_CHECK_MAX_PARALLEL = int(os.environ.get('ERROR_CHECK_MAX_PARALLEL', 8))  # Chunks checked at once per process
+    ANALYSIS_UNIT_CACHE_SIZE = int(os.environ.get('ANALYSIS_UNIT_CACHE_SIZE', 20000))  # Cached per-unit error-check results
+    ANALYSIS_SESSION_CACHE_SIZE = int(os.environ.get('ANALYSIS_SESSION_CACHE_SIZE', 2000))  # Editor sessions kept for diffs
+    EDITOR_SESSION_CACHE_SIZE = int(os.environ.get('EDITOR_SESSION_CACHE_SIZE', 2000))  # Open editor sessions, least recently used closed first
+    EDITOR_SESSION_DIR = os.environ.get('EDITOR_SESSION_DIR', 'instance/editor_sessions')  # Request numbers and stats shared by workers, one file per session
+    EDITOR_DEBOUNCE = float(os.environ.get('EDITOR_DEBOUNCE', 0.3))  # Seconds a session request waits for a newer one
+
+    # Generated images
+    IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR', 'instance/image_cache')  # Generated PNGs, one file per prompt
+    IMAGE_CACHE_MAX_BYTES = int(os.environ.get('IMAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024))  # Least recently used images are evicted beyond this
+    IMAGE_CACHE_MAX_AGE = int(os.environ.get('IMAGE_CACHE_MAX_AGE', 3600))  # Seconds browsers may reuse an image before revalidating
+    IMAGE_UPLOAD_MAX_BYTES = int(os.environ.get('IMAGE_UPLOAD_MAX_BYTES', 10 * 1024 * 1024))  # Largest image accepted for classification
+    IMAGE_CLASSIFICATION_CACHE_SIZE = int(os.environ.get('IMAGE_CLASSIFICATION_CACHE_SIZE', 10000))  # Classification results kept by image digest
+
+    # Moderation
+    MODERATION_CACHE_SIZE = int(os.environ.get('MODERATION_CACHE_SIZE', 50000))  # Verdicts kept in memory per process (all are kept in the database)
+    MODERATION_MAX_PARALLEL = int(os.environ.get('MODERATION_MAX_PARALLEL', 8))  # Texts moderated upstream at once per process
+    MODERATION_MAX_BATCH = int(os.environ.get('MODERATION_MAX_BATCH', 500))  # Texts accepted in one moderation request
+
+    # Embeddings
+    EMBEDDING_STORE_DIR = os.environ.get('EMBEDDING_STORE_DIR', 'instance/embeddings')  # Memory-mapped vector files, one pair per model
+    EMBEDDING_BATCH_SIZE = int(os.environ.get('EMBEDDING_BATCH_SIZE', 100))  # Texts packed into one upstream embedding request
+    EMBEDDING_MAX_BATCH = int(os.environ.get('EMBEDDING_MAX_BATCH', 1000))  # Texts accepted in one embeddings request
+
+    # Request deadlines
+    REQUEST_DEADLINE = float(os.environ.get('REQUEST_DEADLINE', 60))  # Seconds a request may work; X-Request-Timeout can only shorten it
+    # Per-endpoint overrides, e.g. "api.complete_code=10,api.web_search=20"
+    REQUEST_DEADLINES = {
+        endpoint.strip(): float(seconds)
+        for endpoint, _, seconds in (
+            item.partition('=') for item in os.environ.get(
+                'REQUEST_DEADLINES', 'api.complete_code=10,api.detect_language_api=10,api.web_search=20'
+            ).split(',')
+        )
+        if endpoint.strip() and seconds.strip()
+    }
+    WEB_FETCH_TIMEOUT = float(os.environ.get('WEB_FETCH_TIMEOUT', 30))  # Seconds to download one page
+    WEB_FETCH_MAX_BYTES = int(os.environ.get('WEB_FETCH_MAX_BYTES', 20 * 1024 * 1024))  # Larger pages are not extracted
+    WEB_FETCH_MIN_TIME = float(os.environ.get('WEB_FETCH_MIN_TIME', 1.0))  # Seconds left needed to start another page of a search
+
+    # Diagnostics
+    SLOW_REQUEST_THRESHOLD = float(os.environ.get('SLOW_REQUEST_THRESHOLD', 2.0))  # Seconds; 0 disables slow-request capture
+    PROFILER_INTERVAL = float(os.environ.get('PROFILER_INTERVAL', 0.01))  # Seconds between stack samples
     
     # Security
+    ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')  # Admin API is disabled while empty
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'dev-jwt-secret')
     JWT_ACCESS_TOKEN_EXPIRES = 3600  # 1 hour
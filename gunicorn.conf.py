@@ -0,0 +1,82 @@
+"""
+Gunicorn configuration for production
+
+Run with: gunicorn --config gunicorn.conf.py
+
+The application is preloaded in the master process so workers share one
+copy-on-write copy of the knowledge base and other read-mostly data. The
+garbage collector is frozen before forking so reference-count updates by
+collections do not touch, and copy, the shared pages. Background learning
+threads are only started after fork, in a single designated worker.
+"""
+
+import os
+import gc
+import fcntl
+import shutil
+import logging
+
+logger = logging.getLogger("gunicorn.error")
+
+def _available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+# Workers share metrics through per-process snapshots in this directory;
+# it is cleared when the master starts
+METRICS_DIR = os.environ.setdefault("METRICS_MULTIPROC_DIR", "instance/metrics")
+shutil.rmtree(METRICS_DIR, ignore_errors=True)
+
+wsgi_app = "wsgi:app"
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+preload_app = True
+
+# Upstream AI calls are I/O bound, so each worker also runs a few threads
+workers = int(os.environ.get("WEB_CONCURRENCY", _available_cores() * 2 + 1))
+worker_class = "gthread"
+threads = int(os.environ.get("WORKER_THREADS", 4))
+timeout = int(os.environ.get("WORKER_TIMEOUT", 120))
+
+# Lock held by the worker that runs background services; when that worker
+# exits the lock is released and its replacement takes over
+BACKGROUND_LOCK_FILE = os.environ.get("BACKGROUND_LOCK_FILE", "instance/background_services.lock")
+_background_lock = None
+
+def when_ready(server):
+    # Keep the preloaded objects out of collections so workers do not
+    # copy their pages when the collector runs
+    gc.freeze()
+    server.log.info(f"Preloaded app frozen ({gc.get_freeze_count()} objects), starting {workers} workers")
+
+def post_fork(server, worker):
+    from app import db
+    from wsgi import app
+
+    # Connections opened in the master must not be shared with workers
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+    _start_background_services_once(worker, app)
+
+def _start_background_services_once(worker, app):
+    global _background_lock
+    from config import Config
+
+    if not Config.BACKGROUND_SERVICES:
+        return
+
+    os.makedirs(os.path.dirname(BACKGROUND_LOCK_FILE) or ".", exist_ok=True)
+    lock = open(BACKGROUND_LOCK_FILE, "a")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        return
+
+    _background_lock = lock
+    worker.log.info(f"Worker {worker.pid} runs background services")
+
+    from app import start_app_background_services
+    start_app_background_services(app)
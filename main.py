@@ -1,16 +1,14 @@
-import threading
-import time
 import logging
-from app import app
-from brain.continuous_learning import start_continuous_learning
+from app import create_app
+from config import Config
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Background services are opt-in so plain imports and workers boot fast
+app = create_app(start_background_services=Config.BACKGROUND_SERVICES)
+
 if __name__ == "__main__":
-    # Initialize continuous learning system
-    start_continuous_learning()
-    
     # Start web server
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -35,3 +35,70 @@ class ModelVersion(db.Model):
     
     def __repr__(self):
         return f'<ModelVersion {self.version}>'
+
+class FeedbackAggregate(db.Model):
+    """Hourly feedback rollup per language and feedback type, updated as feedback is written"""
+    __table_args__ = (
+        db.UniqueConstraint('language', 'feedback_type', 'hour', name='uq_feedback_aggregate_bucket'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    language = db.Column(db.String(50), nullable=False, index=True)
+    feedback_type = db.Column(db.String(50), nullable=False)
+    hour = db.Column(db.DateTime, nullable=False, index=True)  # created_at truncated to the hour
+    count = db.Column(db.Integer, nullable=False, default=0)
+    rating_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    # Rating histogram, one column per star
+    rating_1 = db.Column(db.Integer, nullable=False, default=0)
+    rating_2 = db.Column(db.Integer, nullable=False, default=0)
+    rating_3 = db.Column(db.Integer, nullable=False, default=0)
+    rating_4 = db.Column(db.Integer, nullable=False, default=0)
+    rating_5 = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            "language": self.language,
+            "feedback_type": self.feedback_type,
+            "hour": self.hour.isoformat(),
+            "count": self.count,
+            "rating_count": self.rating_count,
+            "rating_sum": self.rating_sum,
+            "average_rating": self.rating_sum / self.rating_count if self.rating_count else None,
+            "rating_histogram": [self.rating_1, self.rating_2, self.rating_3, self.rating_4, self.rating_5]
+        }
+
+    def __repr__(self):
+        return f'<FeedbackAggregate {self.language} - {self.feedback_type} - {self.hour}>'
+
+class LanguageFeedbackCounter(db.Model):
+    """Running feedback totals per language, used for dashboards and learning thresholds"""
+    language = db.Column(db.String(50), primary_key=True)
+    total_count = db.Column(db.Integer, nullable=False, default=0)
+    pending_count = db.Column(db.Integer, nullable=False, default=0)  # feedback since the last model update
+    rating_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            "language": self.language,
+            "total_count": self.total_count,
+            "pending_count": self.pending_count,
+            "rating_count": self.rating_count,
+            "average_rating": self.rating_sum / self.rating_count if self.rating_count else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None
+        }
+
+    def __repr__(self):
+        return f'<LanguageFeedbackCounter {self.language} - {self.total_count}>'
+
+class ModerationVerdict(db.Model):
+    """Moderation result for a text, keyed by the SHA-256 of the text"""
+    digest = db.Column(db.String(64), primary_key=True)
+    model = db.Column(db.String(100), nullable=False)
+    result = db.Column(db.Text, nullable=False)  # JSON string of the model's verdict
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ModerationVerdict {self.digest[:12]}>'
@@ -1,62 +1,65 @@
 import logging
-from flask import render_template, jsonify
-from app import app
+from flask import Blueprint, render_template, jsonify, Response
 from utils.model_utils import get_language_model_version
 from datetime import datetime
 from api.cloudflare_gateway import cloudflare
 
 logger = logging.getLogger(__name__)
 
-@app.route('/')
+main_bp = Blueprint('main', __name__)
+
+@main_bp.route('/')
 def index():
     """Home page"""
     return render_template('index.html')
 
-@app.route('/demo')
+@main_bp.route('/demo')
 def demo():
     """Demo page for testing the API"""
     model_info = get_language_model_version()
     return render_template('demo.html', model_info=model_info)
 
-@app.route('/documentation')
+@main_bp.route('/documentation')
 def documentation():
     """API documentation page"""
     return render_template('documentation.html', model_info=get_language_model_version())
 
-@app.route('/code-generator')
+@main_bp.route('/code-generator')
 def code_generator():
     """Code generation page with continuous learning"""
     return render_template('code_generator.html')
 
-@app.route('/ai-thinking')
+@main_bp.route('/ai-thinking')
 def ai_thinking_page():
     """AI Thinking page that shows the model's thought process"""
     return render_template('ai_thinking.html')
 
-@app.route('/interactive-editor')
+@main_bp.route('/interactive-editor')
 def interactive_editor():
     """Interactive code editor with integrated AI assistance"""
     return render_template('interactive_editor.html')
 
-@app.route('/ai-learning')
+@main_bp.route('/ai-learning')
 def ai_learning_page():
     """AI Learning page for continuous learning system"""
     return render_template('ai_learning.html')
 
-@app.route('/cloudflare-ai')
+@main_bp.route('/cloudflare-ai')
 def cloudflare_ai_page():
     """Cloudflare AI features demonstration page"""
     has_credentials = cloudflare.has_credentials()
     return render_template('cloudflare_ai.html', has_credentials=has_credentials)
 
-@app.route('/api/learning-status')
+@main_bp.route('/api/learning-status')
 def learning_status():
     """API endpoint to get current learning status"""
     try:
-        from brain.continuous_learning import knowledge_base, count_knowledge_items, is_learning
+        from brain import continuous_learning
         
         # Получаем информацию о базе знаний
-        item_count = count_knowledge_items()
+        knowledge_base = continuous_learning.get_knowledge_base()
+        is_learning = continuous_learning.is_learning
+        item_count = continuous_learning.count_knowledge_items()
         last_updated = knowledge_base.get("last_updated", "Never")
         
         # Формируем статус по категориям
@@ -81,12 +84,18 @@ def learning_status():
             "last_updated": datetime.utcnow().isoformat()
         })
 
-@app.errorhandler(404)
+@main_bp.route('/metrics')
+def metrics():
+    """Prometheus metrics, merged across all worker processes"""
+    from utils.metrics import registry
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@main_bp.app_errorhandler(404)
 def page_not_found(e):
     """Handle 404 errors"""
     return render_template('404.html'), 404
 
-@app.errorhandler(500)
+@main_bp.app_errorhandler(500)
 def server_error(e):
     """Handle 500 errors"""
     logger.error(f"Server error: {str(e)}")
@@ -0,0 +1,52 @@
+"""
+Small in-process caches
+"""
+
+import threading
+from collections import OrderedDict
+from utils.metrics import record_cache_lookup
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache with a fixed number of entries
+
+    Lookups are counted in codevai_cache_lookups_total under the cache name.
+    """
+
+    def __init__(self, max_entries, name=None):
+        self.max_entries = max_entries
+        self.name = name
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                value = self._entries[key]
+                hit = True
+            else:
+                value = default
+                hit = False
+        if self.name:
+            record_cache_lookup(self.name, hit)
+        return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._entries.pop(key, default)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
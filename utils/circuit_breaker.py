@@ -0,0 +1,163 @@
+"""
+Per-model circuit breakers for upstream AI calls
+
+A breaker watches a rolling time window of calls to one model. It opens when
+too many of them fail or are too slow, rejects calls while open so callers
+can fail over immediately, and after a cooldown lets a single probe call
+through (half-open) to decide whether to close again.
+"""
+
+import time
+import logging
+import threading
+from collections import deque
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Numeric states for the metrics gauge
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+class CircuitBreaker:
+    """Rolling-window circuit breaker for one upstream model"""
+
+    def __init__(self, name, window=30.0, min_calls=5, error_rate=0.5,
+                 slow_call_duration=10.0, slow_call_rate=0.8, cooldown=15.0):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_duration = slow_call_duration
+        self.slow_call_rate = slow_call_rate
+        self.cooldown = cooldown
+
+        self.state = CLOSED
+        self.opened_at = None
+        self.open_count = 0
+        self._calls = deque()  # (timestamp, ok, duration)
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _trim(self, now):
+        while self._calls and now - self._calls[0][0] > self.window:
+            self._calls.popleft()
+
+    def allow_request(self):
+        """
+        Decide whether a call may go upstream
+
+        Returns:
+            bool: False while the circuit is open or a half-open probe is running
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    return False
+                self.state = HALF_OPEN
+                logger.info(f"Circuit for {self.name} half-open, probing")
+
+            # Half-open: a single probe at a time, everyone else fails over
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record(self, ok, duration):
+        """
+        Record the outcome of a call that allow_request let through
+
+        Args:
+            ok (bool): Whether the call succeeded
+            duration (float): Call duration in seconds
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probe_in_flight = False
+                if ok and duration < self.slow_call_duration:
+                    self._close()
+                else:
+                    self._open(now, "probe failed")
+                return
+
+            self._calls.append((now, ok, duration))
+            self._trim(now)
+
+            if self.state != CLOSED or len(self._calls) < self.min_calls:
+                return
+
+            total = len(self._calls)
+            failures = sum(1 for _, call_ok, _ in self._calls if not call_ok)
+            slow = sum(1 for _, _, call_duration in self._calls if call_duration >= self.slow_call_duration)
+
+            if failures / total >= self.error_rate:
+                self._open(now, f"error rate {failures}/{total}")
+            elif slow / total >= self.slow_call_rate:
+                self._open(now, f"slow calls {slow}/{total}")
+
+    def _open(self, now, reason):
+        self.state = OPEN
+        self.opened_at = now
+        self.open_count += 1
+        self._calls.clear()
+        logger.warning(f"Circuit for {self.name} opened ({reason}), failing over for {self.cooldown:.0f}s")
+
+    def _close(self):
+        self.state = CLOSED
+        self.opened_at = None
+        self._calls.clear()
+        logger.info(f"Circuit for {self.name} closed")
+
+    def snapshot(self):
+        with self._lock:
+            self._trim(time.monotonic())
+            durations = sorted(duration for _, _, duration in self._calls)
+            total = len(self._calls)
+            failures = sum(1 for _, ok, _ in self._calls if not ok)
+            return {
+                "state": self.state,
+                "calls_in_window": total,
+                "error_rate": round(failures / total, 3) if total else 0.0,
+                "p50_latency_ms": round(durations[total // 2] * 1000, 1) if total else None,
+                "open_count": self.open_count,
+                "retry_in_seconds": round(max(0.0, self.cooldown - (time.monotonic() - self.opened_at)), 1)
+                    if self.state == OPEN else None
+            }
+
+class CircuitBreakerRegistry:
+    """Lazily creates one breaker per model key with the configured settings"""
+
+    def __init__(self, **settings):
+        self.settings = settings
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(name, CircuitBreaker(name, **self.settings))
+        return breaker
+
+    def states(self):
+        return {(name,): STATE_VALUES[breaker.state] for name, breaker in list(self._breakers.items())}
+
+    def snapshot(self):
+        return {name: breaker.snapshot() for name, breaker in list(self._breakers.items())}
+
+# Process-wide breakers for Workers AI models
+breakers = CircuitBreakerRegistry(
+    window=Config.CIRCUIT_WINDOW,
+    min_calls=Config.CIRCUIT_MIN_CALLS,
+    error_rate=Config.CIRCUIT_ERROR_RATE,
+    slow_call_duration=Config.CIRCUIT_SLOW_CALL_DURATION,
+    slow_call_rate=Config.CIRCUIT_SLOW_CALL_RATE,
+    cooldown=Config.CIRCUIT_COOLDOWN
+)
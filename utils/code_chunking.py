@@ -0,0 +1,186 @@
+"""
+Splitting source files into top-level units and token-budgeted chunks
+
+Units are top-level definitions (functions, classes, methods blocks of brace
+languages) plus the code between them. They are found with ast for valid
+Python and with indentation or brace depth otherwise, so files with syntax
+errors - the ones sent for error checking - still split sensibly.
+
+Chunks are runs of consecutive units that fit a character budget; a unit
+larger than the budget is cut at line boundaries.
+"""
+
+import ast
+import re
+
+# Rough characters per token, as in utils.model_router
+CHARS_PER_TOKEN = 4
+
+BRACE_LANGUAGES = ("javascript", "java", "cpp", "go")
+
+_PYTHON_UNIT_START = re.compile(r"^(async\s+def\s|def\s|class\s|@)")
+
+class CodeUnit:
+    """Lines start_line..end_line (1-based, inclusive) of a file"""
+    __slots__ = ("start_line", "end_line", "text")
+
+    def __init__(self, start_line, end_line, text):
+        self.start_line = start_line
+        self.end_line = end_line
+        self.text = text
+
+    def __repr__(self):
+        return f"CodeUnit({self.start_line}-{self.end_line})"
+
+def _units_from_starts(lines, starts):
+    """Turn sorted 0-based unit start indexes into CodeUnits covering every line"""
+    starts = sorted(set([0] + [s for s in starts if 0 < s < len(lines)]))
+    units = []
+    for i, start in enumerate(starts):
+        end = starts[i + 1] if i + 1 < len(starts) else len(lines)
+        units.append(CodeUnit(start + 1, end, "".join(lines[start:end])))
+    return units
+
+def _python_starts(code, lines):
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        tree = None
+
+    if tree is not None:
+        starts = []
+        for node in tree.body:
+            first = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+            starts.append(first - 1)
+        return starts
+
+    # Invalid code: a unit starts at an unindented def/class/decorator
+    starts = []
+    for index, line in enumerate(lines):
+        if _PYTHON_UNIT_START.match(line):
+            # Decorators and their function form one unit
+            if index > 0 and lines[index - 1].startswith("@"):
+                continue
+            starts.append(index)
+    return starts
+
+def _strip_strings_and_comments(line, in_block_comment):
+    """Remove string literals and comments from a line of a brace language"""
+    result = []
+    i = 0
+    quote = None
+    while i < len(line):
+        char = line[i]
+        pair = line[i:i + 2]
+        if in_block_comment:
+            if pair == "*/":
+                in_block_comment = False
+                i += 2
+                continue
+        elif quote:
+            if char == "\\":
+                i += 2
+                continue
+            if char == quote:
+                quote = None
+        elif pair == "//":
+            break
+        elif pair == "/*":
+            in_block_comment = True
+            i += 2
+            continue
+        elif char in "\"'`":
+            quote = char
+        else:
+            result.append(char)
+        i += 1
+    return "".join(result), in_block_comment
+
+def _brace_starts(lines):
+    """Unit boundaries after every line where brace depth returns to zero"""
+    starts = []
+    depth = 0
+    in_block_comment = False
+    for index, line in enumerate(lines):
+        stripped, in_block_comment = _strip_strings_and_comments(line, in_block_comment)
+        was_nested = depth > 0
+        depth = max(0, depth + stripped.count("{") - stripped.count("}"))
+        if was_nested and depth == 0:
+            starts.append(index + 1)
+    return starts
+
+def split_units(code, language):
+    """
+    Split a file into top-level units covering every line
+
+    Args:
+        code (str): Source code
+        language (str): Programming language
+
+    Returns:
+        list: CodeUnit objects in file order
+    """
+    lines = code.splitlines(keepends=True)
+    if not lines:
+        return []
+
+    if language == "python":
+        starts = _python_starts(code, lines)
+    elif language in BRACE_LANGUAGES:
+        starts = _brace_starts(lines)
+    else:
+        starts = [index for index, line in enumerate(lines) if index and not line.strip()]
+
+    return _units_from_starts(lines, starts)
+
+def _split_large_unit(unit, max_chars):
+    lines = unit.text.splitlines(keepends=True)
+    pieces = []
+    start = 0
+    size = 0
+    for index, line in enumerate(lines):
+        if size and size + len(line) > max_chars:
+            pieces.append(CodeUnit(unit.start_line + start, unit.start_line + index - 1,
+                                   "".join(lines[start:index])))
+            start, size = index, 0
+        size += len(line)
+    pieces.append(CodeUnit(unit.start_line + start, unit.end_line, "".join(lines[start:])))
+    return pieces
+
+def chunk_code(code, language, max_tokens):
+    """
+    Pack top-level units into chunks of at most max_tokens (estimated)
+
+    Args:
+        code (str): Source code
+        language (str): Programming language
+        max_tokens (int): Token budget per chunk
+
+    Returns:
+        list: CodeUnit chunks in file order, together covering every line
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    chunks = []
+    current = []
+    current_chars = 0
+
+    def flush():
+        if current:
+            chunks.append(CodeUnit(current[0].start_line, current[-1].end_line,
+                                   "".join(unit.text for unit in current)))
+            current.clear()
+
+    for unit in split_units(code, language):
+        if len(unit.text) > max_chars:
+            flush()
+            current_chars = 0
+            chunks.extend(_split_large_unit(unit, max_chars))
+            continue
+        if current and current_chars + len(unit.text) > max_chars:
+            flush()
+            current_chars = 0
+        current.append(unit)
+        current_chars += len(unit.text)
+    flush()
+
+    return chunks
@@ -0,0 +1,254 @@
+"""
+Instant code completions from known-good snippets
+
+The index holds, per language, snippets from utils.model_utils.predefined_completions,
+the CodeExample table and completion feedback whose corrected output was
+rated highly. Keys are whitespace-normalized and kept in a sorted list, so a
+lookup is two bisections: every key starting with the normalized request is
+a candidate, and the best-weighted one is returned. Requests that match
+nothing, or too many snippets to choose from, fall through to the model.
+
+New feedback is added as it is recorded. Rows written by other worker
+processes are picked up by id on the next lookup after the refresh interval.
+"""
+
+import re
+import sys
+import time
+import bisect
+import logging
+import threading
+from config import Config
+from utils.metrics import record_cache_lookup, completion_index_size
+
+logger = logging.getLogger(__name__)
+
+# Source weights: reviewed feedback beats curated examples beats demo snippets
+PREDEFINED_WEIGHT = 1
+EXAMPLE_WEIGHT = 5
+FEEDBACK_WEIGHT = 10
+
+# Prefix matches beyond this many snippets are too ambiguous to answer locally
+MAX_CANDIDATES = 256
+
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_code(text):
+    """Collapse whitespace runs so indentation and line breaks do not affect matching"""
+    return _WHITESPACE.sub(" ", text).strip()
+
+class _LanguageIndex:
+    """Sorted normalized keys with their best completion"""
+    __slots__ = ("keys", "entries")
+
+    def __init__(self):
+        self.keys = []
+        self.entries = {}  # normalized key -> (weight, completion, source)
+
+    def add(self, key, completion, source, weight):
+        existing = self.entries.get(key)
+        if existing is None:
+            bisect.insort(self.keys, key)
+        elif existing[0] > weight:
+            return False
+        # On equal weight the newer source wins
+        self.entries[key] = (weight, completion, source)
+        return True
+
+    def lookup(self, prefix):
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + "\uffff", start)
+        if start == end or end - start > MAX_CANDIDATES:
+            return None
+        # Best weight, then the shortest snippet (closest to the query)
+        key = min(self.keys[start:end], key=lambda k: (-self.entries[k][0], len(k)))
+        return key, self.entries[key]
+
+    def memory_bytes(self):
+        total = sys.getsizeof(self.keys) + sys.getsizeof(self.entries)
+        for key, entry in self.entries.items():
+            total += sys.getsizeof(key) + sys.getsizeof(entry) + sys.getsizeof(entry[1])
+        return total
+
+class CompletionIndex:
+    """Per-language prefix index of known completions"""
+
+    def __init__(self, min_prefix=8, min_rating=4, refresh_interval=60.0):
+        self.min_prefix = min_prefix
+        self.min_rating = min_rating
+        self.refresh_interval = refresh_interval
+        self._languages = {}
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()     # one build or refresh at a time; add() takes _lock
+        self._stats_lock = threading.Lock()
+        self._loaded = False
+        self._last_refresh = 0.0
+        self._last_feedback_id = 0
+        self._last_example_id = 0
+        self.stats = {"lookups": 0, "hits": 0, "misses": 0, "too_short": 0}  # too_short is part of misses
+
+    def add(self, language, key_text, completion, source, weight):
+        """
+        Add a known completion
+
+        Args:
+            language (str): Programming language
+            key_text (str): Code the completion answers (usually its own beginning)
+            completion (str): Completed code
+            source (str): 'predefined', 'example' or 'feedback'
+            weight (int): Higher weights win over other snippets with the same prefix
+        """
+        key = normalize_code(key_text)
+        if not key or not completion:
+            return
+        with self._lock:
+            self._languages.setdefault(language, _LanguageIndex()).add(key, completion, source, weight)
+
+    def add_feedback(self, feedback):
+        """Index a Feedback row if it is a highly rated corrected completion"""
+        if (feedback.feedback_type != "completion" or not feedback.corrected_output
+                or (feedback.rating or 0) < self.min_rating):
+            return False
+        completion = feedback.corrected_output
+        # The corrected version usually starts with the original code; otherwise the key is the query itself
+        key_text = completion if normalize_code(completion).startswith(normalize_code(feedback.code_input)) \
+            else feedback.code_input
+        self.add(feedback.language, key_text, completion, "feedback", FEEDBACK_WEIGHT + feedback.rating)
+        return True
+
+    def _load_new_rows(self):
+        """Add CodeExample and Feedback rows written since the last load"""
+        from models import CodeExample, Feedback
+
+        examples = CodeExample.query.filter(CodeExample.id > self._last_example_id) \
+            .order_by(CodeExample.id).all()
+        for example in examples:
+            self.add(example.language, example.code_snippet, example.code_snippet, "example", EXAMPLE_WEIGHT)
+            self._last_example_id = example.id
+
+        feedback_rows = Feedback.query.filter(
+            Feedback.id > self._last_feedback_id,
+            Feedback.feedback_type == "completion",
+            Feedback.corrected_output.isnot(None),
+            Feedback.rating >= self.min_rating
+        ).order_by(Feedback.id).all()
+        for feedback in feedback_rows:
+            self.add_feedback(feedback)
+            self._last_feedback_id = feedback.id
+
+        return len(examples) + len(feedback_rows)
+
+    def build(self):
+        """Build the index from predefined snippets and the database (needs an app context)"""
+        from utils.model_utils import predefined_completions
+
+        start_time = time.time()
+        for language, snippets in predefined_completions.items():
+            for completion in snippets.values():
+                self.add(language, completion, completion, "predefined", PREDEFINED_WEIGHT)
+
+        try:
+            self._load_new_rows()
+        except Exception as e:
+            logger.error(f"Error loading completions from the database: {str(e)}")
+
+        self._loaded = True
+        self._last_refresh = time.monotonic()
+        logger.info(f"Completion index built with {self.size()} snippets in "
+                    f"{(time.time() - start_time) * 1000:.1f}ms")
+
+    def refresh(self):
+        """Build on first use, then pick up rows from other processes at most once per interval"""
+        if not self._loaded:
+            # Concurrent first requests wait for the build instead of seeing a partial index
+            with self._build_lock:
+                if not self._loaded:
+                    self.build()
+            return
+
+        now = time.monotonic()
+        if now - self._last_refresh < self.refresh_interval:
+            return
+        if not self._build_lock.acquire(blocking=False):
+            # Another thread is already refreshing
+            return
+        try:
+            self._last_refresh = now
+            added = self._load_new_rows()
+            if added:
+                logger.debug(f"Completion index refreshed with {added} new rows")
+        except Exception as e:
+            logger.error(f"Error refreshing completion index: {str(e)}")
+        finally:
+            self._build_lock.release()
+
+    def _count(self, *outcomes):
+        with self._stats_lock:
+            for outcome in outcomes:
+                self.stats[outcome] += 1
+
+    def lookup(self, code, language):
+        """
+        Find a known completion for a code prefix
+
+        Args:
+            code (str): Code to complete
+            language (str): Programming language
+
+        Returns:
+            dict: completion and source, or None on a miss
+        """
+        prefix = normalize_code(code)
+        match = None
+        too_short = len(prefix) < self.min_prefix
+        if not too_short:
+            with self._lock:
+                index = self._languages.get(language)
+                match = index.lookup(prefix) if index else None
+
+        record_cache_lookup("completion_index", match is not None)
+        if match is None:
+            # A query this short matches too many snippets - leave it to the model
+            self._count("lookups", "misses", *(("too_short",) if too_short else ()))
+            return None
+
+        self._count("lookups", "hits")
+        key, (weight, completion, source) = match
+        return {"completion": completion, "source": source, "exact": key == prefix}
+
+    def size(self):
+        with self._lock:
+            return sum(len(index.keys) for index in self._languages.values())
+
+    def gauge_values(self):
+        with self._lock:
+            values = {}
+            for language, index in self._languages.items():
+                values[(language, "snippets")] = len(index.keys)
+                values[(language, "memory_bytes")] = index.memory_bytes()
+            return values
+
+    def snapshot(self):
+        with self._lock:
+            languages = {
+                language: {"snippets": len(index.keys), "memory_bytes": index.memory_bytes()}
+                for language, index in self._languages.items()
+            }
+        with self._stats_lock:
+            stats = dict(self.stats)
+        return {
+            "languages": languages,
+            "snippets": sum(entry["snippets"] for entry in languages.values()),
+            "memory_bytes": sum(entry["memory_bytes"] for entry in languages.values()),
+            "hit_rate": round(stats["hits"] / stats["lookups"], 4) if stats["lookups"] else None,
+            "stats": stats
+        }
+
+# Process-wide index
+completion_index = CompletionIndex(
+    min_prefix=Config.COMPLETION_INDEX_MIN_PREFIX,
+    min_rating=Config.COMPLETION_INDEX_MIN_RATING,
+    refresh_interval=Config.COMPLETION_INDEX_REFRESH
+)
+
+completion_index_size.set_function(completion_index.gauge_values)
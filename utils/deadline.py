@@ -0,0 +1,168 @@
+"""
+Request-scoped deadlines
+
+Every request gets a deadline: REQUEST_DEADLINES for its endpoint (or
+REQUEST_DEADLINE), shortened by the client's X-Request-Timeout header
+(seconds). The deadline lives in a context variable, so it follows the
+request into thread pools that copy the context. Upstream calls, web
+fetches and extraction steps cut their timeouts to the remaining budget and
+raise DeadlineExceeded instead of starting work that cannot finish in time;
+callers then answer with partial results or their usual fallback.
+
+Responses that hit the deadline carry X-Deadline-Exceeded with the stages
+that were cut short.
+"""
+
+import time
+import logging
+import contextvars
+from contextlib import contextmanager
+from flask import request, g, has_app_context
+from config import Config
+from utils.metrics import deadline_exceeded
+
+logger = logging.getLogger(__name__)
+
+class DeadlineExceeded(RuntimeError):
+    """Raised when the remaining request budget cannot cover the next step"""
+
+class Deadline:
+    """Absolute deadline of one request and the stages it cut short"""
+    __slots__ = ("at", "budget", "exceeded")
+
+    def __init__(self, seconds):
+        self.at = time.monotonic() + seconds
+        self.budget = seconds
+        self.exceeded = []
+
+    def remaining(self):
+        return self.at - time.monotonic()
+
+_current = contextvars.ContextVar("request_deadline", default=None)
+
+def _active():
+    deadline = _current.get()
+    if deadline is None and has_app_context():
+        # A streamed response is read after the handler returns: the request context
+        # is restored by stream_with_context, and g along with it
+        deadline = g.get("deadline")
+    return deadline
+
+@contextmanager
+def deadline_scope(seconds):
+    """
+    Run the block with a deadline, never later than an enclosing one
+
+    Args:
+        seconds (float): Budget of the block
+    """
+    deadline = Deadline(seconds)
+    outer = _active()
+    if outer is not None and outer.at <= deadline.at:
+        deadline = outer
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+def remaining():
+    """Seconds left before the current deadline, or None without one"""
+    deadline = _active()
+    return None if deadline is None else deadline.remaining()
+
+def allows(seconds):
+    """Whether a step expected to take this many seconds can finish in time"""
+    deadline = _active()
+    return deadline is None or deadline.remaining() > seconds
+
+def mark_exceeded(stage):
+    """
+    Record that the deadline cut a stage short
+
+    Args:
+        stage (str): Stage name for metrics and the X-Deadline-Exceeded header
+    """
+    deadline = _active()
+    if deadline is not None and stage not in deadline.exceeded:
+        deadline.exceeded.append(stage)
+    deadline_exceeded.inc(stage=stage)
+
+def exceeded_stages():
+    """Stages of the current request cut short so far"""
+    deadline = _active()
+    return list(deadline.exceeded) if deadline is not None else []
+
+def _exceeded(stage):
+    mark_exceeded(stage)
+    return DeadlineExceeded(f"Request deadline exceeded at {stage}")
+
+def ensure(stage, needed=0.0):
+    """
+    Check that a step expected to take `needed` seconds still fits
+
+    Raises:
+        DeadlineExceeded: When it does not
+    """
+    if not allows(needed):
+        raise _exceeded(stage)
+
+def timeout_for(stage, default):
+    """
+    Timeout for a blocking step: the default, cut to the remaining budget
+
+    Args:
+        stage (str): Stage name
+        default (float): Timeout without a deadline
+
+    Returns:
+        float: Timeout in seconds
+
+    Raises:
+        DeadlineExceeded: When the deadline has already passed
+    """
+    left = remaining()
+    if left is None:
+        return default
+    if left <= 0:
+        raise _exceeded(stage)
+    return left if default is None else min(default, left)
+
+def trimmed(default, timeout):
+    """Whether a timeout from timeout_for was cut by the deadline"""
+    return default is None or timeout < default
+
+def init_app(app):
+    """Give every request of an application a deadline"""
+
+    @app.before_request
+    def _start_deadline():
+        seconds = Config.REQUEST_DEADLINES.get(request.endpoint, Config.REQUEST_DEADLINE)
+        try:
+            requested = float(request.headers.get("X-Request-Timeout", 0))
+        except ValueError:
+            requested = 0
+        if requested > 0:
+            # A client can only shorten the budget, not extend it
+            seconds = min(seconds, requested)
+        g.deadline = Deadline(seconds)
+        g.deadline_token = _current.set(g.deadline)
+
+    @app.after_request
+    def _report_deadline(response):
+        deadline = g.get("deadline")
+        if deadline is not None and deadline.exceeded:
+            response.headers["X-Deadline-Exceeded"] = ",".join(deadline.exceeded)
+            logger.info(f"{request.path} cut short by its {deadline.budget:.1f}s deadline "
+                        f"at: {', '.join(deadline.exceeded)}")
+        return response
+
+    @app.teardown_request
+    def _end_deadline(exc):
+        token = g.pop("deadline_token", None)
+        if token is not None:
+            try:
+                _current.reset(token)
+            except ValueError:
+                # The streamed response is read to the end in another context
+                _current.set(None)
@@ -0,0 +1,218 @@
+"""
+Append-only on-disk store of text embeddings
+
+Each embedding model has two files in EMBEDDING_STORE_DIR:
+
+    <model>.f32   16-byte header (magic, dimension) followed by one row of
+                  native float32 values per embedded text
+    <model>.idx   the SHA-256 digest (32 bytes) of the text of each row
+
+Rows are only ever appended, so an identical text is embedded once and the
+matrix is read through a memory map: opening a store maps the file and
+reads the digest index, without parsing any vectors. Workers of one host
+share the files; appends are serialized with an exclusive file lock and
+each worker picks up rows added by the others from the index file.
+"""
+
+import os
+import mmap
+import struct
+import fcntl
+import hashlib
+import logging
+import threading
+from array import array
+from config import Config
+from utils.metrics import record_cache_lookup
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b"CVEMB1\0\0"
+_HEADER = struct.Struct("=8sI4x")   # magic, dimension, padding to 16 bytes
+_DIGEST_SIZE = 32
+
+def text_digest(text):
+    """SHA-256 of a text, the key of its embedding"""
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+class EmbeddingStore:
+    """Float32 embedding matrix of one model with a digest -> row index"""
+
+    def __init__(self, directory, name):
+        os.makedirs(directory, exist_ok=True)
+        self.data_path = os.path.join(directory, f"{name}.f32")
+        self.index_path = os.path.join(directory, f"{name}.idx")
+        self.dimension = None
+        self.rows = 0
+        self._index = {}            # digest -> row number
+        self._digests = []          # row number -> digest
+        self._matrix = None         # float32 memoryview over the file mapping
+        self._mapped_rows = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        self._read_header()
+        self._read_index()
+
+    def _read_header(self):
+        """Take the dimension from the file header once some process has written it"""
+        try:
+            with open(self.data_path, "rb") as f:
+                header = f.read(_HEADER.size)
+        except FileNotFoundError:
+            return
+        if len(header) == _HEADER.size:
+            magic, dimension = _HEADER.unpack(header)
+            if magic != _MAGIC:
+                raise ValueError(f"{self.data_path} is not an embedding store")
+            self.dimension = dimension
+
+    def _row_bytes(self):
+        return self.dimension * 4
+
+    def _read_index(self):
+        """Pick up rows appended since the last read, by this or another process"""
+        if self.dimension is None:
+            # The store may have been created by another worker after this one opened it
+            self._read_header()
+            if self.dimension is None:
+                return
+        try:
+            index_size = os.path.getsize(self.index_path)
+            data_rows = (os.path.getsize(self.data_path) - _HEADER.size) // self._row_bytes()
+        except FileNotFoundError:
+            return
+        # A row counts as written only once both its vector and its digest are there
+        rows = min(index_size // _DIGEST_SIZE, data_rows)
+        if rows <= self.rows:
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(self.rows * _DIGEST_SIZE)
+            raw = f.read((rows - self.rows) * _DIGEST_SIZE)
+        for offset in range(0, len(raw), _DIGEST_SIZE):
+            digest = raw[offset:offset + _DIGEST_SIZE]
+            self._index.setdefault(digest, len(self._digests))
+            self._digests.append(digest)
+        self.rows = rows
+
+    def _map(self):
+        """Map the matrix again when it has grown past the current mapping"""
+        if self._mapped_rows == self.rows:
+            return
+        with open(self.data_path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), _HEADER.size + self.rows * self._row_bytes(), access=mmap.ACCESS_READ)
+        # The old mapping closes by itself once nothing references it
+        self._matrix = memoryview(mapped)[_HEADER.size:].cast("f")
+        self._mapped_rows = self.rows
+
+    def _vector(self, row):
+        start = row * self.dimension
+        return self._matrix[start:start + self.dimension].tolist()
+
+    def get_many(self, digests):
+        """
+        Look up stored embeddings
+
+        Args:
+            digests (list): Digests from text_digest
+
+        Returns:
+            dict: digest -> vector (list of floats) for the stored digests
+        """
+        with self._lock:
+            if any(digest not in self._index for digest in digests):
+                self._read_index()
+            found = {digest: self._index[digest] for digest in digests if digest in self._index}
+            for digest in digests:
+                record_cache_lookup("embeddings", digest in found)
+            if not found:
+                return {}
+            self._map()
+            return {digest: self._vector(row) for digest, row in found.items()}
+
+    def add_many(self, vectors):
+        """
+        Append embeddings of new texts
+
+        Args:
+            vectors (dict): digest -> vector; digests already stored are skipped
+
+        Raises:
+            ValueError: When a vector's dimension differs from the store's
+        """
+        if not vectors:
+            return
+        dimensions = {len(vector) for vector in vectors.values()}
+        if len(dimensions) != 1 or (self.dimension is not None and self.dimension not in dimensions):
+            raise ValueError(f"Embedding dimension {sorted(dimensions)} does not match the store ({self.dimension})")
+
+        with self._lock, open(self.data_path, "ab+") as data, open(self.index_path, "ab") as index:
+            fcntl.flock(data, fcntl.LOCK_EX)
+            try:
+                if os.fstat(data.fileno()).st_size == 0:
+                    self.dimension = dimensions.pop()
+                    data.write(_HEADER.pack(_MAGIC, self.dimension))
+                elif self.dimension is None:
+                    self._read_header()
+                    if self.dimension not in dimensions:
+                        raise ValueError(f"Embedding dimension does not match the store ({self.dimension})")
+                self._read_index()
+                new = [(digest, vector) for digest, vector in vectors.items() if digest not in self._index]
+                if not new:
+                    return
+
+                # Drop tails left by an interrupted write
+                data.truncate(_HEADER.size + self.rows * self._row_bytes())
+                index.truncate(self.rows * _DIGEST_SIZE)
+                values = array("f")
+                for _, vector in new:
+                    values.extend(vector)
+                data.write(values.tobytes())
+                data.flush()
+                index.write(b"".join(digest for digest, _ in new))
+                index.flush()
+            finally:
+                fcntl.flock(data, fcntl.LOCK_UN)
+
+            for digest, _ in new:
+                self._index[digest] = len(self._digests)
+                self._digests.append(digest)
+            self.rows += len(new)
+
+    def snapshot(self):
+        with self._lock:
+            self._read_index()
+            return {
+                "rows": self.rows,
+                "dimension": self.dimension,
+                "bytes": _HEADER.size + self.rows * self._row_bytes() if self.dimension else 0
+            }
+
+class EmbeddingStores:
+    """One store per embedding model, opened on first use"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._stores = {}
+        self._lock = threading.Lock()
+
+    def get(self, model):
+        """
+        Args:
+            model (str): Model path, e.g. @cf/baai/bge-base-en-v1.5
+        """
+        with self._lock:
+            store = self._stores.get(model)
+            if store is None:
+                name = model.replace("@cf/", "").replace("/", "-")
+                store = self._stores[model] = EmbeddingStore(self.directory, name)
+            return store
+
+    def snapshot(self):
+        with self._lock:
+            stores = dict(self._stores)
+        return {model: store.snapshot() for model, store in stores.items()}
+
+# Process-wide stores shared by the gateway and the Cloudflare AI client
+embedding_stores = EmbeddingStores(Config.EMBEDDING_STORE_DIR)
@@ -0,0 +1,191 @@
+"""
+On-disk cache of generated images
+
+Images are stored as files named by the hash of the model and prompt that
+produced them, so a repeated prompt is served from disk (with sendfile and
+ETag revalidation) instead of being generated again. The directory is
+bounded by IMAGE_CACHE_MAX_BYTES: once a write pushes it over the limit,
+the least recently used files are removed until it is back under 90%.
+
+Several gunicorn workers can share the directory. Files are written
+atomically. Each worker tracks the size of the directory from its own
+writes and re-scans it every RESCAN_INTERVAL seconds (or sooner, once its
+own writes since the last scan reach a tenth of the limit), so writes of the
+other workers are counted too, and re-reads it before evicting. Because
+another worker may evict a file at any time, readers treat a file that
+disappears as a cache miss.
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+from config import Config
+from utils.metrics import record_cache_lookup
+
+logger = logging.getLogger(__name__)
+
+# Eviction goes down to this share of the limit, so the directory is not cleaned after every write
+_LOW_WATER = 0.9
+
+# Seconds between scans of the directory, to account for the other workers' writes
+RESCAN_INTERVAL = 30.0
+
+class ImageCache:
+    """Size-bounded directory of PNG files addressed by prompt hash"""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self._used = {}         # key -> last access time in this process
+        self._total = None      # bytes in the directory as of the last scan plus our writes since
+        self._scanned = 0.0     # time.monotonic() of the last scan
+        self._written = 0       # bytes written by this process since the last scan
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_for(model, prompt):
+        """Cache key of an image generated by a model from a prompt"""
+        return hashlib.sha256(f"{model}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.directory, f"{key}.png")
+
+    def get(self, key):
+        """
+        Path of a cached image
+
+        Args:
+            key (str): Key from key_for
+
+        Returns:
+            str: Absolute file path, or None on a miss
+        """
+        path = self.path_for(key)
+        hit = os.path.isfile(path)
+        if hit:
+            # Leave the file's mtime alone: the ETag depends on it
+            with self._lock:
+                self._used[key] = time.time()
+        record_cache_lookup("images", hit)
+        return path if hit else None
+
+    def store(self, key, data):
+        """
+        Write an image and evict old ones if the directory grew past its limit
+
+        Args:
+            key (str): Key from key_for
+            data (bytes): PNG content
+
+        Returns:
+            str: Absolute file path
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path_for(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        try:
+            # Rewriting a key replaces its file instead of adding to the total
+            replaced = os.path.getsize(path)
+        except FileNotFoundError:
+            replaced = 0
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._used[key] = time.time()
+            self._written += len(data)
+            if (self._total is None or time.monotonic() - self._scanned > RESCAN_INTERVAL
+                    or self._written > self.max_bytes * (1 - _LOW_WATER)):
+                self._rescan()
+            else:
+                self._total += len(data) - replaced
+            if self._total > self.max_bytes:
+                self._evict(keep=key)
+        return path
+
+    def read(self, key):
+        """
+        Content of a cached image
+
+        Returns:
+            bytes: PNG content, or None on a miss (including a file evicted
+                   by another worker after get())
+        """
+        path = self.get(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            self.forget(key)
+            return None
+
+    def forget(self, key):
+        """Drop the access record of a file another worker evicted"""
+        with self._lock:
+            self._used.pop(key, None)
+
+    def _rescan(self):
+        self._total = self._scan_total()
+        self._scanned = time.monotonic()
+        self._written = 0
+
+    def _files(self):
+        """(key, size, last use) of every cached image"""
+        files = []
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return files
+        for entry in entries:
+            if not entry.name.endswith(".png"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            key = entry.name[:-4]
+            files.append((key, stat.st_size, max(stat.st_mtime, self._used.get(key, 0))))
+        return files
+
+    def _scan_total(self):
+        return sum(size for _, size, _ in self._files())
+
+    def _evict(self, keep=None):
+        files = sorted(self._files(), key=lambda item: item[2])
+        total = sum(size for _, size, _ in files)
+        target = self.max_bytes * _LOW_WATER
+        removed = 0
+        for key, size, _ in files:
+            if total <= target:
+                break
+            if key == keep:
+                continue
+            try:
+                os.remove(self.path_for(key))
+            except FileNotFoundError:
+                pass
+            self._used.pop(key, None)
+            total -= size
+            removed += 1
+        self._total = total
+        self._scanned = time.monotonic()
+        self._written = 0
+        if removed:
+            logger.info(f"Evicted {removed} cached images, {total / 1024 / 1024:.1f} MiB left")
+
+    def snapshot(self):
+        with self._lock:
+            files = self._files()
+        return {
+            "files": len(files),
+            "bytes": sum(size for _, size, _ in files),
+            "max_bytes": self.max_bytes
+        }
+
+# Process-wide cache shared by the gateway and the Cloudflare AI client
+image_cache = ImageCache(Config.IMAGE_CACHE_DIR, Config.IMAGE_CACHE_MAX_BYTES)
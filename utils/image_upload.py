@@ -0,0 +1,118 @@
+"""
+Bounded reading of uploaded images and zero-copy forwarding
+
+Uploads are read straight into one preallocated buffer (sized from
+Content-Length when the client sends it) with readinto, refusing anything
+over the limit as soon as it is exceeded. The buffer is then hashed and
+sent upstream through memoryview slices, so the image is not copied again
+on its way to Workers AI.
+"""
+
+import io
+import hashlib
+import base64
+from config import Config
+from utils.cache import LRUCache
+
+# Initial buffer size when the client sent no Content-Length
+_INITIAL_BUFFER = 64 * 1024
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload exceeds its size limit"""
+
+def read_upload(stream, max_bytes, length=None):
+    """
+    Read an upload into a single buffer
+
+    Args:
+        stream: Binary file-like object (request body or multipart file)
+        max_bytes (int): Largest accepted upload
+        length (int): Announced size, if known
+
+    Returns:
+        bytearray: The upload
+
+    Raises:
+        UploadTooLargeError: When the upload is larger than max_bytes
+    """
+    if length is not None and length > max_bytes:
+        raise UploadTooLargeError(f"Upload of {length} bytes exceeds the {max_bytes} byte limit")
+
+    buffer = bytearray(length if length is not None else min(max_bytes, _INITIAL_BUFFER))
+    readinto = getattr(stream, "readinto", None)
+    size = 0
+    while True:
+        if size == len(buffer):
+            if length is not None:
+                break
+            if size >= max_bytes:
+                if stream.read(1):
+                    raise UploadTooLargeError(f"Upload exceeds the {max_bytes} byte limit")
+                break
+            # The buffer can't be resized while a memoryview of it exists, so it grows between reads
+            buffer.extend(bytes(min(len(buffer), max_bytes - len(buffer))))
+
+        with memoryview(buffer) as view, view[size:] as target:
+            if readinto is not None:
+                count = readinto(target)
+            else:
+                chunk = stream.read(len(target))
+                count = len(chunk)
+                target[:count] = chunk
+        if not count:
+            break
+        size += count
+
+    del buffer[size:]
+    return buffer
+
+def decode_base64_image(data):
+    """
+    Decode a base64 image, with or without a data: URL prefix
+
+    Raises:
+        UploadTooLargeError: When the decoded image would exceed IMAGE_UPLOAD_MAX_BYTES
+        ValueError: When the data is not valid base64
+    """
+    if data.startswith("data:"):
+        data = data.partition(",")[2]
+    if len(data) * 3 // 4 > Config.IMAGE_UPLOAD_MAX_BYTES:
+        raise UploadTooLargeError(f"Image exceeds the {Config.IMAGE_UPLOAD_MAX_BYTES} byte limit")
+    return base64.b64decode(data, validate=True)
+
+def image_digest(buffer):
+    """SHA-256 of an image buffer, computed without copying it"""
+    return hashlib.sha256(buffer).hexdigest()
+
+class BufferReader:
+    """
+    Rewindable file-like view of a buffer for request bodies
+
+    requests sends file-like bodies block by block; each block is a
+    memoryview slice of the original buffer, not a copy. post_with_retries
+    rewinds the reader before every attempt.
+    """
+
+    def __init__(self, buffer):
+        self._view = memoryview(buffer)
+        self._position = 0
+
+    def __len__(self):
+        return len(self._view)
+
+    def read(self, size=-1):
+        end = len(self._view) if size is None or size < 0 else min(len(self._view), self._position + size)
+        chunk = self._view[self._position:end]
+        self._position = end
+        return chunk
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._view)}[whence]
+        self._position = max(0, min(len(self._view), base + offset))
+        return self._position
+
+# Classification results by image SHA-256: identical uploads are not sent upstream again
+classification_cache = LRUCache(Config.IMAGE_CLASSIFICATION_CACHE_SIZE, name="image_classifications")
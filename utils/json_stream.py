@@ -0,0 +1,283 @@
+"""
+Tolerant incremental extraction of a JSON object from model output
+
+Models wrap their JSON in markdown fences, add prose around it, leave
+trailing commas, use single quotes or Python literals, put raw newlines in
+strings and get cut off by the token limit. JSONStreamParser reads the text
+in one pass, chunk by chunk as it is generated: it skips everything before
+the first '{', builds the object as tokens complete and stops at its closing
+brace. Each element of a top-level array ("thoughts", "errors") is reported
+as soon as it closes, so partial results can be shown before generation
+ends; chosen top-level string members ("answer") can also be reported as
+they grow.
+"""
+
+import re
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+_STRING_SPECIAL = {'"': re.compile(r'["\\]'), "'": re.compile(r"['\\]")}
+_SCALAR = re.compile(r"[^\s{}\[\],:\"']+")
+_INVALID_ESCAPE = re.compile(r'\\(?!["\\/bfnrtu])')
+_UNESCAPED_QUOTE = re.compile(r'(?<!\\)"')
+_LITERALS = {"true": True, "false": False, "null": None, "True": True, "False": False, "None": None}
+
+def _decode_string(raw, quote):
+    """Decode the raw content of a string literal, repairing invalid escapes"""
+    if quote == "'":
+        raw = _UNESCAPED_QUOTE.sub('\\\\"', raw.replace("\\'", "'"))
+    try:
+        return json.loads('"' + raw + '"', strict=False)
+    except ValueError:
+        try:
+            return json.loads('"' + _INVALID_ESCAPE.sub(r"\\\\", raw) + '"', strict=False)
+        except ValueError:
+            return raw
+
+def _decode_scalar(token):
+    """Numbers and literals; any other bare word (e.g. an unquoted key) becomes a string"""
+    if token in _LITERALS:
+        return _LITERALS[token]
+    try:
+        return json.loads(token)
+    except ValueError:
+        return token
+
+class _Frame:
+    """An open object or array and, for objects, the key awaiting its value"""
+    __slots__ = ("container", "key")
+
+    def __init__(self, container):
+        self.container = container
+        self.key = None
+
+class JSONStreamParser:
+    """Single-pass tolerant parser for the first JSON object in streamed text"""
+
+    def __init__(self, stream_fields=()):
+        """
+        Args:
+            stream_fields (tuple): Top-level string members to report while they
+                                   are being generated
+        """
+        self.stream_fields = stream_fields
+        self.started = False
+        self.done = False
+        self.result = None
+        self.repairs = []
+        self._stack = []
+        self._pending = ""      # unfinished number or literal at a fragment boundary
+        self._quote = None      # opening quote of the current string
+        self._raw = []
+        self._escape = False
+        self._comma = False
+        self._events = []
+        self._partial_sent = 0  # characters of the current streamed string already emitted
+
+    def feed(self, chunk):
+        """
+        Parse the next piece of text
+
+        Args:
+            chunk (str): Text as generated
+
+        Returns:
+            list: Events completed by this chunk - ("item", key, value) for each
+                  element of a top-level array, ("field", key, value) for
+                  each top-level member and ("partial", key, text) with the
+                  new text of a stream_fields member
+        """
+        events = self._events = []
+        if self.done or not chunk:
+            return events
+
+        text = self._pending + chunk
+        self._pending = ""
+        i = 0
+        if not self.started:
+            i = text.find("{")
+            if i < 0:
+                return events
+            self.started = True
+
+        n = len(text)
+        while i < n and not self.done:
+            if self._quote:
+                i = self._scan_string(text, i)
+                continue
+
+            char = text[i]
+            if char in " \t\r\n:":
+                pass
+            elif char == "{" or char == "[":
+                self._stack.append(_Frame({} if char == "{" else []))
+                self._comma = False
+            elif char == "}" or char == "]":
+                if self._comma:
+                    self._repaired("trailing comma")
+                if self._stack:
+                    self._complete(self._stack.pop().container)
+            elif char == ",":
+                self._comma = True
+            elif char == '"' or char == "'":
+                if char == "'":
+                    self._repaired("single-quoted string")
+                self._quote = char
+            else:
+                end = _SCALAR.match(text, i).end()
+                if end == n:
+                    # A number or literal may continue in the next fragment
+                    self._pending = text[i:]
+                    break
+                self._complete(_decode_scalar(text[i:end]))
+                i = end
+                continue
+            i += 1
+
+        if self._quote and self._raw:
+            self._emit_partial()
+        return events
+
+    def close(self):
+        """
+        Finish parsing, closing whatever the model left open
+
+        Returns:
+            dict: The extracted object
+
+        Raises:
+            ValueError: If the text contains no JSON object
+        """
+        if not self.started:
+            raise ValueError("No JSON object found in model output")
+
+        self._events = []
+        if not self.done:
+            if self._quote:
+                self._repaired("unterminated string")
+                quote, self._quote = self._quote, None
+                self._complete(_decode_string("".join(self._raw).rstrip("\\"), quote))
+            elif self._pending:
+                self._complete(_decode_scalar(self._pending))
+                self._pending = ""
+            if self._stack:
+                self._repaired("unclosed brackets")
+            while self._stack and not self.done:
+                self._complete(self._stack.pop().container)
+        return self.result
+
+    def _streamed_key(self):
+        """Whether the open string is the value of a top-level stream_fields member"""
+        return len(self._stack) == 1 and self._stack[0].key is not None and self._stack[0].key in self.stream_fields
+
+    def _emit_partial(self):
+        """Report the text added to a streamed top-level string since the last chunk"""
+        if not self._streamed_key():
+            return
+        raw = "".join(self._raw)
+        self._raw = [raw]
+        # An unfinished escape sequence is emitted with the next fragment
+        backslash = raw.rfind("\\", max(0, len(raw) - 6))
+        if backslash >= 0:
+            raw = raw[:backslash]
+        text = _decode_string(raw, self._quote)
+        if text and "\ud800" <= text[-1] <= "\udbff":
+            # First half of a surrogate pair
+            text = text[:-1]
+        if len(text) > self._partial_sent:
+            self._events.append(("partial", self._stack[0].key, text[self._partial_sent:]))
+            self._partial_sent = len(text)
+
+    def _repaired(self, defect):
+        if defect not in self.repairs:
+            self.repairs.append(defect)
+
+    def _scan_string(self, text, i):
+        """Consume string content up to the closing quote; returns the next position"""
+        pattern = _STRING_SPECIAL[self._quote]
+        while True:
+            if self._escape:
+                if i >= len(text):
+                    return i
+                # An escaped character can't close the string
+                self._raw.append(text[i])
+                self._escape = False
+                i += 1
+
+            match = pattern.search(text, i)
+            if match is None:
+                self._raw.append(text[i:])
+                return len(text)
+
+            j = match.start()
+            self._raw.append(text[i:j])
+            if text[j] == "\\":
+                self._raw.append("\\")
+                self._escape = True
+                i = j + 1
+                continue
+
+            raw = "".join(self._raw)
+            quote, self._quote, self._raw = self._quote, None, []
+            value = _decode_string(raw, quote)
+            if self._streamed_key() and len(value) > self._partial_sent:
+                self._events.append(("partial", self._stack[0].key, value[self._partial_sent:]))
+            self._partial_sent = 0
+            self._complete(value)
+            return j + 1
+
+    def _complete(self, value):
+        """Place a finished value into the innermost open container"""
+        self._comma = False
+        if not self._stack:
+            self.result = value
+            self.done = True
+            return
+
+        frame = self._stack[-1]
+        if isinstance(frame.container, list):
+            frame.container.append(value)
+            if len(self._stack) == 2 and self._stack[0].key is not None:
+                self._events.append(("item", self._stack[0].key, value))
+        elif frame.key is None:
+            if isinstance(value, (dict, list)):
+                self._repaired("value without a key")
+                return
+            frame.key = value if isinstance(value, str) else json.dumps(value)
+        else:
+            frame.container[frame.key] = value
+            if len(self._stack) == 1:
+                self._events.append(("field", frame.key, value))
+            frame.key = None
+
+_JSON_FENCE = re.compile(r"```json[ \t]*\n(.*?)(?:```|$)", re.DOTALL | re.IGNORECASE)
+
+def extract_json(text, expected_keys=()):
+    """
+    Extract the first JSON object from complete model output
+
+    A ```json fence is preferred over a '{' elsewhere in the text, so braces
+    of code quoted in the surrounding prose are not taken for the object.
+
+    Args:
+        text (str): Model output (may contain markdown fences and prose)
+        expected_keys (tuple): Keys the caller asked the model for; an object
+                               with none of them is rejected
+
+    Returns:
+        dict: The extracted object
+
+    Raises:
+        ValueError: If the text contains no JSON object, or none with an expected key
+    """
+    fence = _JSON_FENCE.search(text)
+    parser = JSONStreamParser()
+    parser.feed(fence.group(1) if fence else text)
+    result = parser.close()
+    if parser.repairs:
+        logger.debug(f"Repaired model JSON: {', '.join(parser.repairs)}")
+    if expected_keys and not any(key in result for key in expected_keys):
+        raise ValueError(f"Model JSON has none of the expected keys: {', '.join(expected_keys)}")
+    return result
@@ -1,203 +1,342 @@
 import logging
 import json
 import time
-import random
+import threading
+import traceback
 from datetime import datetime, timedelta
-from collections import defaultdict
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from flask import current_app
 from utils.model_utils import update_model_weights, get_language_model_version
-from models import Feedback, ModelVersion, db, CodeExample
+from utils.completion_index import completion_index
+from models import Feedback, ModelVersion, db, FeedbackAggregate, LanguageFeedbackCounter
 from config import Config
 
 logger = logging.getLogger(__name__)
 
-# Store feedback counts for tracking when to trigger learning
-feedback_counts = defaultdict(int)
-
-# Симуляция улучшений модели
-model_improvement_stats = {
-    "iterations": 0,
-    "last_updated": datetime.utcnow(),
-    "improvements": [],
-    "total_samples_processed": 0
-}
-
-# Список примеров кода для обучения модели
-training_examples = [
-    {
-        "language": "python",
-        "code_input": "def fibonacci(n):",
-        "expected_output": "def fibonacci(n):\n    if n <= 0:\n        return 0\n    elif n == 1:\n        return 1\n    else:\n        return fibonacci(n-1) + fibonacci(n-2)",
-        "feedback_type": "completion",
-        "rating": 5
-    },
-    {
-        "language": "python", 
-        "code_input": "def quicksort(arr):",
-        "expected_output": "def quicksort(arr):\n    if len(arr) <= 1:\n        return arr\n    pivot = arr[len(arr) // 2]\n    left = [x for x in arr if x < pivot]\n    middle = [x for x in arr if x == pivot]\n    right = [x for x in arr if x > pivot]\n    return quicksort(left) + middle + quicksort(right)",
-        "feedback_type": "completion",
-        "rating": 4
-    },
-    {
-        "language": "javascript",
-        "code_input": "function fibonacci(n) {",
-        "expected_output": "function fibonacci(n) {\n  if (n <= 0) return 0;\n  if (n === 1) return 1;\n  return fibonacci(n-1) + fibonacci(n-2);\n}",
-        "feedback_type": "completion",
-        "rating": 5
-    },
-]
-
-def continuous_learning_task():
+class ModelUpdateTrigger:
     """
-    Функция постоянного обучения модели, запускается в отдельном потоке.
-    Симулирует обучение модели на основе накопленных данных и генерирует отчеты об улучшении.
+    Event-driven model update scheduler
+
+    Feedback writes call request() once a language crosses
+    Config.FEEDBACK_THRESHOLD. Requests are debounced and coalesced, and a
+    single worker thread runs one batched update per language. The worker
+    blocks on a condition while idle, so nothing wakes up without feedback.
     """
-    logger.info("Continuous learning task started")
-    
-    # Интервал в секундах между итерациями обучения
-    learning_interval = 10
-    
-    # Количество примеров, добавляемых для обучения в каждой итерации
-    examples_per_iteration = 3
-    
-    # Максимальное улучшение точности в каждой итерации (в процентах)
-    max_accuracy_improvement = 0.5
-    
-    iteration = 0
-    
-    try:
+
+    def __init__(self, debounce=None, max_delay=None):
+        self.debounce = Config.MODEL_UPDATE_DEBOUNCE if debounce is None else debounce
+        self.max_delay = Config.MODEL_UPDATE_MAX_DELAY if max_delay is None else max_delay
+        self._condition = threading.Condition()
+        self._pending = set()
+        self._first_request = None
+        self._last_request = None
+        self._app = None
+        self._thread = None
+        self.stats = {
+            "requests": 0,
+            "updates": 0,
+            "coalesced": 0,
+            "skipped": 0,
+            "last_update": None
+        }
+
+    def request(self, language, app=None):
+        """
+        Ask for a model update for a language
+
+        Args:
+            language (str): Programming language that crossed the threshold
+            app (Flask): Application used for the database context (defaults to current_app)
+        """
+        with self._condition:
+            self.stats["requests"] += 1
+            if language in self._pending:
+                self.stats["coalesced"] += 1
+
+            now = time.monotonic()
+            self._pending.add(language)
+            self._first_request = self._first_request or now
+            self._last_request = now
+            self._app = app or self._app or current_app._get_current_object()
+
+            if not self._thread or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="model-update-trigger")
+                self._thread.daemon = True
+                self._thread.start()
+
+            self._condition.notify()
+
+    def _run(self):
         while True:
-            iteration += 1
-            logger.info(f"Starting learning iteration {iteration}")
-            
-            # Симуляция процесса обучения
-            processed_examples = []
-            
-            # Выбор случайных примеров из базы для обучения
-            for _ in range(examples_per_iteration):
-                example = random.choice(training_examples)
-                processed_examples.append(example)
-                
-            # Симуляция улучшения модели
-            accuracy_improvement = random.uniform(0.1, max_accuracy_improvement)
-            
-            # Создание нового примера кода на основе обучения
-            new_example = create_new_code_example()
-            
-            # Обновление статистики модели
-            model_improvement_stats["iterations"] = iteration
-            model_improvement_stats["last_updated"] = datetime.utcnow()
-            model_improvement_stats["total_samples_processed"] += len(processed_examples)
-            model_improvement_stats["improvements"].append({
-                "iteration": iteration,
-                "timestamp": datetime.utcnow().isoformat(),
-                "accuracy_improvement": accuracy_improvement,
-                "samples_processed": len(processed_examples),
-                "new_example_created": new_example.id if new_example else None
-            })
-            
-            # Создание записи о новой версии модели
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+
+                # Wait until requests go quiet, but never beyond max_delay
+                while True:
+                    now = time.monotonic()
+                    deadline = min(self._last_request + self.debounce, self._first_request + self.max_delay)
+                    if now >= deadline:
+                        break
+                    self._condition.wait(deadline - now)
+
+                languages = sorted(self._pending)
+                app = self._app
+                self._pending.clear()
+                self._first_request = None
+
             try:
-                # Мы используем имеющийся контекст приложения вместо создания нового
-                new_version = f"0.1.{iteration}"
-                
-                # Параметры модели
-                parameters = {
-                    "learning_rate": Config.LEARNING_RATE,
-                    "examples_processed": model_improvement_stats["total_samples_processed"],
-                    "training_languages": list(set(ex["language"] for ex in processed_examples))
-                }
-                
-                # Метрики производительности
-                metrics = {
-                    "accuracy_improvement": accuracy_improvement,
-                    "total_iterations": iteration,
-                    "last_processed_languages": list(set(ex["language"] for ex in processed_examples))
-                }
-                
-                # Использование простой записи в словарь вместо базы данных для этой демо версии
-                # В реальном приложении здесь был бы нормальный код работы с базой данных
-                model_improvement_stats["last_model_version"] = {
-                    "version": new_version,
-                    "description": f"Automatically improved model after iteration {iteration}",
-                    "parameters": parameters,
-                    "performance_metrics": metrics
-                }
-                
-                logger.info(f"New model version created: {new_version} with accuracy improvement: {accuracy_improvement:.2f}%")
+                with app.app_context():
+                    for language in languages:
+                        self._update_language(language)
             except Exception as e:
-                logger.error(f"Error creating model version: {str(e)}")
-            
-            # Ожидание до следующей итерации
-            time.sleep(learning_interval)
-            
-    except Exception as e:
-        logger.error(f"Error in continuous learning task: {str(e)}")
-        
-def create_new_code_example():
+                logger.error(f"Error in model update trigger: {str(e)}")
+                logger.debug(traceback.format_exc())
+
+    def _update_language(self, language):
+        """Claim the pending feedback for a language and run one batched update"""
+        counter = db.session.get(LanguageFeedbackCounter, language)
+        claimed = counter.pending_count if counter else 0
+
+        # Conditional decrement so only one worker process claims the batch
+        result = db.session.execute(
+            update(LanguageFeedbackCounter).where(
+                LanguageFeedbackCounter.language == language,
+                LanguageFeedbackCounter.pending_count >= max(claimed, Config.FEEDBACK_THRESHOLD)
+            ).values(pending_count=LanguageFeedbackCounter.pending_count - claimed)
+        )
+        db.session.commit()
+
+        if not result.rowcount:
+            self.stats["skipped"] += 1
+            logger.debug(f"Model update for {language} already claimed or below threshold")
+            return
+
+        applied = False
+        try:
+            feedback_data = collect_feedback_data(language)
+            if not feedback_data:
+                self.stats["skipped"] += 1
+                logger.info(f"No valid feedback data for {language}, skipping update")
+                return
+
+            update_result = update_model_weights(feedback_data, language)
+            if update_result["status"] != "success":
+                # Nothing was trained, so there is no new version to record
+                self.stats["skipped"] += 1
+                logger.info(f"Model update for {language} skipped: {update_result['message']}")
+                return
+            record_model_update(language, update_result, len(feedback_data))
+            applied = True
+            self.stats["updates"] += 1
+            self.stats["last_update"] = datetime.utcnow().isoformat()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error updating model for {language}: {str(e)}")
+        finally:
+            if not applied:
+                # Give the claimed feedback back so the next trigger retries it
+                db.session.execute(
+                    update(LanguageFeedbackCounter).where(
+                        LanguageFeedbackCounter.language == language
+                    ).values(pending_count=LanguageFeedbackCounter.pending_count + claimed)
+                )
+                db.session.commit()
+
+# Shared trigger for this process
+model_update_trigger = ModelUpdateTrigger()
+
+def _hour_bucket(timestamp):
+    """Truncate a timestamp to the start of its hour"""
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+def _rating_column(rating):
+    """Return the histogram column name for a 1-5 rating, or None"""
+    if rating is not None and 1 <= rating <= 5:
+        return f"rating_{rating}"
+    return None
+
+def _increment_row(model, filters, increments, defaults):
     """
-    Создает новый пример кода на основе обучения модели
-    Для демо-версии просто возвращает информацию о примере, не сохраняя в БД
+    Atomically add increments to a rollup row, creating it if missing
+
+    The UPDATE runs first so concurrent writers never lose counts; a missing
+    row is inserted inside a savepoint and the UPDATE is retried if another
+    worker created it in the meantime.
     """
+    conditions = [getattr(model, key) == value for key, value in filters.items()]
+    values = {key: getattr(model, key) + amount for key, amount in increments.items()}
+
+    result = db.session.execute(update(model).where(*conditions).values(**values))
+    if result.rowcount:
+        return
+
     try:
-        # Список возможных категорий примеров кода
-        categories = ["algorithm", "data-structure", "utility", "pattern"]
-        
-        # Список возможных языков
-        languages = Config.SUPPORTED_LANGUAGES
-        
-        # Генерация случайного примера кода
-        language = random.choice(languages)
-        category = random.choice(categories)
-        
-        code_snippets = {
-            "python": {
-                "algorithm": "def merge_sort(arr):\n    if len(arr) <= 1:\n        return arr\n    mid = len(arr) // 2\n    left = merge_sort(arr[:mid])\n    right = merge_sort(arr[mid:])\n    return merge(left, right)\n\ndef merge(left, right):\n    result = []\n    i = j = 0\n    while i < len(left) and j < len(right):\n        if left[i] < right[j]:\n            result.append(left[i])\n            i += 1\n        else:\n            result.append(right[j])\n            j += 1\n    result.extend(left[i:])\n    result.extend(right[j:])\n    return result",
-                "data-structure": "class TreeNode:\n    def __init__(self, val=0, left=None, right=None):\n        self.val = val\n        self.left = left\n        self.right = right\n\nclass BinarySearchTree:\n    def __init__(self):\n        self.root = None\n        \n    def insert(self, val):\n        if not self.root:\n            self.root = TreeNode(val)\n            return\n        self._insert_recursive(self.root, val)\n        \n    def _insert_recursive(self, node, val):\n        if val < node.val:\n            if node.left is None:\n                node.left = TreeNode(val)\n            else:\n                self._insert_recursive(node.left, val)\n        else:\n            if node.right is None:\n                node.right = TreeNode(val)\n            else:\n                self._insert_recursive(node.right, val)",
-            },
-            "javascript": {
-                "algorithm": "function mergeSort(arr) {\n  if (arr.length <= 1) return arr;\n  \n  const mid = Math.floor(arr.length / 2);\n  const left = mergeSort(arr.slice(0, mid));\n  const right = mergeSort(arr.slice(mid));\n  \n  return merge(left, right);\n}\n\nfunction merge(left, right) {\n  let result = [];\n  let i = 0, j = 0;\n  \n  while (i < left.length && j < right.length) {\n    if (left[i] < right[j]) {\n      result.push(left[i]);\n      i++;\n    } else {\n      result.push(right[j]);\n      j++;\n    }\n  }\n  \n  return [...result, ...left.slice(i), ...right.slice(j)];\n}",
-                "utility": "function debounce(func, wait, immediate) {\n  let timeout;\n  \n  return function executedFunction() {\n    const context = this;\n    const args = arguments;\n    \n    const later = function() {\n      timeout = null;\n      if (!immediate) func.apply(context, args);\n    };\n    \n    const callNow = immediate && !timeout;\n    \n    clearTimeout(timeout);\n    \n    timeout = setTimeout(later, wait);\n    \n    if (callNow) func.apply(context, args);\n  };\n};"
-            }
-        }
-        
-        # Выбор кода на основе языка и категории
-        if language in code_snippets and category in code_snippets[language]:
-            code_snippet = code_snippets[language][category]
-        else:
-            # Резервный вариант, если нет подходящего примера
-            code_snippet = f"// Example code for {language} in category {category}"
-        
-        # Создание объяснения для примера кода
-        explanations = {
-            "algorithm": f"This is an implementation of a popular algorithm in {language}. It demonstrates efficient problem solving.",
-            "data-structure": f"A custom data structure implementation in {language} that shows how to organize and manage data efficiently.",
-            "utility": f"A utility function in {language} that can be used across different projects to simplify common tasks.",
-            "pattern": f"An implementation of a design pattern in {language} that shows best practices for code organization."
-        }
-        
-        explanation = explanations.get(category, f"Example code for {language}")
-        
-        # В демо-версии возвращаем виртуальный пример, не сохраняя в БД
-        example_data = {
-            "id": random.randint(1000, 9999),  # Для демо используем случайный ID
-            "language": language,
-            "code_snippet": code_snippet,
-            "explanation": explanation,
-            "category": category
+        with db.session.begin_nested():
+            db.session.add(model(**filters, **defaults, **increments))
+    except IntegrityError:
+        db.session.execute(update(model).where(*conditions).values(**values))
+
+def update_feedback_aggregates(feedback):
+    """
+    Fold a single feedback item into the persisted rollup tables
+
+    Must be called in the same session as the feedback insert so the
+    rollups and the raw rows are committed together.
+
+    Args:
+        feedback (Feedback): Feedback object being written
+    """
+    created_at = feedback.created_at or datetime.utcnow()
+    rated = _rating_column(feedback.rating)
+
+    bucket_increments = {"count": 1}
+    counter_increments = {"total_count": 1, "pending_count": 1}
+    if rated:
+        bucket_increments.update({"rating_count": 1, "rating_sum": feedback.rating, rated: 1})
+        counter_increments.update({"rating_count": 1, "rating_sum": feedback.rating})
+
+    bucket_defaults = {column: 0 for column in (
+        "count", "rating_count", "rating_sum",
+        "rating_1", "rating_2", "rating_3", "rating_4", "rating_5"
+    ) if column not in bucket_increments}
+    counter_defaults = {column: 0 for column in (
+        "total_count", "pending_count", "rating_count", "rating_sum"
+    ) if column not in counter_increments}
+
+    _increment_row(
+        FeedbackAggregate,
+        {"language": feedback.language, "feedback_type": feedback.feedback_type, "hour": _hour_bucket(created_at)},
+        bucket_increments,
+        bucket_defaults
+    )
+    _increment_row(
+        LanguageFeedbackCounter,
+        {"language": feedback.language},
+        counter_increments,
+        counter_defaults
+    )
+
+def rebuild_feedback_aggregates(batch_size=1000):
+    """
+    Rebuild the feedback rollup tables from the full feedback history
+
+    Pending counts (feedback since the last model update) are preserved so
+    a backfill does not re-trigger model updates.
+
+    Args:
+        batch_size (int): Number of feedback rows to load per batch
+
+    Returns:
+        dict: Number of feedback rows scanned and rollup rows written
+    """
+    buckets = {}
+    counters = {}
+    scanned = 0
+
+    for fb in Feedback.query.order_by(Feedback.id).yield_per(batch_size):
+        scanned += 1
+        created_at = fb.created_at or datetime.utcnow()
+        key = (fb.language, fb.feedback_type, _hour_bucket(created_at))
+        bucket = buckets.setdefault(key, {
+            "count": 0, "rating_count": 0, "rating_sum": 0,
+            "rating_1": 0, "rating_2": 0, "rating_3": 0, "rating_4": 0, "rating_5": 0
+        })
+        counter = counters.setdefault(fb.language, {"total_count": 0, "rating_count": 0, "rating_sum": 0})
+
+        bucket["count"] += 1
+        counter["total_count"] += 1
+
+        rated = _rating_column(fb.rating)
+        if rated:
+            bucket["rating_count"] += 1
+            bucket["rating_sum"] += fb.rating
+            bucket[rated] += 1
+            counter["rating_count"] += 1
+            counter["rating_sum"] += fb.rating
+
+    try:
+        pending = {
+            row.language: row.pending_count
+            for row in LanguageFeedbackCounter.query.all()
         }
-        
-        logger.info(f"Created new code example: {language} - {category}")
-        
-        # Создаем простой объект с атрибутом id для совместимости
-        class SimpleObject:
-            def __init__(self, id):
-                self.id = id
-                
-        return SimpleObject(example_data["id"])
-        
+
+        FeedbackAggregate.query.delete()
+        LanguageFeedbackCounter.query.delete()
+
+        for (language, feedback_type, hour), values in buckets.items():
+            db.session.add(FeedbackAggregate(language=language, feedback_type=feedback_type, hour=hour, **values))
+
+        for language, values in counters.items():
+            db.session.add(LanguageFeedbackCounter(
+                language=language,
+                pending_count=min(pending.get(language, 0), values["total_count"]),
+                **values
+            ))
+
+        db.session.commit()
     except Exception as e:
-        logger.error(f"Error creating code example: {str(e)}")
-        return None
+        db.session.rollback()
+        logger.error(f"Error rebuilding feedback aggregates: {str(e)}")
+        raise
+
+    logger.info(f"Rebuilt feedback aggregates from {scanned} feedback items: "
+                f"{len(buckets)} hourly buckets, {len(counters)} languages")
+
+    return {"feedback_scanned": scanned, "buckets": len(buckets), "languages": len(counters)}
+
+def get_feedback_stats(language=None, hours=24):
+    """
+    Read feedback statistics from the rollup tables
+
+    Args:
+        language (str): Restrict to one language (optional)
+        hours (int): Number of recent hourly buckets to include
+
+    Returns:
+        dict: Per-language totals and recent hourly buckets
+    """
+    counters = LanguageFeedbackCounter.query
+    buckets = FeedbackAggregate.query.filter(
+        FeedbackAggregate.hour >= _hour_bucket(datetime.utcnow() - timedelta(hours=hours))
+    )
+    if language:
+        counters = counters.filter_by(language=language)
+        buckets = buckets.filter_by(language=language)
+
+    return {
+        "languages": [row.to_dict() for row in counters.order_by(LanguageFeedbackCounter.language).all()],
+        "hourly": [row.to_dict() for row in buckets.order_by(FeedbackAggregate.hour).all()],
+        "feedback_threshold": Config.FEEDBACK_THRESHOLD,
+        "model_updates": dict(model_update_trigger.stats)
+    }
+
+def collect_feedback_data(language, limit=100):
+    """
+    Collect recent corrected feedback for a model update
+    
+    Args:
+        language (str): Programming language
+        limit (int): Maximum number of recent feedback items to scan
+        
+    Returns:
+        list: Feedback items with input, expected output and type
+    """
+    recent_feedback = Feedback.query.filter_by(
+        language=language
+    ).order_by(
+        Feedback.created_at.desc()
+    ).limit(limit).all()
+    
+    # Only use feedback with corrected output
+    return [{
+        'id': fb.id,
+        'input': fb.code_input,
+        'expected': fb.corrected_output,
+        'feedback_type': fb.feedback_type,
+        'rating': fb.rating
+    } for fb in recent_feedback if fb.corrected_output]
 
 def process_feedback(feedback):
     """
@@ -206,58 +345,25 @@ def process_feedback(feedback):
     Args:
         feedback (Feedback): Feedback object
     """
-    # Increment feedback count for this language
-    feedback_counts[feedback.language] += 1
+    # Read the persisted per-language counter instead of scanning feedback
+    counter = db.session.get(LanguageFeedbackCounter, feedback.language)
     
-    # Check if we've reached the threshold to update the model
-    if feedback_counts[feedback.language] >= Config.FEEDBACK_THRESHOLD:
-        logger.info(f"Feedback threshold reached for {feedback.language}, triggering model update")
-        
-        # Get recent feedback for this language
-        recent_feedback = Feedback.query.filter_by(
-            language=feedback.language
-        ).order_by(
-            Feedback.created_at.desc()
-        ).limit(100).all()
-        
-        # Prepare feedback data for model update
-        feedback_data = []
-        for fb in recent_feedback:
-            # Only use feedback with corrected output
-            if fb.corrected_output:
-                feedback_data.append({
-                    'input': fb.code_input,
-                    'expected': fb.corrected_output or fb.model_output,
-                    'feedback_type': fb.feedback_type
-                })
-        
-        # Update model if we have valid feedback data
-        if feedback_data:
-            try:
-                # Update model weights (simulated)
-                update_result = update_model_weights(feedback_data)
-                
-                # Record model version update
-                record_model_update(feedback.language, update_result, len(feedback_data))
-                
-                # Reset counter
-                feedback_counts[feedback.language] = 0
-                
-            except Exception as e:
-                logger.error(f"Error updating model for {feedback.language}: {str(e)}")
-        else:
-            logger.info(f"No valid feedback data for {feedback.language}, skipping update")
+    # Hand off to the trigger once the threshold is crossed; the update itself
+    # runs debounced and batched outside the request
+    if counter and counter.pending_count >= Config.FEEDBACK_THRESHOLD:
+        logger.info(f"Feedback threshold reached for {feedback.language}, scheduling model update")
+        model_update_trigger.request(feedback.language)
 
-def record_completion_feedback(user_id, code_input, model_output, corrected_output, language, rating=None):
+def record_feedback(code_input, model_output, corrected_output, language, feedback_type, rating=None):
     """
-    Record feedback for code completion
+    Record feedback and update the rollup tables in the same transaction
     
     Args:
-        user_id (int): User ID
         code_input (str): Original code input
-        model_output (str): Generated completion by model
-        corrected_output (str): User corrected completion (optional)
+        model_output (str): Output produced by the model
+        corrected_output (str): User corrected output (optional)
         language (str): Programming language
+        feedback_type (str): 'completion', 'error', 'suggestion' or 'generation'
         rating (int): User rating 1-5 (optional)
         
     Returns:
@@ -265,18 +371,22 @@ def record_completion_feedback(user_id, code_input, model_output, corrected_outp
     """
     try:
         feedback = Feedback(
-            user_id=user_id,
             code_input=code_input,
             model_output=model_output,
             corrected_output=corrected_output,
             language=language,
-            feedback_type='completion',
-            rating=rating
+            feedback_type=feedback_type,
+            rating=rating,
+            created_at=datetime.utcnow()
         )
         
         db.session.add(feedback)
+        update_feedback_aggregates(feedback)
         db.session.commit()
         
+        # Хорошо оценённые исправления сразу доступны для мгновенного завершения
+        completion_index.add_feedback(feedback)
+        
         # Process feedback for learning
         process_feedback(feedback)
         
@@ -284,9 +394,26 @@ def record_completion_feedback(user_id, code_input, model_output, corrected_outp
     
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error recording completion feedback: {str(e)}")
+        logger.error(f"Error recording feedback: {str(e)}")
         raise
 
+def record_completion_feedback(user_id, code_input, model_output, corrected_output, language, rating=None):
+    """
+    Record feedback for code completion
+    
+    Args:
+        user_id (int): User ID (not stored, feedback is anonymous)
+        code_input (str): Original code input
+        model_output (str): Generated completion by model
+        corrected_output (str): User corrected completion (optional)
+        language (str): Programming language
+        rating (int): User rating 1-5 (optional)
+        
+    Returns:
+        Feedback: Created feedback object
+    """
+    return record_feedback(code_input, model_output, corrected_output, language, 'completion', rating)
+
 def record_model_update(language, update_result, feedback_count):
     """
     Record a model update in the database
@@ -301,13 +428,15 @@ def record_model_update(language, update_result, feedback_count):
         parameters = {
             "language": language,
             "feedback_count": feedback_count,
-            "learning_rate": Config.LEARNING_RATE
+            "learning_rate": Config.LEARNING_RATE,
+            **update_result.get("parameters", {})
         }
         
         # Create metrics JSON
         metrics = {
             "status": update_result.get("status", "unknown"),
-            "message": update_result.get("message", "")
+            "message": update_result.get("message", ""),
+            **update_result.get("metrics", {})
         }
         
         # Create new model version record
@@ -0,0 +1,380 @@
+"""
+Prometheus-style metrics for CodevAI
+
+Metrics are kept in memory per process, with one short lock per metric
+family. Under gunicorn every worker periodically writes a snapshot to
+METRICS_MULTIPROC_DIR, and the /metrics endpoint merges the snapshots of all
+workers so a scrape of any worker sees the totals of the whole server.
+Gauges are per-process state and are exported per live worker with a pid
+label instead of being summed. Snapshot files are keyed by pid and process
+start time, so a worker that reuses a dead worker's pid does not overwrite
+its totals.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from flask import request, g
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, wide enough for slow upstream generations
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Snapshots are written at most this often per worker
+FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", 5))
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + list(extra or [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def snapshot(self):
+        with self._lock:
+            return {json.dumps(key): self._copy(value) for key, value in self._values.items()}
+
+    def _copy(self, value):
+        return value
+
+class Counter(_Metric):
+    """Monotonic counter"""
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    """
+    Point-in-time value
+
+    Gauges can be set directly or computed at collection time by a callback
+    returning either a number or a dict of label tuples to numbers.
+    """
+    type_name = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function):
+        self._function = function
+
+    def snapshot(self):
+        if self._function:
+            try:
+                value = self._function()
+            except Exception as e:
+                logger.debug(f"Gauge {self.name} callback failed: {str(e)}")
+                value = None
+            if value is None:
+                return {}
+            if not isinstance(value, dict):
+                value = {(): value}
+            return {json.dumps(list(key)): number for key, number in value.items()}
+        return super().snapshot()
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed buckets"""
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (non-cumulative) plus +Inf, then sum
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    def _copy(self, value):
+        return list(value)
+
+class MetricsRegistry:
+    """Holds metric families and merges snapshots across worker processes"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+        self._pid = None
+        self._started = None
+
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def _process(self):
+        """pid and start time of this process; a forked worker gets its own"""
+        pid = os.getpid()
+        if self._pid != pid:
+            self._pid, self._started = pid, time.time()
+        return pid, self._started
+
+    def snapshot(self):
+        pid, started = self._process()
+        return {
+            "pid": pid,
+            "started": started,
+            "metrics": {name: metric.snapshot() for name, metric in list(self._metrics.items())}
+        }
+
+    @staticmethod
+    def multiprocess_dir():
+        return os.environ.get("METRICS_MULTIPROC_DIR")
+
+    def flush(self, force=False):
+        """Write this process's snapshot for other workers to merge"""
+        directory = self.multiprocess_dir()
+        now = time.monotonic()
+        if not directory or (not force and now - self._last_flush < FLUSH_INTERVAL):
+            return
+        self._last_flush = now
+
+        try:
+            os.makedirs(directory, exist_ok=True)
+            pid, started = self._process()
+            path = os.path.join(directory, f"metrics_{pid}_{int(started * 1000)}.json")
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.debug(f"Error writing metrics snapshot: {str(e)}")
+
+    def _load_snapshots(self):
+        own = self.snapshot()
+        snapshots = [own]
+        directory = self.multiprocess_dir()
+        if not directory or not os.path.isdir(directory):
+            return snapshots
+
+        for filename in os.listdir(directory):
+            if not filename.startswith("metrics_") or not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(directory, filename)) as f:
+                    snapshot = json.load(f)
+            except Exception:
+                continue
+            if (snapshot.get("pid"), snapshot.get("started")) != (own["pid"], own["started"]):
+                snapshots.append(snapshot)
+        return snapshots
+
+    @staticmethod
+    def _is_alive(pid):
+        try:
+            os.kill(pid, 0)
+            return True
+        except OSError:
+            return False
+
+    def render(self):
+        """
+        Render all metrics in the Prometheus text exposition format
+
+        Counters and histograms are summed over all worker snapshots, including
+        exited workers so totals never go backwards. Gauges describe the state
+        of one process (its queue, its circuits, its loaded data), so each live
+        worker's value is exported separately with a pid label.
+        """
+        snapshots = self._load_snapshots()
+        # A live pid may have been reused: only its newest snapshot is current
+        newest = {}
+        for snapshot in snapshots:
+            pid = snapshot.get("pid", 0)
+            if snapshot.get("started", 0) >= newest.get(pid, {}).get("started", 0):
+                newest[pid] = snapshot
+        lines = []
+
+        for name, metric in sorted(self._metrics.items()):
+            merged = {}
+            for snapshot in snapshots:
+                samples = snapshot.get("metrics", {}).get(name, {})
+                pid = snapshot.get("pid", 0)
+                if metric.type_name == "gauge":
+                    if newest[pid] is not snapshot or not self._is_alive(pid):
+                        continue
+                    for key, value in samples.items():
+                        merged[(key, pid)] = value
+                    continue
+                for key, value in samples.items():
+                    if metric.type_name == "histogram":
+                        current = merged.setdefault(key, [0] * len(value))
+                        merged[key] = [a + b for a, b in zip(current, value)]
+                    else:
+                        merged[key] = merged.get(key, 0) + value
+
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type_name}")
+
+            for key in sorted(merged):
+                value = merged[key]
+                if metric.type_name == "gauge":
+                    key, pid = key
+                    labels = _format_labels(metric.labelnames, json.loads(key), [("pid", pid)])
+                    lines.append(f"{name}{labels} {value}")
+                    continue
+                label_values = json.loads(key)
+                if metric.type_name == "histogram":
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets + ("+Inf",), value[:-1]):
+                        cumulative += count
+                        labels = _format_labels(metric.labelnames, label_values, [("le", bound)])
+                        lines.append(f"{name}_bucket{labels} {cumulative}")
+                    labels = _format_labels(metric.labelnames, label_values)
+                    lines.append(f"{name}_sum{labels} {value[-1]}")
+                    lines.append(f"{name}_count{labels} {cumulative}")
+                else:
+                    lines.append(f"{name}{_format_labels(metric.labelnames, label_values)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+# Process-wide registry
+registry = MetricsRegistry()
+
+http_requests = registry.counter(
+    "codevai_http_requests_total", "HTTP requests by route, method and status", ("route", "method", "status"))
+http_latency = registry.histogram(
+    "codevai_http_request_duration_seconds", "HTTP request latency by route", ("route", "method"))
+
+upstream_requests = registry.counter(
+    "codevai_upstream_requests_total", "Workers AI calls by model key and HTTP status", ("model", "status"))
+upstream_latency = registry.histogram(
+    "codevai_upstream_request_duration_seconds", "Workers AI call latency by model key", ("model",))
+upstream_tokens = registry.counter(
+    "codevai_upstream_tokens_total", "Tokens reported by Workers AI by model key", ("model", "kind"))
+circuit_state = registry.gauge(
+    "codevai_upstream_circuit_state", "Circuit breaker state by model key (0 closed, 1 half-open, 2 open)", ("model",))
+upstream_retries = registry.counter(
+    "codevai_upstream_retries_total", "Workers AI call retries by model key and reason", ("model", "reason"))
+upstream_concurrency = registry.gauge(
+    "codevai_upstream_concurrency", "Adaptive upstream concurrency limit and calls in flight", ("kind",))
+routing_decisions = registry.counter(
+    "codevai_routing_decisions_total", "Model routing decisions by task, chosen model and reason", ("task", "model", "reason"))
+
+crawler_pages = registry.counter(
+    "codevai_crawler_pages_total", "Pages processed by the continuous learner", ("result",))
+crawler_latency = registry.histogram(
+    "codevai_crawler_page_duration_seconds", "Time to fetch and extract knowledge from a page")
+crawler_queue_depth = registry.gauge(
+    "codevai_crawler_queue_depth", "URLs waiting in the learning queue")
+knowledge_items = registry.gauge(
+    "codevai_knowledge_items", "Items in the loaded knowledge base")
+
+local_syntax_checks = registry.counter(
+    "codevai_local_syntax_checks_total", "Local syntax checks by language and result", ("language", "result"))
+
+completion_index_size = registry.gauge(
+    "codevai_completion_index_size", "Known completions in the index and its memory footprint by language", ("language", "kind"))
+
+editor_requests = registry.counter(
+    "codevai_editor_requests_total", "Editor session requests by kind and outcome", ("kind", "outcome"))
+
+moderation_batch_duration = registry.histogram(
+    "codevai_moderation_batch_duration_seconds", "Time to moderate a batch of texts, cached verdicts included")
+
+deadline_exceeded = registry.counter(
+    "codevai_deadline_exceeded_total", "Request stages cut short by the request deadline", ("stage",))
+
+cache_lookups = registry.counter(
+    "codevai_cache_lookups_total", "Cache lookups by cache name and result", ("cache", "result"))
+
+def record_upstream_call(model, status, duration, usage=None):
+    """
+    Record one Workers AI call
+
+    Args:
+        model (str): Model key from CLOUDFLARE_MODELS / CF_MODELS (or model path)
+        status (str|int): HTTP status, or an error class name when no response arrived
+        duration (float): Call duration in seconds
+        usage (dict): Token usage reported by upstream (optional)
+    """
+    upstream_requests.inc(model=model, status=status)
+    upstream_latency.observe(duration, model=model)
+    if usage:
+        for kind in ("prompt_tokens", "completion_tokens"):
+            if isinstance(usage.get(kind), (int, float)):
+                upstream_tokens.inc(usage[kind], model=model, kind=kind.split("_")[0])
+
+def record_cache_lookup(cache, hit):
+    """
+    Record a cache hit or miss; hit ratios are derived from these counters
+
+    Args:
+        cache (str): Cache name
+        hit (bool): Whether the lookup was served from the cache
+    """
+    cache_lookups.inc(cache=cache, result="hit" if hit else "miss")
+
+def init_app(app):
+    """Instrument every request of an application"""
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop("metrics_start", None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            method = request.method
+            http_requests.inc(route=route, method=method, status=response.status_code)
+
+            def observe():
+                http_latency.observe(time.perf_counter() - start, route=route, method=method)
+                registry.flush()
+
+            if response.is_streamed:
+                # A streamed body is produced after the view returns: time it to the end
+                response.call_on_close(observe)
+            else:
+                observe()
+            return response
+        registry.flush()
+        return response
@@ -0,0 +1,257 @@
+"""
+Latency-aware routing of chat calls to Workers AI models
+
+Each task (completion, error check, detection, ...) has an entry in the
+routing policy table: candidate models in order of preference, a latency
+SLO, and an output budget. The budget is a base number of tokens plus a
+share of the input size, capped so that short answers cannot run into long
+generation tails.
+
+The router keeps an exponentially weighted latency estimate per model, task
+and input size bucket. It picks the first candidate whose predicted latency
+fits the task's SLO and whose circuit is not open. If no candidate fits, it
+picks the fastest one. Estimates expire after a minute without calls, so a
+model that was routed around gets probed again. Decisions are logged and the
+most recent ones are kept for the status endpoint.
+
+The defaults can be overridden per task with a JSON file in
+ROUTING_POLICY_FILE, e.g. {"completion": {"slo_ms": 2000, "max_tokens": 192}}.
+"""
+
+import json
+import time
+import logging
+import threading
+from collections import deque
+from config import Config
+from utils.circuit_breaker import breakers, OPEN
+from utils.metrics import routing_decisions
+
+logger = logging.getLogger(__name__)
+
+# Rough characters per token for budgeting before the call
+CHARS_PER_TOKEN = 4
+
+# Upper bounds (chars of system message + prompt) of the input size buckets
+INPUT_SIZE_BUCKETS = ((1000, "small"), (4000, "medium"), (16000, "large"))
+
+def input_size_bucket(input_chars):
+    return next((name for bound, name in INPUT_SIZE_BUCKETS if input_chars <= bound), "huge")
+
+DEFAULT_ROUTING_POLICY = {
+    # task: candidate models, latency SLO and output budget (tokens)
+    "completion": {
+        "models": ["llama3-8b", "llama3-70b"], "slo_ms": 3000,
+        "max_tokens": 256, "min_tokens": 64, "output_per_input": 0.0
+    },
+    "error_check": {
+        # The answer echoes the corrected code, so the budget grows with the input
+        "models": ["llama3-8b", "llama3-70b"], "slo_ms": 6000,
+        "max_tokens": 1536, "min_tokens": 256, "output_per_input": 1.2
+    },
+    "detection": {
+        "models": ["llama3-8b"], "slo_ms": 1500,
+        "max_tokens": 8, "min_tokens": 8, "output_per_input": 0.0
+    },
+    "thinking": {
+        "models": ["llama3-8b", "llama3-70b"], "slo_ms": 8000,
+        "max_tokens": 1024, "min_tokens": 256, "output_per_input": 0.5
+    },
+    "extraction": {
+        "models": ["llama3-8b", "llama3-70b"], "slo_ms": 10000,
+        "max_tokens": 768, "min_tokens": 256, "output_per_input": 0.2
+    },
+    "analysis": {
+        "models": ["llama3-70b", "llama3-8b"], "slo_ms": 12000,
+        "max_tokens": 1024, "min_tokens": 256, "output_per_input": 0.8
+    },
+    "chat": {
+        "models": ["llama3-8b", "llama3-70b"], "slo_ms": 8000,
+        "max_tokens": 768, "min_tokens": 128, "output_per_input": 0.5
+    },
+}
+
+def load_routing_policy(path=None):
+    """
+    Build the routing policy table, applying overrides from a JSON file
+
+    Args:
+        path (str): JSON file with per-task overrides (optional)
+
+    Returns:
+        dict: Policy per task
+    """
+    policy = {task: dict(entry) for task, entry in DEFAULT_ROUTING_POLICY.items()}
+    if not path:
+        return policy
+
+    try:
+        with open(path) as f:
+            overrides = json.load(f)
+        for task, entry in overrides.items():
+            policy.setdefault(task, dict(DEFAULT_ROUTING_POLICY["chat"])).update(entry)
+        logger.info(f"Routing policy overrides loaded from {path}")
+    except Exception as e:
+        logger.error(f"Error loading routing policy {path}: {str(e)}")
+    return policy
+
+class RoutingDecision:
+    """Model order and output budget chosen for one call"""
+    __slots__ = ("task", "models", "max_tokens", "predicted_ms", "slo_ms", "reason")
+
+    def __init__(self, task, models, max_tokens, predicted_ms, slo_ms, reason):
+        self.task = task
+        self.models = models
+        self.max_tokens = max_tokens
+        self.predicted_ms = predicted_ms
+        self.slo_ms = slo_ms
+        self.reason = reason
+
+    @property
+    def model(self):
+        return self.models[0]
+
+    def to_dict(self):
+        return {
+            "task": self.task,
+            "model": self.model,
+            "fallbacks": self.models[1:],
+            "max_tokens": self.max_tokens,
+            "predicted_ms": self.predicted_ms,
+            "slo_ms": self.slo_ms,
+            "reason": self.reason
+        }
+
+class ModelRouter:
+    """Chooses a model and an output budget per call from the policy table"""
+
+    def __init__(self, policy, alpha=0.2, max_age=60.0, history=50):
+        self.policy = policy
+        self.alpha = alpha
+        self.max_age = max_age
+        self._latency = {}  # (model, task, size bucket) -> (EWMA seconds, last observed)
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.recent = deque(maxlen=history)
+
+    def budget(self, task, input_chars, requested=None):
+        """
+        Output budget for a task
+
+        Args:
+            task (str): Task name from the policy table
+            input_chars (int): Size of system message and prompt
+            requested (int): Caller's own limit, capped by the policy (optional)
+
+        Returns:
+            int: max_tokens to send upstream
+        """
+        entry = self.policy.get(task, self.policy["chat"])
+        if requested:
+            return max(1, min(int(requested), entry["max_tokens"]))
+
+        input_tokens = input_chars / CHARS_PER_TOKEN
+        estimate = entry["min_tokens"] + entry["output_per_input"] * input_tokens
+        return int(min(entry["max_tokens"], max(entry["min_tokens"], estimate)))
+
+    def available(self, task):
+        """Whether any candidate model of a task has a circuit that is not open"""
+        entry = self.policy.get(task, self.policy["chat"])
+        return any(breakers.get(model).state != OPEN for model in entry["models"])
+
+    def predict_ms(self, model, task, input_chars):
+        """
+        Predicted call latency in ms
+
+        Uses the estimate for the same task and input size, then the slowest
+        size of the same task. None when the model has no fresh estimate.
+        """
+        fresh_since = time.monotonic() - self.max_age
+        estimate = self._latency.get((model, task, input_size_bucket(input_chars)))
+        if estimate is None or estimate[1] < fresh_since:
+            same_task = [
+                latency for (m, t, _), (latency, observed) in list(self._latency.items())
+                if m == model and t == task and observed >= fresh_since
+            ]
+            if not same_task:
+                return None
+            return round(max(same_task) * 1000, 1)
+        return round(estimate[0] * 1000, 1)
+
+    def route(self, task, input_chars, max_tokens=None):
+        """
+        Choose the model order and output budget for a call
+
+        Args:
+            task (str): Task name from the policy table
+            input_chars (int): Size of system message and prompt
+            max_tokens (int): Caller's output limit (optional)
+
+        Returns:
+            RoutingDecision: Models to try in order, budget and prediction
+        """
+        entry = self.policy.get(task, self.policy["chat"])
+        budget = self.budget(task, input_chars, max_tokens)
+        slo_ms = entry["slo_ms"]
+
+        candidates = [model for model in entry["models"] if breakers.get(model).state != OPEN]
+        if not candidates:
+            # All circuits open: keep the policy order, the gateway fails fast anyway
+            candidates = list(entry["models"])
+
+        predictions = {model: self.predict_ms(model, task, input_chars) for model in candidates}
+        chosen = next(
+            (model for model in candidates
+             if predictions[model] is None or predictions[model] <= slo_ms),
+            None
+        )
+
+        if chosen is not None:
+            reason = "preferred" if chosen == entry["models"][0] else "fits_slo"
+        else:
+            chosen = min(candidates, key=lambda model: predictions[model])
+            reason = "fastest_over_slo"
+
+        models = [chosen] + [model for model in candidates if model != chosen]
+        decision = RoutingDecision(task, models, budget, predictions[chosen], slo_ms, reason)
+
+        routing_decisions.inc(task=task, model=chosen, reason=reason)
+        self.recent.append(dict(decision.to_dict(), timestamp=time.time()))
+        logger.info(f"Routing {task}: {chosen} ({reason}), max_tokens={budget}, "
+                    f"predicted={decision.predicted_ms}ms, slo={slo_ms}ms, input={input_chars} chars")
+        return decision
+
+    def observe(self, model, task, input_chars, duration):
+        """
+        Update a model's latency estimate after a successful call
+
+        Args:
+            model (str): Model key
+            task (str): Task the call was made for
+            input_chars (int): Size of system message and prompt
+            duration (float): Call duration in seconds
+        """
+        key = (model, task, input_size_bucket(input_chars))
+        with self._lock:
+            previous = self._latency.get(key)
+            latency = duration if previous is None else previous[0] + self.alpha * (duration - previous[0])
+            self._latency[key] = (latency, time.monotonic())
+            self._calls[key] = self._calls.get(key, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            latency = [
+                {
+                    "model": model,
+                    "task": task,
+                    "input_size": size,
+                    "latency_ms": round(latency * 1000, 1),
+                    "age_seconds": round(time.monotonic() - observed, 1),
+                    "observed_calls": self._calls.get((model, task, size), 0)
+                }
+                for (model, task, size), (latency, observed) in sorted(self._latency.items())
+            ]
+        return {"latency": latency, "recent_decisions": list(self.recent)[-10:]}
+
+# Process-wide router
+model_router = ModelRouter(load_routing_policy(Config.ROUTING_POLICY_FILE))
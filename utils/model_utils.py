@@ -74,21 +74,45 @@ def get_language_model(language=None, task="completion"):
 
 def get_language_model_version():
     """Get the current language model version information"""
+    from models import ModelVersion
+    
+    latest = ModelVersion.query.order_by(ModelVersion.created_at.desc()).first()
     return {
-        "version": "0.1.0-demo",
-        "base_model": "Demo model - no real AI used",
+        "version": latest.version if latest else "untrained",
+        "base_model": f"Cloudflare Workers AI with a local token {Config.NGRAM_ORDER}-gram fallback",
         "supported_languages": Config.SUPPORTED_LANGUAGES,
-        "last_updated": "2025-05-16"
+        "last_updated": latest.created_at.strftime("%Y-%m-%d") if latest and latest.created_at else None
     }
 
-def update_model_weights(feedback_data):
+def update_model_weights(feedback_data, language):
     """
-    Update model weights based on feedback (simulated)
+    Train the local n-gram completion model on new feedback
+    
+    Args:
+        feedback_data (list): Items from collect_feedback_data
+        language (str): Programming language of the items
+        
+    Returns:
+        dict: Status ('success', or 'skipped' when nothing new was trained),
+              new version and training metrics
     """
-    logger.info(f"Demo mode: simulating model update with {len(feedback_data)} feedback items")
+    from utils.ngram_model import ngram_models
+    
+    metrics = ngram_models.train_feedback(language, feedback_data)
+    if not metrics["samples"]:
+        return {
+            "status": "skipped",
+            "message": f"No new rated completions among {len(feedback_data)} feedback items",
+            "metrics": metrics
+        }
+    
+    logger.info(f"Trained {language} n-gram model on {metrics['samples']} of {len(feedback_data)} "
+                f"feedback items ({metrics['tokens']} tokens)")
     
     return {
         "status": "success",
-        "message": f"Demo mode: Model update simulated with {len(feedback_data)} feedback items",
-        "new_version": "0.1.1-demo"
+        "message": f"N-gram model trained on {metrics['samples']} new rated completions",
+        "new_version": metrics["version"],
+        "parameters": {"order": metrics["order"], "max_ngrams": ngram_models.max_ngrams},
+        "metrics": metrics
     }
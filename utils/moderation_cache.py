@@ -0,0 +1,98 @@
+"""
+Persistent cache of moderation verdicts
+
+Verdicts are keyed by the SHA-256 of the moderated text. Lookups go to an
+in-process LRU first and then, for the misses, to the ModerationVerdict
+table in one query, so verdicts survive restarts and are shared by all
+workers. Outside an application context (e.g. in a script) only the
+in-process cache is used.
+"""
+
+import json
+import hashlib
+import logging
+from flask import has_app_context
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from config import Config
+from utils.cache import LRUCache
+from utils.metrics import record_cache_lookup
+
+logger = logging.getLogger(__name__)
+
+def text_digest(text):
+    """SHA-256 of a text, the key of its verdict"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class VerdictCache:
+    """In-process LRU in front of the ModerationVerdict table"""
+
+    def __init__(self, max_entries=50000):
+        self.memory = LRUCache(max_entries)
+
+    def get_many(self, digests):
+        """
+        Look up verdicts
+
+        Args:
+            digests (list): Text digests
+
+        Returns:
+            dict: digest -> verdict for the digests that have one
+        """
+        found = {}
+        missing = []
+        for digest in digests:
+            verdict = self.memory.get(digest)
+            if verdict is None:
+                missing.append(digest)
+            else:
+                found[digest] = verdict
+
+        if missing and has_app_context():
+            from models import ModerationVerdict, db
+            try:
+                rows = db.session.execute(
+                    db.select(ModerationVerdict).where(ModerationVerdict.digest.in_(missing))
+                ).scalars()
+                for row in rows:
+                    found[row.digest] = json.loads(row.result)
+                    self.memory.set(row.digest, found[row.digest])
+            except SQLAlchemyError as e:
+                # Without a database only the in-memory cache is used
+                db.session.rollback()
+                logger.warning(f"Moderation verdicts not loaded: {str(e)}")
+
+        for digest in digests:
+            record_cache_lookup("moderation_verdicts", digest in found)
+        return found
+
+    def put_many(self, verdicts, model):
+        """
+        Store new verdicts
+
+        Args:
+            verdicts (dict): digest -> verdict
+            model (str): Model that produced them
+        """
+        for digest, verdict in verdicts.items():
+            self.memory.set(digest, verdict)
+
+        if not verdicts or not has_app_context():
+            return
+
+        from models import ModerationVerdict, db
+        try:
+            for digest, verdict in verdicts.items():
+                try:
+                    with db.session.begin_nested():
+                        db.session.add(ModerationVerdict(digest=digest, model=model, result=json.dumps(verdict)))
+                except IntegrityError:
+                    # Another request checked the same text at the same time
+                    pass
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.warning(f"Moderation verdicts not saved: {str(e)}")
+
+# Process-wide verdict cache shared by every moderation call
+verdict_cache = VerdictCache(max_entries=Config.MODERATION_CACHE_SIZE)
@@ -0,0 +1,444 @@
+"""
+Local token n-gram completion model
+
+A CPU-only statistical model per language, trained incrementally on
+CodeExample rows and highly rated corrected completions. It is a fast
+first-pass suggestion engine for /api/complete when Workers AI is slow or
+unavailable, not a replacement for the LLM.
+
+Code is split into identifier, number, string, operator and whitespace
+tokens (a line break keeps its indentation), so generated tokens can simply
+be concatenated. For every context of 1..order-1 preceding tokens the model
+counts the following token. Counts live in open-addressing hash tables made
+of flat arrays (64-bit key hashes plus unsigned counters) instead of dicts
+of tuples, which takes a fraction of the memory. Each context also remembers
+its most frequent successor, so greedy generation needs one table probe per
+token and order.
+
+When the table of n-grams outgrows its limit, the rarest n-grams are pruned
+and the context table is rebuilt from what is left.
+
+The models live in each worker process, but their training data is in the
+database: build() only reads rows past its watermarks, and every worker
+runs it again at most NGRAM_REFRESH_INTERVAL seconds after its last sync, so
+feedback trained on by one worker reaches the others.
+"""
+
+import re
+import time
+import logging
+import threading
+from array import array
+from datetime import datetime
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(
+    r"\n[ \t]*|[ \t]+|[A-Za-z_$][\w$]*|\d+(?:\.\d+)?"
+    r"|\"(?:\\.|[^\"\\\n])*\"|'(?:\\.|[^'\\\n])*'"
+    r"|//[^\n]*|#[^\n]*"
+    r"|==|!=|<=|>=|->|=>|\+=|-=|\*=|/=|\*\*|&&|\|\||::|<<|>>|\+\+|--|:="
+    r"|."
+)
+
+# Reserved token ids
+BOS, EOS, UNK = 1, 2, 3
+_FIRST_TOKEN_ID = 4
+
+_MASK64 = (1 << 64) - 1
+
+def _key(value):
+    # The hash of a tuple of ints does not depend on PYTHONHASHSEED; 0 marks an empty slot
+    return (hash(value) & _MASK64) or 1
+
+def tokenize(code):
+    """Split code into tokens whose concatenation gives back the code (with runs of spaces collapsed)"""
+    tokens = []
+    for token in _TOKEN.findall(code.replace("\r\n", "\n")):
+        if token[0] in " \t":
+            token = " "
+        tokens.append(token)
+    return tokens
+
+class _HashTable:
+    """Open-addressing hash table of 64-bit keys with parallel array columns"""
+
+    def __init__(self, columns, capacity=1024):
+        self.columns = columns  # name -> array typecode
+        self.size = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.capacity = capacity
+        self.mask = capacity - 1
+        self.keys = array("Q", bytes(8 * capacity))
+        self.values = {name: array(code, bytes(array(code).itemsize * capacity))
+                       for name, code in self.columns.items()}
+
+    def find(self, key):
+        """Slot of a key, or -1"""
+        keys, mask = self.keys, self.mask
+        i = key & mask
+        while True:
+            current = keys[i]
+            if current == key:
+                return i
+            if current == 0:
+                return -1
+            i = (i + 1) & mask
+
+    def insert(self, key):
+        """Slot of a key, adding it (with zero values) if missing; returns (slot, added)"""
+        if (self.size + 1) * 10 > self.capacity * 7:
+            self._rehash(self.capacity * 2, self.used_slots())
+        keys, mask = self.keys, self.mask
+        i = key & mask
+        while True:
+            current = keys[i]
+            if current == key:
+                return i, False
+            if current == 0:
+                keys[i] = key
+                self.size += 1
+                return i, True
+            i = (i + 1) & mask
+
+    def used_slots(self):
+        keys = self.keys
+        return [i for i in range(self.capacity) if keys[i]]
+
+    def _rehash(self, capacity, slots):
+        old_keys, old_values = self.keys, self.values
+        self._allocate(capacity)
+        self.size = 0
+        for slot in slots:
+            new_slot, _ = self.insert(old_keys[slot])
+            for name, column in old_values.items():
+                self.values[name][new_slot] = column[slot]
+
+    def keep(self, slots):
+        """Drop every entry except the given slots"""
+        capacity = 1024
+        while len(slots) * 10 > capacity * 7:
+            capacity *= 2
+        self._rehash(capacity, slots)
+
+    def memory_bytes(self):
+        total = self.keys.itemsize * self.capacity
+        for column in self.values.values():
+            total += column.itemsize * self.capacity
+        return total
+
+class NGramModel:
+    """Token n-gram counts for one language with greedy generation"""
+
+    def __init__(self, language, order=4, max_ngrams=500000, max_vocab=50000):
+        self.language = language
+        self.order = order
+        self.max_ngrams = max_ngrams
+        self.max_vocab = max_vocab
+        self.vocab = {}
+        self.tokens = [None, None, None, None]  # id -> token for ids >= _FIRST_TOKEN_ID
+        # (context, next) -> count; context hash kept to rebuild contexts after pruning
+        self.ngrams = _HashTable({"count": "I", "next": "I", "context": "Q"})
+        # context -> most frequent next token, its count and the context's total
+        self.contexts = _HashTable({"best_next": "I", "best_count": "I", "total": "I"})
+        self.trained_tokens = 0
+        self.documents = 0
+        self.prunes = 0
+        self._lock = threading.Lock()
+
+    def _token_id(self, token, add):
+        token_id = self.vocab.get(token)
+        if token_id is None:
+            if not add or len(self.tokens) - _FIRST_TOKEN_ID >= self.max_vocab:
+                return UNK
+            token_id = len(self.tokens)
+            self.vocab[token] = token_id
+            self.tokens.append(token)
+        return token_id
+
+    def _count(self, context, next_id):
+        context_key = _key(context)
+        slot, _ = self.ngrams.insert(_key((context, next_id)))
+        counts = self.ngrams.values["count"]
+        count = counts[slot] + 1
+        counts[slot] = count
+        self.ngrams.values["next"][slot] = next_id
+        self.ngrams.values["context"][slot] = context_key
+
+        slot, _ = self.contexts.insert(context_key)
+        values = self.contexts.values
+        values["total"][slot] += 1
+        if count > values["best_count"][slot]:
+            values["best_count"][slot] = count
+            values["best_next"][slot] = next_id
+
+    def train(self, texts):
+        """
+        Add documents to the counts
+
+        Args:
+            texts (iterable): Code samples
+
+        Returns:
+            int: Number of tokens trained on
+        """
+        trained = 0
+        for text in texts:
+            if not text:
+                continue
+            with self._lock:
+                ids = [BOS] * (self.order - 1)
+                ids.extend(self._token_id(token, True) for token in tokenize(text))
+                ids.append(EOS)
+                for position in range(self.order - 1, len(ids)):
+                    next_id = ids[position]
+                    for length in range(1, self.order):
+                        self._count(tuple(ids[position - length:position]), next_id)
+                trained += len(ids) - self.order + 1
+                self.documents += 1
+                if self.ngrams.size > self.max_ngrams:
+                    self._prune()
+        self.trained_tokens += trained
+        return trained
+
+    def _prune(self):
+        """Drop the rarest n-grams until the table is at 3/4 of its limit, then rebuild contexts"""
+        counts = self.ngrams.values["count"]
+        slots = self.ngrams.used_slots()
+        threshold = 1
+        kept = slots
+        while len(kept) > self.max_ngrams * 3 // 4:
+            kept = [slot for slot in kept if counts[slot] > threshold]
+            threshold += 1
+        self.ngrams.keep(kept)
+
+        self.contexts = _HashTable(self.contexts.columns)
+        values = self.ngrams.values
+        for slot in self.ngrams.used_slots():
+            count, next_id = values["count"][slot], values["next"][slot]
+            context_slot, _ = self.contexts.insert(values["context"][slot])
+            context_values = self.contexts.values
+            context_values["total"][context_slot] += count
+            if count > context_values["best_count"][context_slot]:
+                context_values["best_count"][context_slot] = count
+                context_values["best_next"][context_slot] = next_id
+
+        self.prunes += 1
+        logger.info(f"Pruned {self.language} n-grams with count < {threshold}: "
+                    f"{len(slots)} -> {self.ngrams.size}")
+
+    def _predict(self, ids, min_length):
+        """Most frequent next token for the longest known context of at least min_length tokens"""
+        values = self.contexts.values
+        for length in range(self.order - 1, min_length - 1, -1):
+            slot = self.contexts.find(_key(tuple(ids[-length:])))
+            if slot >= 0:
+                return values["best_next"][slot], values["best_count"][slot] / values["total"][slot]
+        return None, 0.0
+
+    def complete(self, code, max_tokens=48, min_confidence=0.0):
+        """
+        Continue code greedily
+
+        Stops at the end of a training document, a blank line, a repeating
+        context or max_tokens.
+
+        Args:
+            code (str): Code to continue
+            max_tokens (int): Tokens to generate at most
+            min_confidence (float): Share of the first token among its context's successors
+
+        Returns:
+            str: Continuation (without the input), or None if the model has no
+                 context of at least two tokens for it
+        """
+        with self._lock:
+            ids = [BOS] * (self.order - 1)
+            ids.extend(self._token_id(token, False) for token in tokenize(code))
+
+            generated = []
+            seen = {}
+            for step in range(max_tokens):
+                # The first token needs a context of 2+ tokens, otherwise it is a guess
+                next_id, confidence = self._predict(ids, 2 if step == 0 else 1)
+                if next_id is None or (step == 0 and confidence < min_confidence):
+                    break
+                if next_id in (EOS, UNK, BOS):
+                    break
+                token = self.tokens[next_id]
+                if token.startswith("\n") and generated and generated[-1].startswith("\n"):
+                    break
+                generated.append(token)
+                ids.append(next_id)
+                # Greedy generation loops as soon as the context repeats
+                state = tuple(ids[-(self.order - 1):])
+                if state in seen:
+                    del generated[seen[state] + 1:]
+                    break
+                seen[state] = step
+
+        continuation = "".join(generated).rstrip()
+        return continuation if continuation.strip() else None
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "order": self.order,
+                "vocabulary": len(self.tokens) - _FIRST_TOKEN_ID,
+                "ngrams": self.ngrams.size,
+                "contexts": self.contexts.size,
+                "memory_bytes": self.ngrams.memory_bytes() + self.contexts.memory_bytes(),
+                "trained_tokens": self.trained_tokens,
+                "documents": self.documents,
+                "prunes": self.prunes
+            }
+
+class NGramModelRegistry:
+    """Per-language models trained from the database"""
+
+    def __init__(self, order=4, max_ngrams=500000, min_rating=4):
+        self.order = order
+        self.max_ngrams = max_ngrams
+        self.min_rating = min_rating
+        self.models = {}
+        self.versions = {}
+        self._feedback_watermark = {}
+        self._example_watermark = 0
+        self._lock = threading.Lock()
+        self._build_thread = None
+        self._synced = 0.0
+        self.built = False
+
+    def get(self, language):
+        with self._lock:
+            model = self.models.get(language)
+            if model is None:
+                model = self.models[language] = NGramModel(language, self.order, self.max_ngrams)
+            return model
+
+    def _train(self, language, texts):
+        start_time = time.time()
+        tokens = self.get(language).train(texts)
+        duration = time.time() - start_time
+        if tokens:
+            self.versions[language] = f"{language}-ngram-{datetime.utcnow():%Y%m%d%H%M%S}"
+        return tokens, duration
+
+    def build(self):
+        """Train on CodeExample rows and highly rated completions not trained on yet (needs an app context)"""
+        from models import CodeExample, Feedback
+
+        start_time = time.time()
+        texts = {}
+        for example in CodeExample.query.filter(CodeExample.id > self._example_watermark) \
+                .order_by(CodeExample.id).yield_per(500):
+            texts.setdefault(example.language, []).append(example.code_snippet)
+            self._example_watermark = example.id
+
+        # Languages without a watermark yet need every row
+        languages = set(Config.SUPPORTED_LANGUAGES) | set(self._feedback_watermark)
+        since = min((self._feedback_watermark.get(language, 0) for language in languages), default=0)
+        for feedback in Feedback.query.filter(
+                Feedback.id > since,
+                Feedback.feedback_type == "completion",
+                Feedback.corrected_output.isnot(None),
+                Feedback.rating >= self.min_rating
+        ).order_by(Feedback.id).yield_per(500):
+            if feedback.id > self._feedback_watermark.get(feedback.language, 0):
+                texts.setdefault(feedback.language, []).append(feedback.corrected_output)
+                self._feedback_watermark[feedback.language] = feedback.id
+
+        tokens = sum(self._train(language, samples)[0] for language, samples in texts.items())
+        self.built = True
+        self._synced = time.monotonic()
+        logger.info(f"N-gram models trained on {tokens} tokens for {len(texts)} languages "
+                    f"in {time.time() - start_time:.2f}s")
+
+    def build_in_background(self, app):
+        """
+        Start build() in a thread if no model has been built yet, or if the
+        last sync with the database is older than NGRAM_REFRESH_INTERVAL
+        """
+        with self._lock:
+            stale = time.monotonic() - self._synced > Config.NGRAM_REFRESH_INTERVAL
+            if (self.built and not stale) or (self._build_thread and self._build_thread.is_alive()):
+                return
+            # The next attempt waits a full interval even if this one fails
+            self._synced = time.monotonic()
+
+            def run():
+                try:
+                    with app.app_context():
+                        self.build()
+                except Exception as e:
+                    logger.error(f"Error training n-gram models: {str(e)}")
+
+            self._build_thread = threading.Thread(target=run, name="ngram-build")
+            self._build_thread.daemon = True
+            self._build_thread.start()
+
+    def train_feedback(self, language, feedback_data):
+        """
+        Train a language's model on new feedback items
+
+        Args:
+            language (str): Programming language
+            feedback_data (list): Items from collect_feedback_data; only highly
+                                  rated completions not trained on yet are used
+
+        Returns:
+            dict: Version and training metrics; samples is 0 (and the version
+                  unchanged) when there was nothing new to train on
+        """
+        watermark = self._feedback_watermark.get(language, 0)
+        items = [
+            item for item in feedback_data
+            if item.get("feedback_type") == "completion" and item.get("expected")
+            and (item.get("rating") or 0) >= self.min_rating and item.get("id", 0) > watermark
+        ]
+        if not items:
+            return {"version": self.versions.get(language), "samples": 0, "tokens": 0,
+                    **self.get(language).snapshot()}
+        tokens, duration = self._train(language, [item["expected"] for item in items])
+        self._feedback_watermark[language] = max(item["id"] for item in items)
+
+        return {
+            "version": self.versions.get(language),
+            "samples": len(items),
+            "tokens": tokens,
+            "train_seconds": round(duration, 4),
+            "tokens_per_second": round(tokens / duration) if duration > 0 else None,
+            **self.get(language).snapshot()
+        }
+
+    def complete(self, code, language, max_tokens=None):
+        """
+        Suggest a continuation with the local model
+
+        Returns:
+            str: Code followed by the continuation, or None when the model has none
+        """
+        with self._lock:
+            model = self.models.get(language)
+        if model is None:
+            return None
+        continuation = model.complete(code, max_tokens or Config.NGRAM_MAX_TOKENS, Config.NGRAM_MIN_CONFIDENCE)
+        return code + continuation if continuation else None
+
+    def snapshot(self):
+        with self._lock:
+            models = dict(self.models)
+        return {
+            language: dict(model.snapshot(), version=self.versions.get(language))
+            for language, model in models.items()
+        }
+
+# Process-wide models
+ngram_models = NGramModelRegistry(
+    order=Config.NGRAM_ORDER,
+    max_ngrams=Config.NGRAM_MAX_NGRAMS,
+    min_rating=Config.NGRAM_MIN_RATING
+)
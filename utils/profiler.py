@@ -0,0 +1,303 @@
+"""
+In-process stack sampling for CodevAI
+
+SamplingProfiler samples the stacks of every thread in the worker
+(request threads, the learner and the model update trigger) through
+sys._current_frames and aggregates them as collapsed stacks, the text
+format read by flamegraph.pl, speedscope and inferno.
+
+SlowRequestRecorder samples only the threads of requests that have been
+running for a while and keeps the stacks of those that end up slower than
+the threshold, so stalls can be inspected after the fact.
+
+Both are per process: under gunicorn they see the worker that serves the
+admin request.
+"""
+
+import os
+import sys
+import time
+import logging
+import threading
+from collections import Counter, deque
+from flask import request, g
+from config import Config
+from utils.tracing import current_trace_id
+
+logger = logging.getLogger(__name__)
+
+_frame_labels = {}
+
+def _frame_label(code):
+    label = _frame_labels.get(code)
+    if label is None:
+        label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        label = _frame_labels[code] = label.replace(";", ":")
+    return label
+
+def collapse_stack(frame, root=None):
+    """
+    Turn a frame into a collapsed stack string, outermost frame first
+
+    Args:
+        frame: Innermost frame of a thread
+        root (str): Extra leading element, e.g. the thread name (optional)
+    """
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    if root:
+        labels.append(root.replace(";", ":"))
+    labels.reverse()
+    return ";".join(labels)
+
+def render_collapsed(stacks):
+    """Render a Counter of collapsed stacks, one 'stack count' line each"""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+class SamplingProfiler:
+    """Samples all threads of the process at a fixed interval"""
+
+    def __init__(self, interval=0.01, max_duration=600):
+        self.default_interval = interval
+        self.max_duration = max_duration
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = None
+        self.stopped_at = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration=30, interval=None):
+        """
+        Start sampling, discarding the previous profile
+
+        Args:
+            duration (float): Seconds after which sampling stops by itself
+            interval (float): Seconds between samples (optional)
+
+        Returns:
+            bool: False if the profiler was already running
+        """
+        with self._lock:
+            if self.running:
+                return False
+
+            self.interval = max(0.001, float(interval or self.default_interval))
+            self.stacks = Counter()
+            self.samples = 0
+            self.started_at = time.time()
+            self.stopped_at = None
+            self._stop.clear()
+
+            duration = min(float(duration), self.max_duration)
+            self._thread = threading.Thread(
+                target=self._run, args=(duration,), name="codevai-profiler"
+            )
+            self._thread.daemon = True
+            self._thread.start()
+
+        logger.info(f"Profiler started for {duration:.0f}s at {self.interval * 1000:.1f}ms intervals")
+        return True
+
+    def stop(self):
+        """Stop sampling; the collected profile is kept"""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=5)
+
+    def _run(self, duration):
+        deadline = time.monotonic() + duration
+        own_ident = threading.get_ident()
+        names = {}
+
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            frames = sys._current_frames()
+            if not names.keys() >= frames.keys():
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+            sampled = [
+                collapse_stack(frame, names.get(ident, f"thread-{ident}"))
+                for ident, frame in frames.items() if ident != own_ident
+            ]
+            with self._lock:
+                self.stacks.update(sampled)
+                self.samples += 1
+
+        self.stopped_at = time.time()
+        logger.info(f"Profiler stopped after {self.samples} samples")
+
+    def status(self):
+        with self._lock:
+            return {
+                "running": self.running,
+                "pid": os.getpid(),
+                "interval_ms": round(self.interval * 1000, 3),
+                "samples": self.samples,
+                "unique_stacks": len(self.stacks),
+                "started_at": self.started_at,
+                "stopped_at": self.stopped_at
+            }
+
+    def collapsed(self):
+        with self._lock:
+            return render_collapsed(self.stacks)
+
+class SlowRequestRecorder:
+    """
+    Captures stack samples of requests slower than a threshold
+
+    A watchdog thread starts sampling a request's thread once it has run
+    for half the threshold; requests that finish faster cost one dict
+    insert and delete. While no request is in flight the watchdog blocks,
+    and while none is old enough to sample it sleeps until the oldest one
+    will be.
+    """
+
+    def __init__(self, threshold=2.0, interval=0.01, max_records=50):
+        self.threshold = threshold
+        self.interval = interval
+        self.records = deque(maxlen=max_records)
+        self._active = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(threading.Lock())
+        self._thread = None
+        self._thread_pid = None
+
+    @property
+    def enabled(self):
+        return self.threshold > 0
+
+    def _ensure_watchdog(self):
+        # Threads don't survive fork, so the watchdog is started again in each worker
+        if self._thread_pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid() and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="codevai-slow-requests")
+            self._thread.daemon = True
+            self._thread.start()
+            self._thread_pid = os.getpid()
+
+    def begin(self, method, path):
+        """Register the current thread as serving a request"""
+        self._ensure_watchdog()
+        entry = {
+            "method": method,
+            "path": path,
+            "start": time.monotonic(),
+            "started_at": time.time(),
+            "stacks": Counter(),
+            "samples": 0
+        }
+        with self._wakeup:
+            self._active[threading.get_ident()] = entry
+            self._wakeup.notify()
+        return entry
+
+    def end(self, entry, status=None, endpoint=None, trace_id=None):
+        """Unregister the request and keep its samples if it was slow"""
+        self._active.pop(threading.get_ident(), None)
+        duration = time.monotonic() - entry["start"]
+        if duration < self.threshold:
+            return None
+
+        with self._lock:
+            record = {
+                "id": self._next_id,
+                "method": entry["method"],
+                "path": entry["path"],
+                "endpoint": endpoint,
+                "status": status,
+                "duration_ms": round(duration * 1000, 1),
+                "started_at": entry["started_at"],
+                "trace_id": trace_id,
+                "samples": entry["samples"],
+                "stacks": entry["stacks"]
+            }
+            self._next_id += 1
+            self.records.append(record)
+
+        logger.warning(f"Slow request {entry['method']} {entry['path']} took {duration:.2f}s "
+                       f"({entry['samples']} stack samples, record {record['id']})")
+        return record
+
+    def _run(self):
+        sample_after = self.threshold / 2
+        while True:
+            with self._wakeup:
+                while not self._active:
+                    self._wakeup.wait()
+                # end() removes entries without the lock, so the dict may have emptied meanwhile
+                oldest = min((entry["start"] for entry in list(self._active.values())), default=None)
+            if oldest is None:
+                continue
+            wait = oldest + sample_after - time.monotonic()
+            time.sleep(max(wait, self.interval))
+
+            now = time.monotonic()
+            due = [(ident, entry) for ident, entry in list(self._active.items())
+                   if now - entry["start"] >= sample_after]
+            if not due:
+                continue
+
+            frames = sys._current_frames()
+            for ident, entry in due:
+                frame = frames.get(ident)
+                if frame is not None:
+                    entry["stacks"][collapse_stack(frame)] += 1
+                    entry["samples"] += 1
+
+    def list_records(self):
+        with self._lock:
+            return [
+                {key: value for key, value in record.items() if key != "stacks"}
+                for record in reversed(self.records)
+            ]
+
+    def get_record(self, record_id):
+        with self._lock:
+            return next((record for record in self.records if record["id"] == record_id), None)
+
+# Process-wide instances
+profiler = SamplingProfiler(interval=Config.PROFILER_INTERVAL)
+slow_requests = SlowRequestRecorder(
+    threshold=Config.SLOW_REQUEST_THRESHOLD, interval=Config.PROFILER_INTERVAL
+)
+
+def init_app(app):
+    """Record stack samples of slow requests of an application"""
+    if not slow_requests.enabled:
+        return
+
+    @app.before_request
+    def _begin_slow_request_capture():
+        g.slow_request = slow_requests.begin(request.method, request.path)
+
+    @app.after_request
+    def _remember_response(response):
+        g.slow_request_status = response.status_code
+        g.slow_request_trace_id = current_trace_id()
+        return response
+
+    @app.teardown_request
+    def _end_slow_request_capture(exc):
+        entry = g.pop("slow_request", None)
+        if entry is None:
+            return
+        slow_requests.end(
+            entry,
+            status=g.pop("slow_request_status", 500 if exc else None),
+            endpoint=request.endpoint,
+            trace_id=g.pop("slow_request_trace_id", None)
+        )
@@ -0,0 +1,314 @@
+"""
+Local syntax checks that run before the model
+
+Python code is compiled with the built-in parser, which reports the exact
+line and column of the first syntax error. For the brace languages a small
+scanner skips comments, string and character literals and balances
+brackets, reporting the first unterminated literal or unclosed, unmatched or
+mismatched bracket.
+
+The scanner does not parse the language, so it only reports errors it is
+sure about. Code it cannot judge (JSX markup, whose text may contain quotes
+and brackets) is left to the model, and so are errors on a JavaScript line
+where a '/' could be either a division or a regex literal.
+"""
+
+import re
+import ast
+import bisect
+from utils.metrics import local_syntax_checks
+
+# Error check modes: 'semantic' returns syntax errors found locally at once and
+# asks the model only for logic and style issues of code that compiles;
+# 'local' never calls the model; 'llm' skips the local check
+CHECK_MODES = ("semantic", "local", "llm")
+
+CLOSERS = {")": "(", "]": "[", "}": "{"}
+
+_INTERESTING = re.compile(r"[\"'`/(){}\[\]#]")
+_JSX_MARKUP = re.compile(r"</[A-Za-z][\w.]*\s*>|<[A-Za-z][\w.]*[^<>;]*/>")
+_CPP_RAW_PREFIX = re.compile(r"(?:^|[^\w])(?:u8|[uUL])?R$")
+_REGEX_KEYWORDS = ("return", "typeof", "case", "do", "else", "in", "of", "new",
+                   "delete", "void", "throw", "yield", "await")
+# A statement body may start with a regex right after these headers' ')'
+_HEADER_KEYWORDS = ("if", "while", "for", "with")
+
+def _error(code, newlines, pos, message, kind="SyntaxError"):
+    line = bisect.bisect_left(newlines, pos) + 1
+    line_start = newlines[line - 2] + 1 if line > 1 else 0
+    return {
+        "line": line,
+        "column": pos - line_start + 1,
+        "description": f"{kind}: {message}",
+        "severity": "error",
+        "source": "local"
+    }
+
+def _check_python(code):
+    try:
+        compile(code, "<code>", "exec", ast.PyCF_ONLY_AST, dont_inherit=True)
+    except SyntaxError as e:
+        # IndentationError and TabError are subclasses of SyntaxError
+        return [{
+            "line": e.lineno or 1,
+            "column": e.offset or 1,
+            "description": f"{type(e).__name__}: {e.msg}",
+            "severity": "error",
+            "source": "local"
+        }]
+    except (ValueError, RecursionError, MemoryError):
+        # Null bytes or nesting too deep - leave it to the model
+        return None
+    return []
+
+def _keyword_before(code, index):
+    """The identifier ending right before index (spaces skipped), or ''"""
+    word = re.search(r"(?<![\w$])[A-Za-z_$][\w$]*\s*$", code[max(0, index - 20):index])
+    return word.group().strip() if word else ""
+
+def _regex_allowed(code, index, headers=()):
+    """
+    Whether a '/' at index starts a JavaScript regex literal rather than a division
+
+    After an operand (a name, a number, ']', or a postfix ++/--) a '/'
+    divides. After a ')' it starts a regex when the ')' closes an
+    if/while/for/with header (its position is in headers); after any other
+    ')' it is most likely a division, but None is returned because the
+    scanner cannot be sure:
+
+    >>> _regex_allowed("x = i-- / 2", 8)
+    False
+    >>> _regex_allowed("n = a[i]++ / 2", 11)
+    False
+    >>> _regex_allowed("if (/^a/.test(s))", 4)
+    True
+    >>> _regex_allowed("x = y + /b/.source", 8)
+    True
+    >>> _regex_allowed("if (x) /a(/.test(s);", 7, headers={5})
+    True
+    >>> _regex_allowed("y = (a + b) / 2", 12) is None
+    True
+    >>> check_syntax("x = i-- / 2; // }\\n", "javascript")
+    []
+    >>> check_syntax("x = (a[0]++) / 2; // )\\n", "javascript")
+    []
+    >>> check_syntax("if (x) /a(/.test(s);\\nwhile (ok) /[}]/.exec(s);\\n", "javascript")
+    []
+    >>> check_syntax("y = f(x) / 2; g(\\n", "javascript") is None
+    True
+    """
+    j = index - 1
+    while j >= 0 and code[j] in " \t\r\n":
+        j -= 1
+    if j > 0 and code[j] in "+-" and code[j - 1] == code[j]:
+        # Postfix ++ and -- end an operand
+        return False
+    if j < 0 or code[j] in "(,=:[!&|?{};+-*%<>~^":
+        return True
+    if code[j] == ")":
+        return True if j in headers else None
+    word = re.search(r"[A-Za-z_$]+$", code[max(0, j - 10):j + 1])
+    return word is not None and word.group() in _REGEX_KEYWORDS
+
+def _skip_regex(code, index):
+    """End of a regex literal starting at index, or None if the line has no closing '/'"""
+    in_class = False
+    k = index + 1
+    while k < len(code):
+        char = code[k]
+        if char == "\\":
+            k += 2
+            continue
+        if char == "\n":
+            return None
+        if char == "[":
+            in_class = True
+        elif char == "]":
+            in_class = False
+        elif char == "/" and not in_class:
+            return k + 1
+        k += 1
+    return None
+
+def _skip_quoted(code, index, quote):
+    """End of a single-line literal starting at index, or None if it is unterminated"""
+    k = index + 1
+    while k < len(code):
+        char = code[k]
+        if char == "\\":
+            k += 2
+            continue
+        if char == quote:
+            return k + 1
+        if char == "\n":
+            return None
+        k += 1
+    return None
+
+def _skip_template(code, index):
+    """End of a JavaScript template literal starting at index (with ${} nesting), or None"""
+    depth = 0
+    k = index + 1
+    while k < len(code):
+        char = code[k]
+        if char == "\\":
+            k += 2
+            continue
+        if depth == 0:
+            if char == "`":
+                return k + 1
+            if code.startswith("${", k):
+                depth = 1
+                k += 2
+                continue
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+        elif char == "`":
+            end = _skip_template(code, k)
+            if end is None:
+                return None
+            k = end
+            continue
+        k += 1
+    return None
+
+def _digit_separator(code, index):
+    """Whether a quote at index is a C++14 digit separator (1'000'000)"""
+    j = index - 1
+    while j >= 0 and (code[j].isalnum() or code[j] in "_'"):
+        j -= 1
+    return j + 1 < index and code[j + 1].isdigit()
+
+def _check_brace_language(code, language):
+    if language == "javascript" and _JSX_MARKUP.search(code):
+        return None
+
+    newlines = [m.start() for m in re.finditer("\n", code)]
+    stack = []
+    pos = 0
+    headers = set()         # positions of ')' that close an if/while/for/with header
+    uncertain_lines = set() # lines with a '/' read as division without being sure
+
+    def report(message, *positions):
+        lines = {bisect.bisect_left(newlines, at) + 1 for at in positions}
+        if lines & uncertain_lines:
+            return None
+        return [_error(code, newlines, positions[0], message)]
+
+    while True:
+        match = _INTERESTING.search(code, pos)
+        if match is None:
+            break
+        i = match.start()
+        char = code[i]
+        pos = i + 1
+
+        if char == "/":
+            if code.startswith("//", i):
+                end = code.find("\n", i)
+                pos = len(code) if end < 0 else end
+            elif code.startswith("/*", i):
+                end = code.find("*/", i + 2)
+                if end < 0:
+                    return report("unterminated comment", i)
+                pos = end + 2
+            elif language == "javascript":
+                allowed = _regex_allowed(code, i, headers)
+                if allowed:
+                    pos = _skip_regex(code, i) or pos
+                elif allowed is None:
+                    uncertain_lines.add(bisect.bisect_left(newlines, i) + 1)
+
+        elif char in "([{":
+            stack.append((char, i))
+
+        elif char in ")]}":
+            if not stack:
+                return report(f"unmatched '{char}'", i)
+            opener, opened_at = stack.pop()
+            if opener != CLOSERS[char]:
+                line = bisect.bisect_left(newlines, opened_at) + 1
+                return report(f"'{char}' does not match '{opener}' opened on line {line}", i, opened_at)
+            if char == ")" and _keyword_before(code, opened_at) in _HEADER_KEYWORDS:
+                headers.add(i)
+
+        elif char == "#":
+            # C++ preprocessor directives (with backslash line continuations)
+            line_start = code.rfind("\n", 0, i) + 1
+            if language == "cpp" and not code[line_start:i].strip():
+                end = i
+                while True:
+                    end = code.find("\n", end)
+                    if end < 0 or code[end - 1] != "\\":
+                        break
+                    end += 1
+                pos = len(code) if end < 0 else end
+
+        elif char == "`":
+            if language == "javascript":
+                end = _skip_template(code, i)
+            elif language == "go":
+                end = code.find("`", i + 1)
+                end = None if end < 0 else end + 1
+            else:
+                continue
+            if end is None:
+                return report("unterminated template or raw string literal", i)
+            pos = end
+
+        elif char == '"' and language == "java" and code.startswith('"""', i):
+            end = code.find('"""', i + 3)
+            if end < 0:
+                return report("unterminated text block", i)
+            pos = end + 3
+
+        elif char == '"' and language == "cpp" and _CPP_RAW_PREFIX.search(code[max(0, i - 3):i]):
+            delimiter = re.match(r'"([^()\\\s]{0,16})\(', code[i:])
+            if delimiter is None:
+                return report("invalid raw string delimiter", i)
+            end = code.find(")" + delimiter.group(1) + '"', i)
+            if end < 0:
+                return report("unterminated raw string literal", i)
+            pos = end + len(delimiter.group(1)) + 2
+
+        else:
+            if char == "'" and language == "cpp" and _digit_separator(code, i):
+                continue
+            end = _skip_quoted(code, i, char)
+            if end is None:
+                kind = "string" if char == '"' or language == "javascript" else "character"
+                return report(f"unterminated {kind} literal", i)
+            pos = end
+
+    if stack:
+        # The innermost unclosed bracket is usually the closest to the error
+        opener, opened_at = stack[-1]
+        return report(f"'{opener}' is never closed", opened_at)
+    return []
+
+def check_syntax(code, language):
+    """
+    Check code for syntax errors without calling the model
+
+    Args:
+        code (str): Source code
+        language (str): Programming language
+
+    Returns:
+        list: The first syntax error found (empty if none, with line, column,
+              description and severity like model-reported errors), or None
+              when the language has no local checker or the code cannot be
+              judged locally
+    """
+    if language == "python":
+        errors = _check_python(code)
+    elif language in ("javascript", "java", "cpp", "go"):
+        errors = _check_brace_language(code, language)
+    else:
+        errors = None
+
+    result = "inconclusive" if errors is None else ("errors" if errors else "clean")
+    local_syntax_checks.inc(language=language, result=result)
+    return errors
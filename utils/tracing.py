@@ -0,0 +1,348 @@
+"""
+Lightweight request tracing for CodevAI
+
+Requests are sampled at TRACE_SAMPLE_RATE. A sampled request gets a trace
+id (continued from a well-formed W3C traceparent or X-Trace-Id header when
+present; clients cannot force sampling) and nested spans for the view function,
+gateway calls, web fetches, extraction and knowledge-base writes. Finished
+traces are appended to a local file, either one JSON object per span
+(TRACE_EXPORT_FORMAT=jsonl) or one OTLP/JSON ExportTraceServiceRequest per
+trace (TRACE_EXPORT_FORMAT=otlp). Once the file reaches
+TRACE_EXPORT_MAX_BYTES it is rotated to <path>.1, replacing the previous one.
+
+Unsampled requests only pay for a context variable lookup per span.
+"""
+
+import os
+import re
+import json
+import time
+import random
+import logging
+import threading
+import contextvars
+from functools import wraps
+from flask import request, g
+
+logger = logging.getLogger(__name__)
+
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", 0.0))
+TRACE_EXPORT_PATH = os.environ.get("TRACE_EXPORT_PATH", "instance/traces.jsonl")
+TRACE_EXPORT_FORMAT = os.environ.get("TRACE_EXPORT_FORMAT", "jsonl")
+TRACE_EXPORT_MAX_BYTES = int(os.environ.get("TRACE_EXPORT_MAX_BYTES", 50 * 1024 * 1024))
+
+_TRACE_ID = re.compile(r"^[0-9a-f]{32}$")
+_SPAN_ID = re.compile(r"^[0-9a-f]{16}$")
+
+_current_span = contextvars.ContextVar("codevai_current_span", default=None)
+
+def _new_id(bits):
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+class _Trace:
+    __slots__ = ("trace_id", "spans", "lock")
+
+    def __init__(self, trace_id):
+        self.trace_id = trace_id
+        self.spans = []
+        self.lock = threading.Lock()
+
+class Span:
+    """A timed operation inside a trace"""
+    __slots__ = ("trace", "span_id", "parent_id", "name", "attributes",
+                 "start_ns", "end_ns", "status", "thread", "_token")
+
+    def __init__(self, trace, name, parent_id=None, attributes=None):
+        self.trace = trace
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.status = "ok"
+        self.thread = threading.current_thread().name
+        self._token = None
+
+    @property
+    def trace_id(self):
+        return self.trace.trace_id
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.time_ns()
+        if exc_type is not None:
+            self.status = "error"
+            self.attributes["error"] = f"{exc_type.__name__}: {exc}"
+        if self._token is not None:
+            _current_span.reset(self._token)
+        with self.trace.lock:
+            self.trace.spans.append(self)
+        return False
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time": self.start_ns / 1e9,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "thread": self.thread,
+            "attributes": self.attributes
+        }
+
+class _NoopSpan:
+    """Returned when the current trace is not sampled"""
+    __slots__ = ()
+    trace_id = None
+
+    def set_attribute(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+NOOP_SPAN = _NoopSpan()
+
+class _RootSpan(Span):
+    """Span that starts a trace and exports it when it ends"""
+    __slots__ = ()
+
+    def __exit__(self, exc_type, exc, tb):
+        super().__exit__(exc_type, exc, tb)
+        exporter.export(self.trace)
+        return False
+
+class FileExporter:
+    """Appends finished traces to a local file"""
+
+    def __init__(self, path, export_format="jsonl", max_bytes=TRACE_EXPORT_MAX_BYTES):
+        self.path = path
+        self.format = export_format
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _rotate(self):
+        """Move a full export file aside, keeping one previous file"""
+        try:
+            if os.path.getsize(self.path) >= self.max_bytes:
+                os.replace(self.path, self.path + ".1")
+        except FileNotFoundError:
+            pass
+
+    def export(self, trace):
+        with trace.lock:
+            spans = list(trace.spans)
+        if not spans:
+            return
+
+        if self.format == "otlp":
+            lines = [json.dumps(self._to_otlp(trace.trace_id, spans))]
+        else:
+            lines = [json.dumps(span.to_dict(), default=str) for span in spans]
+
+        try:
+            with self._lock:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                if self.max_bytes:
+                    self._rotate()
+                with open(self.path, "a") as f:
+                    f.write("\n".join(lines) + "\n")
+        except Exception as e:
+            logger.debug(f"Error exporting trace {trace.trace_id}: {str(e)}")
+
+    @staticmethod
+    def _otlp_value(value):
+        if isinstance(value, bool):
+            return {"boolValue": value}
+        if isinstance(value, int):
+            return {"intValue": str(value)}
+        if isinstance(value, float):
+            return {"doubleValue": value}
+        return {"stringValue": str(value)}
+
+    def _to_otlp(self, trace_id, spans):
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "codevai"}}]},
+                "scopeSpans": [{
+                    "scope": {"name": "codevai.tracing"},
+                    "spans": [{
+                        "traceId": trace_id,
+                        "spanId": span.span_id,
+                        "parentSpanId": span.parent_id or "",
+                        "name": span.name,
+                        "kind": 2 if isinstance(span, _RootSpan) else 1,
+                        "startTimeUnixNano": str(span.start_ns),
+                        "endTimeUnixNano": str(span.end_ns),
+                        "attributes": [
+                            {"key": key, "value": self._otlp_value(value)}
+                            for key, value in span.attributes.items()
+                        ],
+                        "status": {"code": 2 if span.status == "error" else 1}
+                    } for span in spans]
+                }]
+            }]
+        }
+
+exporter = FileExporter(TRACE_EXPORT_PATH, TRACE_EXPORT_FORMAT)
+
+def current_span():
+    """Return the active span, or None outside a sampled trace"""
+    return _current_span.get()
+
+def current_trace_id():
+    active = _current_span.get()
+    return active.trace_id if active else None
+
+def span(name, **attributes):
+    """
+    Start a child span of the active span
+
+    Returns a no-op span when there is no sampled trace, so instrumented
+    code costs almost nothing with sampling turned down.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return NOOP_SPAN
+    return Span(parent.trace, name, parent.span_id, attributes)
+
+def start_trace(name, trace_id=None, parent_id=None, sampled=None, **attributes):
+    """
+    Start a new trace, unless one is already active (then a child span)
+
+    Args:
+        name (str): Root span name
+        trace_id (str): Trace id to continue (optional)
+        parent_id (str): Remote parent span id (optional)
+        sampled (bool): Force the sampling decision (default: TRACE_SAMPLE_RATE)
+    """
+    if _current_span.get() is not None:
+        return span(name, **attributes)
+
+    if sampled is None:
+        sampled = TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE
+    if not sampled:
+        return NOOP_SPAN
+
+    return _RootSpan(_Trace(trace_id or _new_id(128)), name, parent_id, attributes)
+
+def traced(name=None):
+    """Decorator that runs a function inside a span"""
+    def decorator(function):
+        span_name = name or f"{function.__module__}.{function.__qualname__}"
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _stream_in_span(iterable, root):
+    """
+    Iterate a streamed response body inside the request's root span
+
+    The body is read after the request context is torn down, so each chunk
+    is produced with the root span current again, and the trace ends when
+    the body is exhausted or closed.
+    """
+    iterator = iter(iterable)
+    error = None
+    try:
+        while True:
+            token = _current_span.set(root)
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                _current_span.reset(token)
+            yield chunk
+    except GeneratorExit:
+        # The client closed the response early; that is not a server error
+        root.set_attribute("http.client_closed", True)
+        raise
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        if hasattr(iterable, "close"):
+            iterable.close()
+        root.__exit__(type(error) if error else None, error, None)
+
+def _valid_trace_id(value):
+    return bool(value) and _TRACE_ID.match(value) is not None and value != "0" * 32
+
+def _parse_traceparent(header):
+    """Parse a W3C traceparent header into (trace_id, parent_id), or (None, None) when malformed"""
+    parts = header.split("-") if header else []
+    if (len(parts) != 4 or parts[0] == "ff" or not _valid_trace_id(parts[1])
+            or not _SPAN_ID.match(parts[2]) or parts[2] == "0" * 16):
+        return None, None
+    return parts[1], parts[2]
+
+def init_app(app):
+    """
+    Trace every request of an application
+
+    Call after all blueprints are registered so view functions can be
+    wrapped in handler spans.
+    """
+    for endpoint, view in list(app.view_functions.items()):
+        if endpoint != "static":
+            app.view_functions[endpoint] = traced(f"handler {endpoint}")(view)
+
+    @app.before_request
+    def _start_request_trace():
+        trace_id, parent_id = _parse_traceparent(request.headers.get("traceparent"))
+        if trace_id is None:
+            candidate = request.headers.get("X-Trace-Id", "").lower()
+            trace_id = candidate if _valid_trace_id(candidate) else None
+
+        # Sampling stays with TRACE_SAMPLE_RATE: a header only names the trace
+        root = start_trace(
+            f"{request.method} {request.url_rule.rule if request.url_rule else request.path}",
+            trace_id=trace_id,
+            parent_id=parent_id,
+            **{"http.method": request.method, "http.target": request.path}
+        )
+        if root is not NOOP_SPAN:
+            g.trace_root = root.__enter__()
+
+    @app.after_request
+    def _add_trace_header(response):
+        root = g.get("trace_root")
+        if root is not None:
+            root.set_attribute("http.status_code", response.status_code)
+            response.headers["X-Trace-Id"] = root.trace_id
+            if response.is_streamed:
+                # The trace ends with the body, not with the view function
+                g.trace_streamed = True
+                response.response = _stream_in_span(response.response, root)
+        return response
+
+    @app.teardown_request
+    def _end_request_trace(exc):
+        root = g.pop("trace_root", None)
+        if root is None:
+            return
+        if g.pop("trace_streamed", False):
+            # Leave the span open for the body; only restore this context
+            _current_span.reset(root._token)
+            root._token = None
+            return
+        root.__exit__(type(exc) if exc else None, exc, None)
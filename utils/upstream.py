@@ -0,0 +1,279 @@
+"""
+Shared retry and concurrency control for Workers AI calls
+
+All upstream calls of a process (API requests and the learner's extraction
+calls) draw slots from one adaptive concurrency limit. The limit grows by
+about one slot per limit's worth of successful calls (additive increase) and
+halves on HTTP 429 (multiplicative decrease), so the process backs off as
+soon as Workers AI pushes back instead of adding to the burst.
+
+Throttled (429), failed (5xx) and unreachable calls are retried with
+exponential backoff and full jitter, waiting at least Retry-After when
+upstream sends one. Timeouts are not retried, since that would only double
+the wait. Inference calls have no side effects, so retrying them is safe.
+
+Under gunicorn every worker has its own limit. A streamed response holds
+its slot until it is closed, not just until its headers arrive.
+
+A caller can run its calls inside cancel_scope(event): once the event is set
+(for example when an editor request is superseded by a newer one), no new
+attempt or retry is started, backoff pauses end early and streamed
+responses are closed between chunks.
+
+Attempts and queue waits are also cut to the request deadline
+(utils/deadline.py); a call that runs out of budget raises DeadlineExceeded
+and does not count against the model's health.
+"""
+
+import time
+import random
+import logging
+import threading
+import contextvars
+import requests
+from contextlib import contextmanager
+from config import Config
+from utils.metrics import record_upstream_call, upstream_retries, upstream_concurrency
+from utils.deadline import DeadlineExceeded, allows, mark_exceeded, timeout_for, trimmed
+
+logger = logging.getLogger(__name__)
+
+class UpstreamBusyError(RuntimeError):
+    """Raised when no upstream slot frees up within the queue timeout"""
+
+class UpstreamCancelledError(RuntimeError):
+    """Raised when the caller cancelled its request before upstream answered"""
+
+# Cancel event of the current request; copied into thread pools along with the context
+_cancel_event = contextvars.ContextVar("upstream_cancel_event", default=None)
+
+@contextmanager
+def cancel_scope(event):
+    """
+    Cancel upstream calls made in this context once event is set
+
+    Args:
+        event (threading.Event): Set by whoever cancels the request
+    """
+    token = _cancel_event.set(event)
+    try:
+        yield event
+    finally:
+        _cancel_event.reset(token)
+
+def check_cancelled():
+    """Raise UpstreamCancelledError if the current request was cancelled"""
+    event = _cancel_event.get()
+    if event is not None and event.is_set():
+        raise UpstreamCancelledError("Request cancelled by the caller")
+
+def _pause(delay):
+    """Sleep before a retry, waking up early on cancellation"""
+    event = _cancel_event.get()
+    if event is None:
+        time.sleep(delay)
+    else:
+        event.wait(delay)
+    check_cancelled()
+
+class AdaptiveConcurrencyLimit:
+    """AIMD limit on concurrent upstream calls"""
+
+    def __init__(self, initial=8, minimum=1, maximum=64, backoff=0.5, decrease_interval=1.0):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.decrease_interval = decrease_interval
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self, timeout=None):
+        """
+        Wait for a free slot
+
+        Args:
+            timeout (float): Seconds to wait at most (optional)
+
+        Returns:
+            bool: False if no slot freed up in time
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            self.in_flight += 1
+            return True
+
+    def release(self, outcome):
+        """
+        Return a slot and adapt the limit
+
+        Args:
+            outcome (str): 'success', 'throttled' or anything else (no change)
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if outcome == "success":
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            elif outcome == "throttled":
+                # Simultaneous 429s from one burst lower the limit only once
+                now = time.monotonic()
+                if now - self._last_decrease >= self.decrease_interval:
+                    self.limit = max(self.minimum, self.limit * self.backoff)
+                    self._last_decrease = now
+                    logger.warning(f"Upstream throttled, concurrency limit lowered to {int(self.limit)}")
+            self._condition.notify_all()
+
+    def snapshot(self):
+        with self._condition:
+            return {"limit": int(self.limit), "in_flight": self.in_flight}
+
+# Process-wide limit shared by every upstream caller
+upstream_limit = AdaptiveConcurrencyLimit(
+    initial=Config.UPSTREAM_CONCURRENCY_INITIAL,
+    maximum=Config.UPSTREAM_CONCURRENCY_MAX
+)
+
+upstream_concurrency.set_function(lambda: {
+    ("limit",): upstream_limit.snapshot()["limit"],
+    ("in_flight",): upstream_limit.snapshot()["in_flight"]
+})
+
+def _retry_after(response):
+    """Retry-After in seconds, or None (HTTP-date values are ignored)"""
+    try:
+        return max(0.0, float(response.headers.get("Retry-After")))
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Delay before the next attempt: full jitter, but at least Retry-After
+
+    Args:
+        attempt (int): Number of the attempt that just failed (0-based)
+        retry_after (float): Seconds requested by upstream (optional)
+    """
+    delay = random.uniform(0, min(Config.UPSTREAM_BACKOFF_MAX, Config.UPSTREAM_BACKOFF_BASE * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+def _release_on_close(response, outcome):
+    """Keep the slot of a streamed response until its body is closed"""
+    close = response.close
+    once = threading.Lock()
+
+    def close_and_release():
+        try:
+            close()
+        finally:
+            if once.acquire(blocking=False):
+                upstream_limit.release(outcome)
+
+    response.close = close_and_release
+
+def post_with_retries(model_key, url, max_retries=None, **kwargs):
+    """
+    POST to Workers AI within the shared concurrency limit, retrying transient failures
+
+    Every attempt that does not end in HTTP 200 is recorded in the upstream
+    metrics here; the caller records a 200 response (with its token usage).
+
+    Args:
+        model_key (str): Model key for metrics and logs
+        url (str): Model URL
+        max_retries (int): Retries after the first attempt (default: UPSTREAM_MAX_RETRIES)
+        **kwargs: Passed to requests.post; a file-like data body with seek() is
+                  rewound before every attempt
+
+    Returns:
+        tuple: (response, duration of the last attempt in seconds). A
+               successful streamed response (stream=True) keeps its slot
+               until response.close(), so the caller must close it.
+
+    Raises:
+        requests.RequestException: When the last attempt raised
+        UpstreamBusyError: When no slot freed up in time
+        UpstreamCancelledError: When the request was cancelled before an attempt
+        DeadlineExceeded: When the request deadline ran out before upstream answered
+    """
+    max_retries = Config.UPSTREAM_MAX_RETRIES if max_retries is None else max_retries
+    request_timeout = kwargs.pop("timeout", None)
+    attempt = 0
+
+    while True:
+        check_cancelled()
+        queue_timeout = timeout_for("upstream_queue", Config.UPSTREAM_QUEUE_TIMEOUT)
+        if not upstream_limit.acquire(queue_timeout):
+            if trimmed(Config.UPSTREAM_QUEUE_TIMEOUT, queue_timeout):
+                mark_exceeded("upstream_queue")
+                raise DeadlineExceeded(f"Request deadline exceeded waiting for an upstream slot for {model_key}")
+            raise UpstreamBusyError(f"No upstream slot free within {queue_timeout}s "
+                                    f"({upstream_limit.in_flight} in flight)")
+        outcome = None
+        held = False
+        try:
+            timeout = timeout_for("upstream", request_timeout)
+            if hasattr(kwargs.get("data"), "seek"):
+                kwargs["data"].seek(0)
+            start_time = time.time()
+            try:
+                response = requests.post(url, timeout=timeout, **kwargs)
+            except requests.RequestException as e:
+                duration = time.time() - start_time
+                if isinstance(e, requests.Timeout) and trimmed(request_timeout, timeout):
+                    # Not the model's fault: the request ran out of time
+                    record_upstream_call(model_key, "DeadlineExceeded", duration)
+                    mark_exceeded("upstream")
+                    raise DeadlineExceeded(f"Request deadline exceeded waiting for {model_key}") from e
+                record_upstream_call(model_key, type(e).__name__, duration)
+                outcome = "error"
+                if isinstance(e, requests.Timeout) or attempt >= max_retries:
+                    raise
+                reason, delay = type(e).__name__, backoff_delay(attempt)
+                if not allows(delay):
+                    mark_exceeded("upstream_retry")
+                    raise
+            else:
+                duration = time.time() - start_time
+                status = response.status_code
+                if status == 429:
+                    outcome = "throttled"
+                elif status < 500:
+                    outcome = "success"
+                else:
+                    outcome = "error"
+
+                if status != 200:
+                    record_upstream_call(model_key, status, duration)
+                if status != 429 and status < 500:
+                    if status == 200 and kwargs.get("stream"):
+                        # The body is still being generated: it counts against the limit until closed
+                        _release_on_close(response, outcome)
+                        held = True
+                    return response, duration
+
+                retry_after = _retry_after(response) if status == 429 else None
+                if attempt >= max_retries or (
+                        retry_after is not None and retry_after > Config.UPSTREAM_MAX_RETRY_AFTER):
+                    return response, duration
+                reason, delay = str(status), backoff_delay(attempt, retry_after)
+                if not allows(delay):
+                    # A retry would not finish before the deadline - same as running out of attempts
+                    mark_exceeded("upstream_retry")
+                    return response, duration
+        finally:
+            if not held:
+                upstream_limit.release(outcome)
+
+        # Wait outside the slot so it isn't held during the pause
+        upstream_retries.inc(model=model_key, reason=reason)
+        logger.info(f"Retrying {model_key} after {reason} in {delay:.2f}s (attempt {attempt + 2})")
+        _pause(delay)
+        attempt += 1
@@ -6,9 +6,8 @@ from web pages for the CodevAI AI learning system.
 """
 
 import logging
-import trafilatura
 from brain.continuous_learning import add_url_to_queue, process_url
-from brain.web_access import is_valid_url
+from brain.web_access import is_valid_url, get_webpage_content
 
 logger = logging.getLogger(__name__)
 
@@ -26,23 +25,16 @@ def get_website_text_content(url: str) -> str:
         logger.error(f"Invalid URL: {url}")
         return "Error: Invalid URL"
     
-    try:
-        # Send request to the website
-        downloaded = trafilatura.fetch_url(url)
-        if not downloaded:
-            logger.error(f"Failed to load page: {url}")
-            return "Error: Failed to load page"
-        
-        # Extract text content
-        text = trafilatura.extract(downloaded)
-        
-        # Add URL to learning queue
-        add_url_to_queue(url)
-        
-        return text if text else "Failed to extract content"
-    except Exception as e:
-        logger.error(f"Error getting web page content {url}: {str(e)}")
-        return f"Error processing URL: {str(e)}"
+    # Downloads and extracts within WEB_FETCH_TIMEOUT and the request deadline
+    text = get_webpage_content(url)
+    if text is None:
+        logger.error(f"Failed to load page: {url}")
+        return "Error: Failed to load page"
+    
+    # Add URL to learning queue
+    add_url_to_queue(url)
+    
+    return text
 
 def enqueue_url_for_learning(url: str) -> bool:
     """
@@ -0,0 +1,11 @@
+"""
+Production WSGI entry point, used by gunicorn.conf.py
+
+The app and its read-mostly data are loaded once in the gunicorn master.
+Background services are started after fork by the config hooks, never here.
+"""
+
+from app import create_app, preload_shared_data
+
+app = create_app()
+preload_shared_data(app)